@@ -0,0 +1,375 @@
+"""Consulta del log de auditoría: filtros en SQL, búsqueda FTS5 y paginación.
+
+Las páginas se recorren por clave (created_at, id) en lugar de OFFSET: cada
+página cuesta lo mismo aunque esté a un año de distancia, y las filas nuevas
+que llegan mientras se navega no desplazan las ya vistas.
+
+Con texto de búsqueda el recorrido lo guía el índice FTS5 en orden de id
+descendente y se detiene al llenar la página. Como created_at toma la hora
+de inserción, el orden por id coincide con el cronológico.
+
+Los meses más viejos que VENTAS_AUDIT_DIAS (365 por defecto) se archivan en
+archivos JSONL comprimidos, uno por mes, en VENTAS_AUDIT_ARCHIVO (una
+carpeta por tienda, ver tiendas.ruta). Cuando el filtro de fechas llega a
+esos meses se cargan, cada uno en su propia base en memoria con el mismo
+esquema, y se consultan con el mismo SQL a continuación de la base viva:
+del más reciente al más antiguo y solo hasta llenar la página. Una fila puede
+estar en los dos lados (volvió con una restauración, o un archivado se
+interrumpió): cuenta una sola vez, la de la base viva.
+"""
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timezone
+
+import pandas as pd
+
+from database import get_connection, flush_audit, registrar_consulta
+from utils import safe_dataframe, invalidar_cache
+from tiendas import tienda_actual, ruta as ruta_tienda
+
+PAGINA = 50
+
+ARCHIVO_DIR = os.environ.get("VENTAS_AUDIT_ARCHIVO", "audit_archive")
+DIAS_EN_LINEA = int(os.environ.get("VENTAS_AUDIT_DIAS", "365"))
+MESES_EN_MEMORIA = 12   # meses archivados cargados a la vez
+CONTEOS_EN_MEMORIA = 256   # conteos por mes archivado recordados
+
+_COLUMNAS = ("id", "user_id", "username", "action", "table_name", "record_id", "detail", "created_at")
+_ARCHIVO_RE = re.compile(r"^audit_(\d{4}-\d{2})\.jsonl\.gz$")
+
+_PALABRA = re.compile(r"\w+", re.UNICODE)
+
+
+def _utc(dia, fin=False) -> str:
+    """Límite de un día local en el formato de created_at (UTC, texto de SQLite)."""
+    local = datetime.combine(dia, time.max if fin else time.min).astimezone()
+    return local.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def consulta_fts(texto: str) -> str:
+    """Convierte lo escrito por el usuario en una consulta FTS5 segura.
+
+    Cada palabra se busca como prefijo y todas deben aparecer:
+    "edit vent" encuentra "Editar ventas 2024-05-02".
+    """
+    return " ".join(f'"{p}"*' for p in _PALABRA.findall(texto))
+
+
+def filtros_auditoria(usuario=None, tabla=None, desde=None, hasta=None):
+    """(condiciones WHERE, parámetros) sobre audit_log con alias `a`."""
+    where, params = [], []
+    if usuario:
+        where.append("a.username = ?")
+        params.append(usuario)
+    if tabla:
+        where.append("a.table_name = ?")
+        params.append(tabla)
+    if desde:
+        where.append("a.created_at >= ?")
+        params.append(_utc(desde))
+    if hasta:
+        where.append("a.created_at <= ?")
+        params.append(_utc(hasta, fin=True))
+    return where, params
+
+
+def _sql_pagina(usuario, tabla, desde, hasta, texto, despues_de, limite, excluir_vivos=False):
+    where, params = filtros_auditoria(usuario, tabla, desde, hasta)
+    if excluir_vivos:   # en el archivo: sin las filas que siguen en la base viva
+        where.append("a.id NOT IN (SELECT id FROM vivos)")
+    fts = consulta_fts(texto or "")
+    if fts:
+        origen = "audit_log_fts f JOIN audit_log a ON a.id = f.rowid"
+        where.insert(0, "audit_log_fts MATCH ?")
+        params.insert(0, fts)
+        if despues_de:
+            where.append("f.rowid < ?")
+            params.append(despues_de[1])
+        orden = "f.rowid DESC"
+    else:
+        origen = "audit_log a"
+        if despues_de:
+            where.append("(a.created_at, a.id) < (?, ?)")
+            params.extend(despues_de)
+        orden = "a.created_at DESC, a.id DESC"
+    sql = f"""
+        SELECT a.id, a.created_at, a.username, a.action, a.table_name, a.detail,
+               datetime(a.created_at, 'localtime') AS fecha
+        FROM {origen}
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY {orden}
+        LIMIT ?
+    """
+    return sql, params + [limite]
+
+
+def _sql_conteo(usuario, tabla, desde, hasta, texto, excluir_vivos=False):
+    where, params = filtros_auditoria(usuario, tabla, desde, hasta)
+    if excluir_vivos:
+        where.append("a.id NOT IN (SELECT id FROM vivos)")
+    fts = consulta_fts(texto or "")
+    if fts:
+        where.append("a.id IN (SELECT rowid FROM audit_log_fts WHERE audit_log_fts MATCH ?)")
+        params.append(fts)
+    return f"SELECT COUNT(*) AS n FROM audit_log a {'WHERE ' + ' AND '.join(where) if where else ''}", params
+
+
+registrar_consulta("auditoria", lambda: _sql_pagina(
+    "admin", None, None, None, None, ("2024-06-01 00:00:00", 10**9), PAGINA + 1))
+registrar_consulta("auditoria_texto", lambda: _sql_pagina(
+    None, None, None, None, "editar", ("2024-06-01 00:00:00", 10**9), PAGINA + 1))
+registrar_consulta("auditoria_conteo", lambda: _sql_conteo("admin", None, None, None, None))
+
+
+def buscar_auditoria(usuario=None, tabla=None, desde=None, hasta=None, texto=None,
+                     despues_de=None, limite=PAGINA):
+    """
+    Una página del log, de la más reciente a la más antigua.
+
+    `despues_de` es el cursor (created_at, id) de la última fila de la página
+    anterior. Devuelve (DataFrame, cursor de la página siguiente o None).
+    Si `desde` alcanza meses archivados, la página sigue en el archivo.
+    """
+    filtros = (usuario, tabla, desde, hasta, texto)
+    # Una fila de más para saber si hay página siguiente
+    df = safe_dataframe(*_sql_pagina(*filtros, despues_de, limite + 1))
+    meses = meses_archivados(desde, hasta)
+    # Lo archivado es anterior a la base viva, salvo filas de meses
+    # archivados que siguen (o volvieron) en ella: entonces se intercalan.
+    if meses and (len(df) <= limite or df["created_at"].min()[:7] <= meses[0]):
+        sql, params = _sql_pagina(*filtros, despues_de, limite + 1, excluir_vivos=True)
+        memoria = _memoria()
+        partes, n = [], 0
+        for mes in meses:
+            if despues_de and mes > despues_de[0][:7]:
+                continue   # ya recorrido en páginas anteriores
+            with memoria.lock:
+                conn = memoria.cargar(mes, _ids_vivos(mes))
+                parte = pd.read_sql(sql, conn, params=params)
+            partes.append(parte)
+            n += len(parte)
+            if n > limite:   # los meses siguientes son todos más antiguos
+                break
+        extra = pd.concat(partes, ignore_index=True) if partes else df.iloc[:0]
+        if df.empty:
+            df = extra
+        elif not extra.empty:
+            orden = ["id"] if consulta_fts(texto or "") else ["created_at", "id"]
+            df = (pd.concat([df, extra], ignore_index=True)
+                  .sort_values(orden, ascending=False, ignore_index=True))
+    if len(df) > limite:
+        df = df.iloc[:limite]
+        ultima = df.iloc[-1]
+        return df, (ultima["created_at"], int(ultima["id"]))
+    return df, None
+
+
+def contar_auditoria(usuario=None, tabla=None, desde=None, hasta=None, texto=None) -> int:
+    sql, params = _sql_conteo(usuario, tabla, desde, hasta, texto)
+    df = safe_dataframe(sql, params)
+    n = int(df.iloc[0]["n"]) if not df.empty else 0
+    meses = meses_archivados(desde, hasta)
+    if meses:
+        sql, params = _sql_conteo(usuario, tabla, desde, hasta, texto, excluir_vivos=True)
+        memoria = _memoria()
+        for mes in meses:
+            n += memoria.contar(mes, _ids_vivos(mes), sql, params)
+    return n
+
+
+# ── Archivo de meses antiguos ─────────────────────────────────────────
+def _archivo_dir() -> str:
+    """Carpeta del archivo de la tienda activa."""
+    return ruta_tienda(ARCHIVO_DIR)
+
+
+def _ruta_mes(mes: str) -> str:
+    return os.path.join(_archivo_dir(), f"audit_{mes}.jsonl.gz")
+
+
+def listar_archivo() -> list:
+    """Meses archivados ('YYYY-MM'), del más reciente al más antiguo."""
+    carpeta = _archivo_dir()
+    if not os.path.isdir(carpeta):
+        return []
+    return sorted((m.group(1) for m in map(_ARCHIVO_RE.match, os.listdir(carpeta)) if m), reverse=True)
+
+
+def meses_archivados(desde=None, hasta=None) -> list:
+    """Meses archivados que cubre el filtro. Sin `desde` no se consulta el archivo."""
+    if not desde:
+        return []
+    primero = _utc(desde)[:7]
+    ultimo = _utc(hasta, fin=True)[:7] if hasta else "9999-12"
+    return [m for m in listar_archivo() if primero <= m <= ultimo]
+
+
+def _leer_mes(mes: str) -> dict:
+    """{id: fila} de un mes archivado."""
+    filas = {}
+    with gzip.open(_ruta_mes(mes), "rt", encoding="utf-8") as f:
+        for linea in f:
+            fila = json.loads(linea)
+            filas[fila[0]] = fila
+    return filas
+
+
+def _escribir_mes(mes: str, filas) -> int:
+    """Reescribe el archivo del mes de forma atómica; devuelve bytes."""
+    ruta = _ruta_mes(mes)
+    parcial = ruta + ".part"
+    with gzip.open(parcial, "wt", encoding="utf-8", compresslevel=6) as f:
+        for fila in filas:
+            f.write(json.dumps(fila, ensure_ascii=False, separators=(",", ":")) + "\n")
+    os.replace(parcial, ruta)
+    return os.path.getsize(ruta)
+
+
+def _siguiente_mes(mes: str) -> str:
+    anio, m = int(mes[:4]), int(mes[5:])
+    return f"{anio + m // 12:04d}-{m % 12 + 1:02d}"
+
+
+def _ids_vivos(mes) -> tuple:
+    """Ids de la base viva que caen en un mes archivado (normalmente ninguno)."""
+    return tuple(r[0] for r in get_connection().execute(
+        "SELECT id FROM audit_log WHERE created_at >= ? AND created_at < ? ORDER BY id",
+        (mes + "-01", _siguiente_mes(mes) + "-01")))
+
+
+def archivar_auditoria(dias: int = None) -> dict:
+    """
+    Mueve a archivos mensuales los meses completos anteriores a `dias` días.
+
+    Cada mes se escribe primero al archivo (fusionando con lo ya archivado)
+    y solo entonces se borra de audit_log: una interrupción puede dejar filas
+    en ambos lados, nunca en ninguno; la siguiente ejecución lo corrige.
+    """
+    dias = DIAS_EN_LINEA if dias is None else dias
+    conservar = _utc(date.fromordinal(date.today().toordinal() - dias))[:7]   # primer mes que se queda
+    flush_audit()
+    conn = get_connection()
+    meses = [r[0] for r in conn.execute(
+        "SELECT DISTINCT substr(created_at, 1, 7) FROM audit_log WHERE created_at < ? ORDER BY 1",
+        (conservar + "-01",))]
+    resumen = {"meses": [], "filas": 0, "bytes": 0}
+    os.makedirs(_archivo_dir(), exist_ok=True)
+    for mes in meses:
+        rango = (mes + "-01", _siguiente_mes(mes) + "-01")
+        filas = [tuple(r) for r in conn.execute(
+            f"SELECT {', '.join(_COLUMNAS)} FROM audit_log "
+            "WHERE created_at >= ? AND created_at < ? ORDER BY id", rango)]
+        if not filas:
+            continue
+        previas = _leer_mes(mes) if os.path.exists(_ruta_mes(mes)) else {}
+        previas.update({f[0]: list(f) for f in filas})
+        resumen["bytes"] += _escribir_mes(mes, (previas[k] for k in sorted(previas)))
+        try:
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM audit_log WHERE created_at >= ? AND created_at < ? AND id <= ?",
+                         (*rango, filas[-1][0]))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        _memoria().descartar(mes)
+        resumen["meses"].append(mes)
+        resumen["filas"] += len(filas)
+    if resumen["filas"]:
+        invalidar_cache("audit_log")
+    return resumen
+
+
+class _ArchivoEnMemoria:
+    """Meses archivados cargados, cada uno en su base :memory: con el esquema
+    de audit_log; conserva como mucho los MESES_EN_MEMORIA más usados.
+
+    Un mes se descomprime e indexa una sola vez mientras su archivo no
+    cambie, y cargar uno no toca a los demás.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._meses = OrderedDict()    # mes -> (mtime del archivo, conexión)
+        self._conteos = OrderedDict()  # (mes, mtime, vivos, sql, params) -> n
+
+    @staticmethod
+    def _abrir(mes):
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        conn.executescript("""
+            CREATE TABLE audit_log (
+                id INTEGER PRIMARY KEY, user_id INTEGER, username TEXT, action TEXT,
+                table_name TEXT, record_id INTEGER, detail TEXT, created_at TIMESTAMP);
+            CREATE INDEX idx_audit_log_created ON audit_log (created_at);
+            CREATE INDEX idx_audit_log_user ON audit_log (username, created_at);
+            CREATE INDEX idx_audit_log_tabla ON audit_log (table_name, created_at);
+            CREATE VIRTUAL TABLE audit_log_fts USING fts5(
+                username, action, table_name, detail,
+                content='audit_log', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3 4');
+            CREATE TABLE vivos (id INTEGER PRIMARY KEY);
+        """)
+        conn.executemany(f"INSERT OR REPLACE INTO audit_log ({', '.join(_COLUMNAS)}) "
+                         f"VALUES ({', '.join('?' * len(_COLUMNAS))})", _leer_mes(mes).values())
+        conn.execute("INSERT INTO audit_log_fts (audit_log_fts) VALUES ('rebuild')")
+        conn.commit()
+        return conn
+
+    def _mes(self, mes):
+        """(mtime, conexión) del mes, cargándolo si hace falta."""
+        mtime = os.path.getmtime(_ruta_mes(mes))
+        actual = self._meses.get(mes)
+        if actual and actual[0] == mtime:
+            self._meses.move_to_end(mes)
+            return actual
+        if actual:
+            actual[1].close()
+        self._meses[mes] = (mtime, self._abrir(mes))
+        self._meses.move_to_end(mes)
+        while len(self._meses) > MESES_EN_MEMORIA:
+            self._meses.popitem(last=False)[1][1].close()
+        return self._meses[mes]
+
+    def cargar(self, mes, vivos=()):
+        """Conexión con el mes cargado y `vivos` (ids que siguen en la base
+        viva) en la tabla vivos. Llamar con `lock` tomado."""
+        conn = self._mes(mes)[1]
+        conn.execute("DELETE FROM vivos")
+        conn.executemany("INSERT OR IGNORE INTO vivos (id) VALUES (?)", ((i,) for i in vivos))
+        conn.commit()
+        return conn
+
+    def contar(self, mes, vivos, sql, params) -> int:
+        """COUNT de un mes; se recuerda mientras el archivo no cambie, así un
+        conteo de varios años no descomprime todos los meses cada vez."""
+        clave = (mes, os.path.getmtime(_ruta_mes(mes)), vivos, sql, tuple(params))
+        with self.lock:
+            if clave in self._conteos:
+                self._conteos.move_to_end(clave)
+                return self._conteos[clave]
+            n = self.cargar(mes, vivos).execute(sql, params).fetchone()[0]
+            self._conteos[clave] = n
+            while len(self._conteos) > CONTEOS_EN_MEMORIA:
+                self._conteos.popitem(last=False)
+            return n
+
+    def descartar(self, mes):
+        """El archivo del mes cambió: se recargará en la próxima consulta."""
+        with self.lock:
+            actual = self._meses.pop(mes, None)
+            if actual:
+                actual[1].close()
+
+
+_memorias = {}   # tienda -> _ArchivoEnMemoria
+_memorias_lock = threading.Lock()
+
+
+def _memoria() -> _ArchivoEnMemoria:
+    with _memorias_lock:
+        return _memorias.setdefault(tienda_actual(), _ArchivoEnMemoria())
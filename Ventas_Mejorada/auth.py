@@ -16,7 +16,6 @@ def authenticate(username, password):
         (username, hashed)
     )
     user = cur.fetchone()
-    conn.close()
     if user:
         return {"id": user[0], "username": user[1], "role": user[2]}
     return None
@@ -30,7 +29,6 @@ def create_user(username, password, role="empleado"):
     cur = conn.cursor()
     cur.execute("SELECT id FROM users WHERE username = ?", (username,))
     if cur.fetchone():
-        conn.close()
         raise ValueError(f"El usuario '{username}' ya existe")
     hashed = hash_password(password)
     cur.execute(
@@ -39,7 +37,6 @@ def create_user(username, password, role="empleado"):
     )
     user_id = cur.lastrowid
     conn.commit()
-    conn.close()
     return (user_id, username, role)
 
 def get_all_users():
@@ -52,6 +49,4 @@ def get_all_users():
         LEFT JOIN employees e ON u.id = e.user_id
         ORDER BY u.username
     """)
-    users = cur.fetchall()
-    conn.close()
-    return users
+    return cur.fetchall()
@@ -3,50 +3,382 @@ import streamlit as st
 import sqlite3
 import os
 import shutil
+import functools
+import threading
 from datetime import datetime
 import gzip
-import io
-from database import get_connection, DB_PATH
+import hashlib
+import json
+import tempfile
+from database import get_connection, close_all_connections, init_database, flush_audit, ruta_db, mantenimiento
+from query_cache import cache as query_cache
+from utils import invalidar_acumulado
+from audit_utils import archivar_auditoria
+from tiendas import TIENDAS, nombre_tienda, ruta as ruta_tienda
 import time
 
-def create_backup():
-    """Crear un backup de la base de datos"""
+BACKUP_DIR = "backups"      # de la tienda por defecto; ver backup_dir()
+PAGINAS_POR_PASO = 1024     # páginas copiadas por paso de la API de backup
+CHUNK_BYTES = 1024 * 1024   # bloque de lectura al comprimir
+
+
+def backup_dir():
+    """Carpeta de backups de la tienda activa."""
+    return ruta_tienda(BACKUP_DIR)
+
+
+def _manifest_path():
+    return os.path.join(backup_dir(), "manifest.json")
+
+
+def _catalog_path():
+    return os.path.join(backup_dir(), "catalog.json")
+
+
+# Backups, restauraciones y borrados no se solapan (el programador de
+# backups automáticos corre en otro hilo). Reentrante: restaurar crea antes
+# un backup de seguridad.
+_operacion = threading.RLock()
+
+
+def _exclusivo(fn):
+    @functools.wraps(fn)
+    def envoltura(*args, **kwargs):
+        with _operacion:
+            return fn(*args, **kwargs)
+    return envoltura
+
+
+def _nombre_libre(prefijo, extension):
+    """Nombre con timestamp; dos backups en el mismo segundo no se pisan."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    nombre, n = f"{prefijo}_{timestamp}{extension}", 1
+    while os.path.exists(os.path.join(backup_dir(), nombre)):
+        nombre, n = f"{prefijo}_{timestamp}_{n}{extension}", n + 1
+    return nombre
+
+
+def _copiar_online(destino_path, progreso=None, paginas=PAGINAS_POR_PASO):
+    """
+    Copia la base de datos en caliente con la API de backup de SQLite.
+
+    Avanza por bloques de `paginas`, soltando el bloqueo entre pasos para no
+    frenar a los escritores; lee a través de SQLite, así que incluye lo que
+    aún está en el -wal. `progreso(copiadas, total, paginas_seg)` se llama
+    tras cada paso. Devuelve (páginas, segundos).
+    """
+    inicio = time.perf_counter()
+
+    def _avance(status, restantes, total):
+        if progreso:
+            copiadas = total - restantes
+            progreso(copiadas, total, copiadas / max(time.perf_counter() - inicio, 1e-6))
+
+    destino = sqlite3.connect(destino_path)
     try:
-        # Crear directorio de backups si no existe
-        backup_dir = "backups"
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        
-        # Nombre del archivo backup con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"backup_{timestamp}.db"
-        backup_path = os.path.join(backup_dir, backup_filename)
-        
-        # Crear backup comprimido
-        backup_gz_path = backup_path + '.gz'
-        
-        # Copiar la base de datos
-        if os.path.exists(DB_PATH):
-            # Crear una copia de seguridad
-            shutil.copy2(DB_PATH, backup_path)
-            
-            # Comprimir el backup
-            with open(backup_path, 'rb') as f_in:
-                with gzip.open(backup_gz_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-            
-            # Eliminar el archivo sin comprimir
-            os.remove(backup_path)
-            
-            return True, backup_gz_path, f"✅ Backup creado: {backup_filename}.gz"
-        else:
+        get_connection().backup(destino, pages=paginas, progress=_avance)
+        total = destino.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        destino.close()
+    return total, time.perf_counter() - inicio
+
+
+@_exclusivo
+def create_backup(progreso=None, prefijo="backup", iniciar_cadena=True):
+    """Crear un backup comprimido de la base de datos sin detener la app.
+
+    Con `iniciar_cadena` el backup pasa a ser la base de los próximos
+    incrementales; los automáticos y los de seguridad no lo son.
+    """
+    try:
+        if not os.path.exists(ruta_db()):
             return False, None, "❌ No se encontró la base de datos"
-            
+        os.makedirs(backup_dir(), exist_ok=True)
+        flush_audit()   # la auditoría encolada también entra en la copia
+
+        # Nombre del archivo backup con timestamp
+        backup_filename = _nombre_libre(prefijo, ".db.gz")
+        backup_gz_path = os.path.join(backup_dir(), backup_filename)
+
+        # Instantánea consistente en un temporal y una sola pasada de gzip;
+        # el .gz aparece con su nombre final solo cuando está completo.
+        fd, snapshot = tempfile.mkstemp(suffix=".db", dir=backup_dir())
+        os.close(fd)
+        parcial = backup_gz_path + ".part"
+        try:
+            paginas, segundos = _copiar_online(snapshot, progreso)
+            snap = sqlite3.connect(snapshot)
+            try:
+                marcas = _marcas(snap)
+                filas = {t: snap.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in TABLAS_REQUERIDAS}
+            finally:
+                snap.close()
+            with open(snapshot, 'rb') as f_in, gzip.open(parcial, 'wb', compresslevel=6) as f_out:
+                shutil.copyfileobj(f_in, f_out, CHUNK_BYTES)
+            os.replace(parcial, backup_gz_path)
+            if iniciar_cadena:
+                _iniciar_cadena(backup_filename, marcas)
+            _registrar_en_catalogo(backup_filename, "Completo", filas)
+        finally:
+            for tmp in (snapshot, parcial):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+        velocidad = paginas / max(segundos, 1e-6)
+        return True, backup_gz_path, (f"✅ Backup creado: {backup_filename} "
+                                      f"({paginas:,} páginas · {velocidad:,.0f} pág/s)")
+
     except Exception as e:
         return False, None, f"❌ Error al crear backup: {str(e)}"
 
-def restore_backup(uploaded_file):
-    """Restaurar un backup desde archivo subido"""
+# ── Backups incrementales ─────────────────────────────────────────────
+# El manifiesto agrupa los backups en cadenas: un backup completo (base)
+# seguido de incrementales que guardan solo las filas nuevas o modificadas
+# desde la marca anterior. `actual` es la cadena a la que se añadirá el
+# próximo incremental; tras una restauración queda en None hasta el
+# siguiente backup completo manual. Los automáticos nunca inician cadena:
+# la poda por retención no puede arrastrar incrementales manuales.
+#
+# En la app solo se borran empleados y usuarios (las ventas y afiliaciones
+# caen en cascada), así que esas dos tablas, que son pequeñas, viajan
+# completas en cada incremental y al reproducirlo se eliminan las filas que
+# ya no existen. sales y afiliaciones se filtran por id y updated_at;
+# audit_log solo crece y se filtra por id.
+TABLAS_COMPLETAS = {"users": "id", "employees": "id", "festivos": "fecha"}   # tabla -> clave
+TABLAS_INCREMENTALES = {
+    "sales":        "id > ? OR updated_at >= ?",
+    "afiliaciones": "id > ? OR updated_at >= ?",
+    "audit_log":    "id > ?",
+}
+
+
+def _marcas(conn):
+    """Último id y updated_at de las tablas que se respaldan por diferencia."""
+    marcas = {}
+    for tabla in TABLAS_INCREMENTALES:
+        marcas[f"{tabla}_id"] = conn.execute(f"SELECT IFNULL(MAX(id), 0) FROM {tabla}").fetchone()[0]
+    for tabla in ("sales", "afiliaciones"):
+        marcas[f"{tabla}_updated_at"] = conn.execute(
+            f"SELECT IFNULL(MAX(updated_at), '') FROM {tabla}").fetchone()[0]
+    return marcas
+
+
+def _leer_json(path, defecto):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return defecto
+
+
+def _guardar_json(path, datos):
+    os.makedirs(backup_dir(), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _leer_manifest():
+    return _leer_json(_manifest_path(), {"version": 1, "actual": None, "cadenas": {}})
+
+
+def _guardar_manifest(manifest):
+    _guardar_json(_manifest_path(), manifest)
+
+
+def _iniciar_cadena(base, marcas):
+    manifest = _leer_manifest()
+    manifest["cadenas"][base] = {
+        "creado": datetime.now().isoformat(timespec="seconds"),
+        "marcas": marcas,
+        "deltas": [],
+    }
+    manifest["actual"] = base
+    _guardar_manifest(manifest)
+
+
+def _cerrar_cadena():
+    """La BD dejó de coincidir con la cadena actual (p. ej. tras restaurar)."""
+    manifest = _leer_manifest()
+    manifest["actual"] = None
+    _guardar_manifest(manifest)
+
+
+def _cadena_de(manifest, nombre):
+    """(base, cadena) a la que pertenece un backup completo o incremental."""
+    for base, cadena in manifest["cadenas"].items():
+        if base == nombre or any(d["archivo"] == nombre for d in cadena["deltas"]):
+            return base, cadena
+    return None, None
+
+
+def bases_con_incrementales():
+    """Backups completos de los que dependen incrementales."""
+    return {base for base, cadena in _leer_manifest()["cadenas"].items() if cadena["deltas"]}
+
+
+def _ultimas_marcas(cadena):
+    return cadena["deltas"][-1]["marcas"] if cadena["deltas"] else cadena["marcas"]
+
+
+@_exclusivo
+def create_incremental_backup():
+    """
+    Guarda solo los cambios desde el último backup de la cadena actual.
+    Si no hay cadena activa, crea un backup completo que hará de base.
+    """
+    manifest = _leer_manifest()
+    base = manifest.get("actual")
+    if not base or not os.path.exists(os.path.join(backup_dir(), base)):
+        ok, path, msg = create_backup()
+        return ok, path, (msg + " (no había backup base: se creó uno completo)") if ok else msg
+    try:
+        flush_audit()
+        cadena = manifest["cadenas"][base]
+        previas = _ultimas_marcas(cadena)
+        conn = get_connection()
+        tablas = {}
+        # Una sola transacción de lectura: los datos y las nuevas marcas
+        # corresponden al mismo instante.
+        conn.execute("BEGIN")
+        try:
+            for tabla in TABLAS_COMPLETAS:
+                cur = conn.execute(f"SELECT * FROM {tabla}")
+                tablas[tabla] = {"columnas": [d[0] for d in cur.description], "filas": [tuple(r) for r in cur]}
+            for tabla, filtro in TABLAS_INCREMENTALES.items():
+                params = [previas[f"{tabla}_id"]]
+                if "updated_at" in filtro:
+                    params.append(previas[f"{tabla}_updated_at"])
+                cur = conn.execute(f"SELECT * FROM {tabla} WHERE {filtro}", params)
+                tablas[tabla] = {"columnas": [d[0] for d in cur.description], "filas": [tuple(r) for r in cur]}
+            marcas = _marcas(conn)
+        finally:
+            conn.commit()
+
+        nombre = _nombre_libre("delta", ".json.gz")
+        path = os.path.join(backup_dir(), nombre)
+        delta = {"version": 1, "base": base, "anteriores": previas, "marcas": marcas, "tablas": tablas}
+        with gzip.open(path + ".part", "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(delta, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(path + ".part", path)
+
+        filas = {t: len(v["filas"]) for t, v in tablas.items() if t in TABLAS_INCREMENTALES}
+        cadena["deltas"].append({
+            "archivo": nombre,
+            "creado": datetime.now().isoformat(timespec="seconds"),
+            "marcas": marcas,
+            "filas": filas,
+        })
+        _guardar_manifest(manifest)
+        _registrar_en_catalogo(nombre, "Incremental", filas)
+        resumen = ", ".join(f"{n} {t}" for t, n in filas.items())
+        return True, path, f"✅ Backup incremental creado: {nombre} ({resumen})"
+    except Exception as e:
+        return False, None, f"❌ Error al crear backup incremental: {str(e)}"
+
+
+def _aplicar_delta(conn, delta):
+    """Reproduce un incremental: upsert por clave y bajas de las tablas completas."""
+    for tabla in (*TABLAS_COMPLETAS, *TABLAS_INCREMENTALES):
+        datos = delta["tablas"].get(tabla)
+        if not datos:
+            continue
+        existentes = {r[1] for r in conn.execute(f"PRAGMA table_info({tabla})")}
+        idx = [i for i, c in enumerate(datos["columnas"]) if c in existentes]
+        cols = [datos["columnas"][i] for i in idx]
+        clave = TABLAS_COMPLETAS.get(tabla, "id")
+        # ON CONFLICT DO UPDATE y no INSERT OR REPLACE: REPLACE borra la fila
+        # y dispararía los ON DELETE CASCADE de empleados y usuarios.
+        conn.executemany(
+            f"INSERT INTO {tabla} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT({clave}) DO UPDATE SET "
+            + ", ".join(f"{c}=excluded.{c}" for c in cols if c != clave),
+            ([fila[i] for i in idx] for fila in datos["filas"]),
+        )
+    for tabla, clave in reversed(TABLAS_COMPLETAS.items()):   # empleados antes que usuarios
+        if tabla not in delta["tablas"]:
+            continue   # incremental anterior a la tabla
+        i = delta["tablas"][tabla]["columnas"].index(clave)
+        claves = json.dumps([fila[i] for fila in delta["tablas"][tabla]["filas"]])
+        conn.execute(f"DELETE FROM {tabla} WHERE {clave} NOT IN (SELECT value FROM json_each(?))", (claves,))
+
+
+@_exclusivo
+def restore_incremental(nombre):
+    """Restaura la base de la cadena y reproduce sus incrementales hasta `nombre`."""
+    manifest = _leer_manifest()
+    base, cadena = _cadena_de(manifest, nombre)
+    if base is None:
+        return False, "❌ El backup no figura en el manifiesto"
+    archivos = [d["archivo"] for d in cadena["deltas"]]
+    deltas = archivos[:archivos.index(nombre) + 1]
+    faltan = [a for a in [base, *deltas] if not os.path.exists(os.path.join(backup_dir(), a))]
+    if faltan:
+        return False, f"❌ Faltan archivos de la cadena: {', '.join(faltan)}"
+    alterados = [a for a in [base, *deltas] if not verificar_backup(a)]
+    if alterados:
+        return False, f"❌ El checksum no coincide con el catálogo: {', '.join(alterados)}"
+
+    with open(os.path.join(backup_dir(), base), "rb") as f:
+        ok, msg = restore_backup(f, deltas=[os.path.join(backup_dir(), a) for a in deltas])
+    if not ok:
+        return False, msg
+    return True, f"✅ Restaurado {base} + {len(deltas)} incremental(es) hasta {nombre}"
+
+
+def _reproducir_deltas(path, deltas):
+    """Pone al día el esquema del archivo `path` y le aplica los incrementales
+    en una sola transacción."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA foreign_keys=ON")   # las bajas cascadean como en la app
+        init_database(conn)   # un incremental puede traer tablas de migraciones posteriores
+        conn.execute("BEGIN")
+        try:
+            for archivo in deltas:
+                with gzip.open(archivo, "rt", encoding="utf-8") as f:
+                    _aplicar_delta(conn, json.load(f))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+
+
+TABLAS_REQUERIDAS = ("users", "employees", "sales", "afiliaciones", "audit_log")
+
+
+def _validar_backup(path):
+    """None si el archivo es una BD íntegra de la app; si no, el motivo."""
+    try:
+        conn = sqlite3.connect(path)
+        try:
+            resultado = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            if resultado != "ok":
+                return f"la verificación de integridad falló ({resultado})"
+            tablas = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            faltan = [t for t in TABLAS_REQUERIDAS if t not in tablas]
+            if faltan:
+                return f"faltan las tablas {', '.join(faltan)}"
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return str(e)
+    return None
+
+
+@_exclusivo
+def restore_backup(uploaded_file, deltas=()):
+    """
+    Restaurar un backup desde un archivo subido o abierto.
+
+    Se descomprime por bloques a un temporal junto a la BD (nunca entero en
+    memoria), se valida, se le reproducen los incrementales `deltas` (rutas)
+    y se cambia por la BD actual con os.replace, que es atómico: si algo
+    falla antes, la base de datos actual no se toca.
+    """
     try:
         # Verificar que el archivo sea válido
         if uploaded_file is None:
@@ -55,105 +387,199 @@ def restore_backup(uploaded_file):
         # Validar extensión
         if not uploaded_file.name.endswith('.gz'):
             return False, "❌ El archivo debe tener extensión .gz"
+        if os.path.basename(uploaded_file.name).startswith("delta_"):
+            return False, "❌ Los backups incrementales se restauran desde la lista de backups existentes"
         
-        # Crear backup automático antes de restaurar
-        st.info("📦 Creando backup de seguridad antes de restaurar...")
-        backup_success, backup_path, backup_msg = create_backup()
-        if backup_success:
-            st.success(f"✅ Backup de seguridad creado: {os.path.basename(backup_path)}")
-        
-        # Leer el contenido del archivo subido
-        file_content = uploaded_file.read()
-        
-        # Descomprimir en memoria
+        # Descomprimir por bloques en el mismo directorio que la BD, para
+        # que os.replace no tenga que cruzar de sistema de archivos
+        db_path = ruta_db()
+        fd, tmp_path = tempfile.mkstemp(suffix=".restore", dir=os.path.dirname(os.path.abspath(db_path)))
         try:
-            with gzip.open(io.BytesIO(file_content), 'rb') as f:
-                db_content = f.read()
-        except Exception as e:
-            return False, f"❌ El archivo no es un backup válido: {str(e)}"
+            try:
+                with os.fdopen(fd, 'wb') as f_out, gzip.GzipFile(fileobj=uploaded_file, mode='rb') as f_in:
+                    shutil.copyfileobj(f_in, f_out, CHUNK_BYTES)
+            except (OSError, EOFError) as e:
+                return False, f"❌ El archivo no es un backup válido: {str(e)}"
+            
+            error = _validar_backup(tmp_path)
+            if error:
+                return False, f"❌ El archivo no contiene una base de datos válida: {error}"
+            if deltas:
+                try:
+                    _reproducir_deltas(tmp_path, deltas)
+                except Exception as e:
+                    return False, f"❌ Falló un incremental; la base actual no se modificó: {str(e)}"
+            
+            # Backup automático del estado actual, ya con el archivo validado.
+            # No inicia cadena: solo los backups completos explícitos lo hacen.
+            st.info("📦 Creando backup de seguridad antes de restaurar...")
+            backup_success, backup_path, backup_msg = create_backup(iniciar_cadena=False)
+            if backup_success:
+                st.success(f"✅ Backup de seguridad creado: {os.path.basename(backup_path)}")
+            
+            # Cerrar todas las conexiones del pool. Los -wal/-shm que queden
+            # son de la BD anterior: aplicados sobre la restaurada la
+            # corromperían. Hasta reabrir con el esquema al día (un backup
+            # antiguo puede no tener las últimas migraciones) ningún otro
+            # hilo obtiene conexión ni escribe auditoría.
+            flush_audit()
+            with mantenimiento():
+                close_all_connections()
+                for sufijo in ("-wal", "-shm"):
+                    if os.path.exists(db_path + sufijo):
+                        os.remove(db_path + sufijo)
+                os.replace(tmp_path, db_path)
+                init_database()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
         
-        # Cerrar todas las conexiones a la base de datos
+        # Limpiar caché; la BD ya no coincide con la cadena incremental
+        query_cache.clear()
+        invalidar_acumulado()
+        _cerrar_cadena()
+        # Un backup anterior al último archivado trae de vuelta filas de
+        # auditoría que ya están en el archivo: se vuelven a archivar.
         try:
-            # Forzar cierre de conexiones
-            sqlite3.connect(DB_PATH).close()
-        except:
-            pass
-        
-        # Crear backup del archivo actual (por si algo sale mal)
-        if os.path.exists(DB_PATH):
-            temp_backup = DB_PATH + ".temp_backup"
-            shutil.copy2(DB_PATH, temp_backup)
+            archivar_auditoria()
+        except Exception:
+            pass   # la consulta no las duplica; el próximo ciclo lo reintenta
         
-        try:
-            # Escribir el nuevo contenido
-            with open(DB_PATH, 'wb') as f:
-                f.write(db_content)
-            
-            # Verificar que la base de datos restaurada sea válida
-            try:
-                conn = sqlite3.connect(DB_PATH)
-                conn.execute("SELECT COUNT(*) FROM sqlite_master")
-                conn.close()
-                
-                # Limpiar caché
-                st.cache_data.clear()
-                
-                return True, f"✅ Backup restaurado exitosamente desde: {uploaded_file.name}"
-                
-            except sqlite3.Error as e:
-                # Si hay error, restaurar el backup temporal
-                if os.path.exists(temp_backup):
-                    shutil.copy2(temp_backup, DB_PATH)
-                return False, f"❌ El archivo no contiene una base de datos válida: {str(e)}"
-                
-        except Exception as e:
-            # Restaurar backup temporal en caso de error
-            if os.path.exists(temp_backup):
-                shutil.copy2(temp_backup, DB_PATH)
-            return False, f"❌ Error al restaurar backup: {str(e)}"
-        finally:
-            # Limpiar archivo temporal
-            if os.path.exists(temp_backup):
-                os.remove(temp_backup)
+        return True, f"✅ Backup restaurado exitosamente desde: {os.path.basename(uploaded_file.name)}"
                 
     except Exception as e:
         return False, f"❌ Error general: {str(e)}"
 
+# ── Catálogo ──────────────────────────────────────────────────────────
+# catalog.json guarda tamaño, filas por tabla, sha256 y fecha de cada
+# backup: listar la página cuesta leer un JSON, sin abrir ningún archivo.
+# Se actualiza al crear y borrar; los archivos que lleguen por otra vía
+# se incorporan con sincronizar_catalogo().
+def _es_backup(nombre):
+    return nombre.startswith(("backup_", "delta_")) and nombre.endswith(".gz")
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(CHUNK_BYTES), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _leer_catalogo():
+    return _leer_json(_catalog_path(), {"version": 1, "backups": {}})
+
+
+def _entrada_catalogo(nombre, tipo, filas, creado=None):
+    path = os.path.join(backup_dir(), nombre)
+    return {
+        "tipo":   tipo,
+        "size":   os.path.getsize(path),
+        "sha256": _sha256(path),
+        "creado": (creado or datetime.now()).isoformat(timespec="seconds"),
+        "filas":  filas,
+    }
+
+
+def _registrar_en_catalogo(nombre, tipo, filas):
+    catalogo = _leer_catalogo()
+    catalogo["backups"][nombre] = _entrada_catalogo(nombre, tipo, filas)
+    _guardar_json(_catalog_path(), catalogo)
+
+
+@_exclusivo
+def sincronizar_catalogo():
+    """Alinea el catálogo con los archivos de backups/ (altas y bajas externas)."""
+    catalogo = _leer_catalogo()
+    carpeta = backup_dir()
+    en_disco = {f for f in os.listdir(carpeta) if _es_backup(f)} if os.path.exists(carpeta) else set()
+    registrados = catalogo["backups"]
+    for nombre in set(registrados) - en_disco:
+        del registrados[nombre]
+    for nombre in en_disco - set(registrados):
+        path = os.path.join(backup_dir(), nombre)
+        registrados[nombre] = _entrada_catalogo(
+            nombre, "Incremental" if nombre.startswith("delta_") else "Completo", None,
+            creado=datetime.fromtimestamp(os.path.getmtime(path)),
+        )
+    _guardar_json(_catalog_path(), catalogo)
+    return catalogo
+
+
+def verificar_backup(nombre):
+    """True si el archivo coincide con el sha256 registrado en el catálogo."""
+    entrada = _leer_catalogo()["backups"].get(nombre)
+    path = os.path.join(backup_dir(), nombre)
+    return bool(entrada) and os.path.exists(path) and _sha256(path) == entrada["sha256"]
+
+
 def list_backups():
-    """Listar todos los backups disponibles"""
-    backup_dir = "backups"
-    backups = []
+    """Listar todos los backups disponibles (desde el catálogo)"""
+    if os.path.exists(_catalog_path()):
+        catalogo = _leer_catalogo()
+    else:
+        catalogo = sincronizar_catalogo()   # primera vez: se construye desde disco
     
-    if os.path.exists(backup_dir):
-        files = os.listdir(backup_dir)
-        for file in files:
-            if file.startswith("backup_") and file.endswith(".gz"):
-                file_path = os.path.join(backup_dir, file)
-                size = os.path.getsize(file_path)
-                modified = datetime.fromtimestamp(os.path.getmtime(file_path))
-                backups.append({
-                    "name": file,
-                    "size": size,
-                    "modified": modified,
-                    "path": file_path
-                })
+    backups = []
+    for nombre, entrada in catalogo["backups"].items():
+        backups.append({
+            "name": nombre,
+            "size": entrada["size"],
+            "modified": datetime.fromisoformat(entrada["creado"]),
+            "path": os.path.join(backup_dir(), nombre),
+            "tipo": entrada["tipo"],
+            "filas": entrada["filas"],
+            "sha256": entrada["sha256"],
+        })
     
     # Ordenar por fecha descendente
     backups.sort(key=lambda x: x["modified"], reverse=True)
     return backups
 
+@_exclusivo
 def delete_backup(backup_name):
-    """Eliminar un backup específico"""
+    """Eliminar un backup específico (y los incrementales que dependen de él)"""
     try:
-        backup_path = os.path.join("backups", backup_name)
+        backup_path = os.path.join(backup_dir(), backup_name)
         if os.path.exists(backup_path):
             os.remove(backup_path)
-            return True, f"✅ Backup {backup_name} eliminado"
+            dependientes = _quitar_de_manifest(backup_name)
+            for archivo in dependientes:
+                ruta = os.path.join(backup_dir(), archivo)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            catalogo = _leer_catalogo()
+            for archivo in (backup_name, *dependientes):
+                catalogo["backups"].pop(archivo, None)
+            _guardar_json(_catalog_path(), catalogo)
+            extra = f" y {len(dependientes)} incremental(es) dependiente(s)" if dependientes else ""
+            return True, f"✅ Backup {backup_name} eliminado{extra}"
         else:
-            return False, "❌ El archivo no existe"
+            sincronizar_catalogo()
+            return False, "❌ El archivo no existe (catálogo actualizado)"
     except Exception as e:
         return False, f"❌ Error al eliminar: {str(e)}"
 
+def _quitar_de_manifest(nombre):
+    """Saca un backup del manifiesto; devuelve los incrementales que dependían de él."""
+    manifest = _leer_manifest()
+    base, cadena = _cadena_de(manifest, nombre)
+    if base is None:
+        return []
+    if base == nombre:
+        del manifest["cadenas"][base]
+        if manifest.get("actual") == base:
+            manifest["actual"] = None
+        dependientes = [d["archivo"] for d in cadena["deltas"]]
+    else:
+        archivos = [d["archivo"] for d in cadena["deltas"]]
+        i = archivos.index(nombre)
+        dependientes = archivos[i + 1:]
+        cadena["deltas"] = cadena["deltas"][:i]
+    _guardar_manifest(manifest)
+    return dependientes
+
 def format_size(size_bytes):
     """Formatear tamaño de archivo"""
     if size_bytes < 1024:
@@ -166,11 +592,14 @@ def format_size(size_bytes):
 def render_backup_page():
     """Renderizar la página de gestión de backups"""
     st.title("💾 Gestión de Backups")
+    if len(TIENDAS) > 1:
+        st.caption(f"🏬 Backups de {nombre_tienda()}: cada tienda tiene su propia base y su carpeta de backups.")
     
-    tab1, tab2, tab3 = st.tabs([
+    tab1, tab2, tab3, tab4 = st.tabs([
         "📤 Crear Backup",
         "📥 Restaurar Backup",
-        "📋 Lista de Backups"
+        "📋 Lista de Backups",
+        "⏰ Automáticos"
     ])
     
     # ===== PESTAÑA 1: CREAR BACKUP =====
@@ -185,8 +614,14 @@ def render_backup_page():
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             if st.button("🔄 Crear Backup Ahora", type="primary", use_container_width=True):
-                with st.spinner("Creando backup..."):
-                    success, backup_path, message = create_backup()
+                barra = st.progress(0.0, text="Copiando páginas...")
+                
+                def avance(copiadas, total, velocidad):
+                    barra.progress(copiadas / total if total else 1.0,
+                                   text=f"{copiadas:,} / {total:,} páginas · {velocidad:,.0f} pág/s")
+                
+                success, backup_path, message = create_backup(progreso=avance)
+                barra.empty()
                     
                 if success:
                     st.success(message)
@@ -205,6 +640,15 @@ def render_backup_page():
                     )
                 else:
                     st.error(message)
+            
+            if st.button("➕ Backup incremental", use_container_width=True,
+                         help="Guarda solo los cambios desde el último backup"):
+                with st.spinner("Creando backup incremental..."):
+                    success, backup_path, message = create_incremental_backup()
+                if success:
+                    st.success(message)
+                else:
+                    st.error(message)
     
     # ===== PESTAÑA 2: RESTAURAR BACKUP =====
     with tab2:
@@ -281,23 +725,14 @@ def render_backup_page():
                         st.metric("Hora", backup_info['modified'].strftime('%H:%M:%S'))
                     
                     if st.button("🔄 Restaurar este backup", key="restore_existing", use_container_width=True):
-                        # Simular subida del archivo existente
-                        with open(backup_info['path'], 'rb') as f:
-                            file_content = f.read()
-                        
-                        class MockUploadedFile:
-                            def __init__(self, name, content):
-                                self.name = name
-                                self.content = content
-                                self.size = len(content)
-                            
-                            def read(self):
-                                return self.content
-                        
-                        mock_file = MockUploadedFile(backup_info['name'], file_content)
-                        
                         with st.spinner("Restaurando backup..."):
-                            success, message = restore_backup(mock_file)
+                            if backup_info['tipo'] == "Incremental":
+                                success, message = restore_incremental(backup_info['name'])
+                            elif not verificar_backup(backup_info['name']):
+                                success, message = False, "❌ El checksum del archivo no coincide con el catálogo"
+                            else:
+                                with open(backup_info['path'], 'rb') as f:
+                                    success, message = restore_backup(f)
                         
                         if success:
                             st.success(message)
@@ -317,53 +752,52 @@ def render_backup_page():
         backups = list_backups()
         
         if backups:
-            # Crear DataFrame para mostrar
-            backup_data = []
-            for b in backups:
-                backup_data.append({
-                    "Nombre": b['name'],
-                    "Fecha": b['modified'].strftime("%Y-%m-%d"),
-                    "Hora": b['modified'].strftime("%H:%M:%S"),
-                    "Tamaño": format_size(b['size']),
-                    "Acciones": b['name']
-                })
+            col_a, col_b = st.columns([4, 1])
+            with col_b:
+                if st.button("🔄 Actualizar catálogo", help="Incorporar cambios hechos fuera de la app en backups/"):
+                    sincronizar_catalogo()
+                    st.rerun()
             
-            for backup in backup_data:
+            # Solo se lee del disco el backup cuya descarga se pidió
+            seleccionado = st.session_state.get("backup_descarga")
+            
+            for b in backups:
                 with st.container():
                     col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
                     
                     with col1:
-                        st.markdown(f"**{backup['Nombre']}**")
+                        st.markdown(f"**{b['name']}**")
+                        filas = b['filas'] or {}
+                        resumen = " · ".join(f"{n:,} {t}" for t, n in filas.items() if n)
+                        st.caption(f"{b['tipo']} · sha256 {b['sha256'][:12]}" + (f" · {resumen}" if resumen else ""))
                     with col2:
-                        st.write(backup['Fecha'])
+                        st.write(b['modified'].strftime("%Y-%m-%d"))
                     with col3:
-                        st.write(backup['Hora'])
+                        st.write(b['modified'].strftime("%H:%M:%S"))
                     with col4:
-                        st.write(backup['Tamaño'])
+                        st.write(format_size(b['size']))
                     with col5:
-                        # Botón de descarga
-                        backup_info = next((b for b in backups if b['name'] == backup['Nombre']), None)
-                        if backup_info:
-                            with open(backup_info['path'], 'rb') as f:
-                                backup_data_file = f.read()
-                            
-                            st.download_button(
-                                label="📥",
-                                data=backup_data_file,
-                                file_name=backup_info['name'],
-                                mime="application/gzip",
-                                key=f"download_{backup['Nombre']}",
-                                help="Descargar backup"
-                            )
+                        if seleccionado == b['name'] and os.path.exists(b['path']):
+                            with open(b['path'], 'rb') as f:
+                                st.download_button(
+                                    label="💾",
+                                    data=f.read(),
+                                    file_name=b['name'],
+                                    mime="application/gzip",
+                                    key=f"download_{b['name']}",
+                                    help="Guardar archivo"
+                                )
+                        elif st.button("📥", key=f"prep_{b['name']}", help="Descargar backup"):
+                            st.session_state["backup_descarga"] = b['name']
+                            st.rerun()
                     
                     # Botón de eliminar en columna aparte
                     col_del1, col_del2, col_del3 = st.columns([1, 1, 8])
                     with col_del1:
-                        if st.button("🗑️", key=f"del_{backup['Nombre']}", help="Eliminar backup"):
-                            success, msg = delete_backup(backup['Nombre'])
+                        if st.button("🗑️", key=f"del_{b['name']}", help="Eliminar backup"):
+                            success, msg = delete_backup(b['name'])
                             if success:
                                 st.success(msg)
-                                st.cache_data.clear()
                                 time.sleep(1)
                                 st.rerun()
                             else:
@@ -394,4 +828,48 @@ def render_backup_page():
                     st.success(message)
                     st.rerun()
                 else:
-                    st.error(message)
\ No newline at end of file
+                    st.error(message)
+    
+    # ===== PESTAÑA 4: BACKUPS AUTOMÁTICOS =====
+    with tab4:
+        # Import diferido: backup_scheduler importa este módulo
+        from backup_scheduler import get_scheduler_status, PREFIJO_AUTO
+        estado = get_scheduler_status()
+        
+        st.subheader("⏰ Backups automáticos")
+        if not estado["activo"]:
+            st.warning("⏸️ Programador inactivo (VENTAS_BACKUP_FRECUENCIA=off)")
+        
+        ret = estado["retencion"]
+        frecuencia = "Cada hora" if estado["frecuencia"] == "hora" else f"Diario a las {estado['hora']:02d}:00"
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Frecuencia", frecuencia)
+        with col2:
+            st.metric("Próximo", estado["proxima"].strftime('%d/%m %H:%M') if estado["proxima"] else "—")
+        with col3:
+            st.metric("Retención", f"{ret['horas']} h · {ret['dias']} d · {ret['semanas']} sem")
+        
+        ultima = estado["ultima"]
+        if ultima:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Último", ultima["inicio"].strftime('%d/%m %H:%M:%S'))
+            with col2:
+                st.metric("Duración", f"{ultima['segundos']:.1f} s")
+            with col3:
+                st.metric("Tamaño", format_size(ultima["bytes"]))
+            if ultima["ok"]:
+                st.success(ultima["mensaje"])
+            else:
+                st.error(ultima["mensaje"])
+            if ultima["eliminados"]:
+                st.caption(f"🧹 {ultima['eliminados']} backup(s) antiguo(s) eliminados por la política de retención")
+            if ultima.get("auditoria_archivada"):
+                st.caption(f"🗄️ {ultima['auditoria_archivada']:,} registro(s) de auditoría archivados")
+        else:
+            st.info("📭 Aún no se ha ejecutado ningún backup automático desde que arrancó la app.")
+        
+        automaticos = [b for b in list_backups() if b['name'].startswith(PREFIJO_AUTO + "_")]
+        st.caption(f"💾 {len(automaticos)} backup(s) automático(s) en disco · "
+                   f"{format_size(sum(b['size'] for b in automaticos))}")
\ No newline at end of file
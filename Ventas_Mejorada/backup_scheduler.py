@@ -0,0 +1,189 @@
+# backup_scheduler.py - Backups automáticos en segundo plano
+#
+# Mismo modelo que keep_alive.py: un único hilo daemon por proceso, iniciado
+# desde main(). El trabajo de backup nunca corre dentro del rerun de un
+# usuario; la página de Backups solo lee el estado que deja el hilo.
+#
+# Configuración por variables de entorno:
+#   VENTAS_BACKUP_FRECUENCIA  "hora", "dia" (defecto) u "off"
+#   VENTAS_BACKUP_HORA        hora del backup diario (defecto 2)
+#   VENTAS_BACKUP_HORAS       backups horarios a conservar (defecto 24)
+#   VENTAS_BACKUP_DIAS        backups diarios a conservar (defecto 7)
+#   VENTAS_BACKUP_SEMANAS     backups semanales a conservar (defecto 4)
+#
+# Antes de cada backup se archiva la auditoría antigua (audit_utils), así las
+# copias no arrastran historial que nadie consulta. Cada ciclo recorre todas
+# las tiendas (tiendas.py), cada una con su base y su carpeta de backups.
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from backup_manager import create_backup, delete_backup, list_backups, bases_con_incrementales, BACKUP_DIR
+from audit_utils import archivar_auditoria
+from tiendas import TIENDAS, tienda_actual, en_tienda
+
+PREFIJO_AUTO = "backup_auto"
+
+FRECUENCIA = os.environ.get("VENTAS_BACKUP_FRECUENCIA", "dia").lower()
+HORA_DIARIA = int(os.environ.get("VENTAS_BACKUP_HORA", "2"))
+RETENCION = {
+    "horas":   int(os.environ.get("VENTAS_BACKUP_HORAS", "24")),
+    "dias":    int(os.environ.get("VENTAS_BACKUP_DIAS", "7")),
+    "semanas": int(os.environ.get("VENTAS_BACKUP_SEMANAS", "4")),
+}
+_INTERVALO = {"hora": timedelta(hours=1), "dia": timedelta(days=1)}
+
+_scheduler_thread = None
+_scheduler_running = False
+_proxima = None
+_ultima = {}        # tienda -> dict con el resultado de su último backup automático
+
+
+def _siguiente(desde):
+    """Próximo instante programado después de `desde`."""
+    if FRECUENCIA == "hora":
+        return desde.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    objetivo = desde.replace(hour=HORA_DIARIA, minute=0, second=0, microsecond=0)
+    return objetivo if objetivo > desde else objetivo + timedelta(days=1)
+
+
+def _automaticos():
+    return [b for b in list_backups() if b["name"].startswith(PREFIJO_AUTO + "_")]
+
+
+def seleccionar_retencion(backups, horas, dias, semanas):
+    """
+    Nombres a conservar: el más reciente de cada una de las últimas `horas`
+    horas, `dias` días y `semanas` semanas que tengan backup.
+    """
+    ordenados = sorted(backups, key=lambda b: b["modified"], reverse=True)
+    conservar = set()
+    for limite, clave in (
+        (horas,   lambda d: (d.date(), d.hour)),
+        (dias,    lambda d: d.date()),
+        (semanas, lambda d: d.isocalendar()[:2]),
+    ):
+        vistos = set()
+        for b in ordenados:
+            k = clave(b["modified"])
+            if k in vistos:
+                continue
+            if len(vistos) >= limite:
+                break
+            vistos.add(k)
+            conservar.add(b["name"])
+    return conservar
+
+
+def podar_backups():
+    """Elimina los backups automáticos que ya no cubre la política de retención.
+
+    Un automático del que dependen incrementales (manifiestos de versiones
+    en que los automáticos iniciaban cadena) se conserva.
+    """
+    automaticos = _automaticos()
+    conservar = seleccionar_retencion(automaticos, **RETENCION) | bases_con_incrementales()
+    eliminados = 0
+    for b in automaticos:
+        if b["name"] not in conservar and delete_backup(b["name"])[0]:
+            eliminados += 1
+    return eliminados
+
+
+def ejecutar_backup_programado():
+    """Un ciclo completo de la tienda activa: archivo de auditoría + backup
+    online + poda. Devuelve el resumen."""
+    inicio = datetime.now()
+    try:
+        archivadas = archivar_auditoria()["filas"]
+    except Exception:
+        archivadas = 0   # el backup se hace igual
+    t0 = time.perf_counter()
+    ok, path, mensaje = create_backup(prefijo=PREFIJO_AUTO, iniciar_cadena=False)
+    segundos = time.perf_counter() - t0
+    _ultima[tienda_actual()] = resumen = {
+        "inicio":     inicio,
+        "segundos":   segundos,
+        "ok":         ok,
+        "archivo":    os.path.basename(path) if path else None,
+        "bytes":      os.path.getsize(path) if ok and os.path.exists(path) else 0,
+        "mensaje":    mensaje,
+        "eliminados": podar_backups() if ok else 0,
+        "auditoria_archivada": archivadas,
+    }
+    return resumen
+
+
+def _ejecutar_todas():
+    for codigo in TIENDAS:
+        with en_tienda(codigo):
+            inicio = datetime.now()
+            try:
+                ejecutar_backup_programado()
+            except Exception as e:
+                # Una tienda con problemas no frena a las demás, pero su
+                # página de Backups muestra el error.
+                _ultima[codigo] = {
+                    "inicio":     inicio,
+                    "segundos":   (datetime.now() - inicio).total_seconds(),
+                    "ok":         False,
+                    "archivo":    None,
+                    "bytes":      0,
+                    "mensaje":    f"❌ Error en el backup automático: {e}",
+                    "eliminados": 0,
+                    "auditoria_archivada": 0,
+                }
+
+
+def _bucle():
+    global _proxima
+    # Si el último backup automático es más viejo que el intervalo (la app
+    # estuvo dormida), se recupera el que faltó en lugar de esperar.
+    ultimo = None
+    for codigo in TIENDAS:
+        with en_tienda(codigo):
+            propio = max((b["modified"] for b in _automaticos()), default=None)
+        if propio is None:
+            ultimo = None
+            break
+        ultimo = propio if ultimo is None else min(ultimo, propio)
+    ahora = datetime.now()
+    if ultimo is None or ahora - ultimo >= _INTERVALO[FRECUENCIA]:
+        _proxima = ahora
+    else:
+        _proxima = _siguiente(ahora)
+
+    while _scheduler_running:
+        if datetime.now() >= _proxima:
+            try:
+                _ejecutar_todas()
+            except Exception:
+                pass   # el hilo nunca debe morir
+            _proxima = _siguiente(datetime.now())
+        time.sleep(30)
+
+
+def init_backup_scheduler():
+    """Inicializar el hilo de backups automáticos (una vez por proceso)"""
+    global _scheduler_thread, _scheduler_running
+    if FRECUENCIA not in _INTERVALO:
+        return
+    if _scheduler_thread is None or not _scheduler_thread.is_alive():
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        _scheduler_running = True
+        _scheduler_thread = threading.Thread(target=_bucle, daemon=True, name="backup-scheduler")
+        _scheduler_thread.start()
+
+
+def get_scheduler_status():
+    """Estado para la página de Backups (solo lectura), de la tienda activa"""
+    return {
+        "activo":     _scheduler_thread is not None and _scheduler_thread.is_alive(),
+        "frecuencia": FRECUENCIA,
+        "hora":       HORA_DIARIA,
+        "retencion":  dict(RETENCION),
+        "proxima":    _proxima,
+        "ultima":     _ultima.get(tienda_actual()),
+    }
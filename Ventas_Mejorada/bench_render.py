@@ -0,0 +1,116 @@
+"""Benchmark del render del ranking: una tarjeta por st.markdown vs. un bloque.
+
+Ejecuta cada variante como script de Streamlit (AppTest) con 50 y 200
+empleados y mide lo que se enviaría por el websocket: número de ForwardMsg
+de tipo delta y bytes serializados, además del tiempo de armar el HTML y del
+rerun completo.
+
+    python bench_render.py [n_empleados ...]
+"""
+import random
+import sys
+import time
+
+import pandas as pd
+from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+from streamlit.testing.v1 import AppTest
+
+from ui_components import html_ranking
+
+REPETICIONES = 5
+
+
+def empleados(n: int) -> pd.DataFrame:
+    rnd = random.Random(n)
+    df = pd.DataFrame({
+        "name":         [f"Empleado {i:03d}" for i in range(n)],
+        "department":   [rnd.choice(["Droguería", "Equipos Médicos", "Pasillos", "Cajas"]) for _ in range(n)],
+        "position":     ["Ais Cajas"] * n,
+        "goal":         [300] * n,
+        "total":        [rnd.randint(0, 450) for _ in range(n)],
+        "dias_activos": [rnd.randint(0, 26) for _ in range(n)],
+    })
+    return df.sort_values("total", ascending=False, ignore_index=True)
+
+
+def _antes(df):
+    """Render anterior: un st.markdown por empleado."""
+    import streamlit as st
+    for i, row in df.iterrows():
+        pos = i + 1
+        pct = row["total"] / row["goal"] * 100
+        medal = {1: "🥇", 2: "🥈", 3: "🥉"}.get(pos, f"#{pos}")
+        st.markdown(
+            f"""
+            <div class="rank-card">
+              <div class="rank-medal rank-{pos if pos <= 3 else 'n'}">{medal}</div>
+              <div class="rank-info">
+                <div class="rank-name">{row['name']}</div>
+                <div class="rank-dept">{row['department']} · {row['position']} · {int(row['dias_activos'])} días activos</div>
+                <div style="margin-top:6px">
+                  <div style="display:flex;justify-content:space-between;font-size:.72rem;color:var(--text-muted);margin-bottom:3px">
+                    <span>Meta: {int(row['goal']):,}</span><span>{pct:.1f}%</span>
+                  </div>
+                  <div style="background:var(--border);border-radius:999px;height:6px;overflow:hidden">
+                    <div style="width:{min(pct, 100)}%;height:100%;background:#1a56db;border-radius:999px"></div>
+                  </div>
+                </div>
+              </div>
+              <div style="text-align:right;flex-shrink:0">
+                <div class="rank-score">{int(row['total']):,}</div>
+                <div class="rank-score-label">unidades</div>
+              </div>
+            </div>
+            """,
+            unsafe_allow_html=True,
+        )
+
+
+def _ahora(df):
+    """Render actual: plantilla compilada y un único elemento."""
+    from ui_components import render_ranking_cards
+    render_ranking_cards(df)
+
+
+def medir(variante, df):
+    """(mensajes delta, bytes, ms por rerun) de una variante."""
+    enviados = []
+    original = ForwardMsgQueue.enqueue
+
+    def registrar(self, msg):
+        if msg.HasField("delta"):
+            enviados.append(msg.ByteSize())
+        return original(self, msg)
+
+    ForwardMsgQueue.enqueue = registrar
+    try:
+        tiempos = []
+        for _ in range(REPETICIONES):
+            enviados.clear()
+            at = AppTest.from_function(variante, args=(df,), default_timeout=60)
+            inicio = time.perf_counter()
+            at.run()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            if at.exception:
+                raise RuntimeError(at.exception[0].value)
+    finally:
+        ForwardMsgQueue.enqueue = original
+    return len(enviados), sum(enviados), min(tiempos)
+
+
+def main(tamanos):
+    print(f"{'empleados':>9} {'variante':<8} {'deltas':>7} {'bytes':>9} {'html ms':>8} {'rerun ms':>9}")
+    for n in tamanos:
+        df = empleados(n)
+        inicio = time.perf_counter()
+        for _ in range(REPETICIONES):
+            html_ranking(df)
+        html_ms = (time.perf_counter() - inicio) * 1000 / REPETICIONES
+        for nombre, variante in (("antes", _antes), ("ahora", _ahora)):
+            deltas, total, rerun_ms = medir(variante, df)
+            print(f"{n:>9} {nombre:<8} {deltas:>7} {total:>9,} "
+                  f"{f'{html_ms:.2f}' if nombre == 'ahora' else '-':>8} {rerun_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [50, 200])
@@ -0,0 +1,150 @@
+"""Calendario laboral y reporte de ausencias.
+
+`calendario` tiene una fila por día (se rellena bajo demanda) con el día de
+la semana y la marca de festivo, que mantienen los triggers de `festivos`.
+Un día laborable es un día de DIAS_LABORABLES que no es festivo.
+
+El reporte cruza empleados × días laborables contra `sales` en una sola
+consulta: el anti-join usa el índice único (employee_id, date) y las
+rachas salen de agrupar los días faltantes consecutivos (n - ROW_NUMBER()
+es constante dentro de una racha). Como los empleados no tienen fecha de
+ingreso, cada uno se cuenta desde su primer registro.
+"""
+import os
+from datetime import date
+
+import pandas as pd
+
+from database import get_connection, registrar_consulta
+from utils import safe_dataframe, execute_insert, execute_query, invalidar_cache
+
+# Días de la semana que se trabajan (0 = lunes ... 6 = domingo)
+DIAS_LABORABLES = tuple(sorted({
+    int(d) for d in os.environ.get("VENTAS_DIAS_LABORABLES", "0,1,2,3,4,5").split(",")
+    if d.strip().isdigit() and int(d) < 7
+}))
+
+
+def asegurar_calendario(desde: date, hasta: date):
+    """Crea las filas de `calendario` que falten entre desde y hasta."""
+    esperados = (hasta - desde).days + 1
+    if esperados <= 0:
+        return
+    conn = get_connection()
+    hay = conn.execute("SELECT COUNT(*) FROM calendario WHERE fecha BETWEEN ? AND ?",
+                       (str(desde), str(hasta))).fetchone()[0]
+    if hay >= esperados:
+        return
+    conn.execute("""
+        WITH RECURSIVE d(f) AS (
+            SELECT date(?) UNION ALL SELECT date(f, '+1 day') FROM d WHERE f < date(?)
+        )
+        INSERT OR IGNORE INTO calendario (fecha, dia_semana, festivo)
+        SELECT f, (CAST(strftime('%w', f) AS INTEGER) + 6) % 7,
+               EXISTS (SELECT 1 FROM festivos WHERE fecha = f)
+        FROM d
+    """, (str(desde), str(hasta)))
+    conn.commit()
+    invalidar_cache("calendario")
+
+
+# ── Festivos ──────────────────────────────────────────────────────────
+def listar_festivos() -> pd.DataFrame:
+    return safe_dataframe("SELECT fecha, nombre FROM festivos ORDER BY fecha DESC")
+
+
+def agregar_festivo(fecha: date, nombre: str = "") -> bool:
+    return execute_insert(
+        "INSERT INTO festivos (fecha, nombre) VALUES (?, ?) "
+        "ON CONFLICT(fecha) DO UPDATE SET nombre = excluded.nombre",
+        (str(fecha), nombre.strip()), audit_action=f"Festivo agregado: {fecha}",
+    )
+
+
+def quitar_festivo(fecha) -> bool:
+    return execute_insert("DELETE FROM festivos WHERE fecha = ?", (str(fecha),),
+                          audit_action=f"Festivo eliminado: {fecha}")
+
+
+# ── Reporte ───────────────────────────────────────────────────────────
+def _sql_dias():
+    dias = ", ".join(str(d) for d in DIAS_LABORABLES) or "-1"
+    return f"""
+        SELECT fecha, ROW_NUMBER() OVER (ORDER BY fecha) n
+        FROM calendario
+        WHERE fecha BETWEEN ? AND ? AND festivo = 0 AND dia_semana IN ({dias})
+    """
+
+
+def _rango(desde: date, hasta: date):
+    hasta = min(hasta, date.today())
+    asegurar_calendario(desde, hasta)
+    return str(desde), str(hasta)
+
+
+def _sql_reporte(desde: str, hasta: str, depto: str = None):
+    params = [desde, hasta]
+    filtro = ""
+    if depto:
+        filtro = "WHERE e.department = ?"
+        params.append(depto)
+    return f"""
+        WITH dias AS ({_sql_dias()}),
+        emp AS (
+            SELECT e.id, e.name, e.department,
+                   (SELECT MIN(date) FROM sales s WHERE s.employee_id = e.id) primero,
+                   (SELECT MAX(date) FROM sales s WHERE s.employee_id = e.id) ultimo
+            FROM employees e {filtro}
+        ),
+        faltas AS (
+            SELECT emp.id, d.n,
+                   d.n - ROW_NUMBER() OVER (PARTITION BY emp.id ORDER BY d.n) grupo
+            FROM emp JOIN dias d ON emp.primero IS NULL OR d.fecha >= emp.primero
+            WHERE NOT EXISTS (SELECT 1 FROM sales s WHERE s.employee_id = emp.id AND s.date = d.fecha)
+        ),
+        rachas AS (
+            SELECT id, COUNT(*) largo, MAX(n) fin FROM faltas GROUP BY id, grupo
+        )
+        SELECT emp.id, emp.name, emp.department,
+               (SELECT COUNT(*) FROM dias d WHERE emp.primero IS NULL OR d.fecha >= emp.primero) laborables,
+               COALESCE(SUM(r.largo), 0) dias_sin_registro,
+               COALESCE(MAX(r.largo), 0) racha_max,
+               COALESCE(MAX(CASE WHEN r.fin = (SELECT MAX(n) FROM dias) THEN r.largo END), 0) racha_actual,
+               emp.ultimo ultimo_registro
+        FROM emp LEFT JOIN rachas r ON r.id = emp.id
+        GROUP BY emp.id
+        ORDER BY racha_actual DESC, dias_sin_registro DESC, emp.name
+    """, params
+
+
+def _sql_detalle(desde: str, hasta: str, employee_id: int):
+    return f"""
+        WITH dias AS ({_sql_dias()})
+        SELECT d.fecha FROM dias d
+        WHERE d.fecha >= COALESCE((SELECT MIN(date) FROM sales WHERE employee_id = ?), d.fecha)
+          AND NOT EXISTS (SELECT 1 FROM sales s WHERE s.employee_id = ? AND s.date = d.fecha)
+        ORDER BY d.fecha
+    """, (desde, hasta, employee_id, employee_id)
+
+
+registrar_consulta("ausencias", lambda: _sql_reporte("2024-01-01", "2024-12-31", "Droguería"))
+registrar_consulta("ausencias_detalle", lambda: _sql_detalle("2024-01-01", "2024-12-31", 1))
+
+
+def reporte_ausencias(desde: date, hasta: date, depto: str = None) -> pd.DataFrame:
+    """
+    Por empleado: días laborables del rango (desde su primer registro),
+    días sin registro, racha más larga, racha vigente al cierre del rango,
+    último registro y % de asistencia. `hasta` no pasa de hoy.
+    """
+    df = safe_dataframe(*_sql_reporte(*_rango(desde, hasta), depto))
+    if not df.empty:
+        df["pct_asistencia"] = ((df["laborables"] - df["dias_sin_registro"])
+                                / df["laborables"].where(df["laborables"] > 0) * 100).round(1).fillna(100.0)
+    return df
+
+
+def detalle_ausencias(employee_id: int, desde: date, hasta: date) -> list:
+    """Días laborables del rango sin registro del empleado (desde su primer registro)."""
+    filas = execute_query(*_sql_detalle(*_rango(desde, hasta), employee_id))
+    return [date.fromisoformat(f[0]) for f in filas]
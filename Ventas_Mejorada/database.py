@@ -1,20 +1,413 @@
 import sqlite3
 import os
+import re
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+from query_cache import cache as _query_cache
+from tiendas import tienda_actual, en_tienda, ruta as ruta_tienda
+
 DB_PATH = "ventas.db"
 
 
+class ConnectionPool:
+    """Una conexión SQLite de larga vida por hilo de Streamlit.
+
+    Los PRAGMA se aplican una sola vez al abrir; cada entrega hace un
+    chequeo de salud barato y reabre si la conexión quedó inutilizable.
+    Mientras un hilo tiene el pool en exclusivo() los demás esperan en
+    acquire() en lugar de abrir conexiones nuevas.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = {}        # ident del hilo -> (hilo, conexión)
+        self._generation = 0    # se incrementa en close_all()
+        self._libre = threading.Condition(self._lock)
+        self._dueno = None      # hilo con el pool en exclusivo()
+        self._nivel = 0
+        self.opened = 0
+        self.reused = 0
+        self.closed = 0
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")   # mejor concurrencia
+        conn.execute("PRAGMA foreign_keys=ON")     # integridad referencial
+        return conn
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self.closed += 1
+
+    def _prune_dead_threads(self):
+        """Cierra conexiones de hilos que ya terminaron (reruns anteriores)."""
+        for ident, (thread, conn) in list(self._conns.items()):
+            if not thread.is_alive():
+                del self._conns[ident]
+                self._close(conn)
+
+    def acquire(self):
+        ident = threading.get_ident()
+        conn = getattr(self._local, "conn", None)
+        if (conn is not None
+                and self._dueno in (None, ident)
+                and self._local.generation == self._generation
+                and self._healthy(conn)):
+            with self._lock:
+                self.reused += 1
+            return conn
+
+        with self._lock:
+            while self._dueno not in (None, ident):
+                self._libre.wait()
+            if (conn is not None
+                    and self._local.generation == self._generation
+                    and self._healthy(conn)):
+                self.reused += 1
+                return conn
+            stale = self._conns.pop(ident, None)
+            if stale is not None:
+                self._close(stale[1])
+            self._prune_dead_threads()
+            conn = self._open()
+            self._conns[ident] = (threading.current_thread(), conn)
+            self._local.conn = conn
+            self._local.generation = self._generation
+            self.opened += 1
+        return conn
+
+    @contextmanager
+    def exclusivo(self):
+        """Solo el hilo actual obtiene conexiones durante el bloque (reentrante)."""
+        ident = threading.get_ident()
+        with self._libre:
+            while self._dueno not in (None, ident):
+                self._libre.wait()
+            self._dueno = ident
+            self._nivel += 1
+        try:
+            yield
+        finally:
+            with self._libre:
+                self._nivel -= 1
+                if self._nivel == 0:
+                    self._dueno = None
+                    self._libre.notify_all()
+
+    def close_all(self):
+        """Cierra todas las conexiones; cada hilo reabre en su próximo uso."""
+        with self._lock:
+            for _, conn in self._conns.values():
+                self._close(conn)
+            self._conns.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "abiertas":    self.opened,
+                "reutilizadas": self.reused,
+                "cerradas":    self.closed,
+                "activas":     len(self._conns),
+            }
+
+
+# ── Enrutado por tienda ───────────────────────────────────────────────
+# Un pool por tienda (tiendas.py); la primera conexión a una tienda crea o
+# migra su esquema.
+_pools = {}                       # código de tienda -> ConnectionPool
+_pools_lock = threading.Lock()
+_init_lock = threading.RLock()
+_inicializadas = set()
+_inicializando = set()
+
+
+def ruta_db(codigo: str = None) -> str:
+    """Archivo SQLite de la tienda (por defecto, la activa)."""
+    return ruta_tienda(DB_PATH, codigo)
+
+
+def _pool_de(codigo: str) -> ConnectionPool:
+    with _pools_lock:
+        pool = _pools.get(codigo)
+        if pool is None:
+            pool = _pools[codigo] = ConnectionPool(ruta_db(codigo))
+        return pool
+
+
 def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")   # mejor concurrencia
-    conn.execute("PRAGMA foreign_keys=ON")     # integridad referencial
-    return conn
+    """Conexión del hilo actual a la tienda activa. No cerrarla: pertenece al pool."""
+    codigo = tienda_actual()
+    if codigo not in _inicializadas:
+        with _init_lock:
+            if codigo not in _inicializadas and codigo not in _inicializando:
+                _inicializando.add(codigo)
+                try:
+                    init_database()
+                    _inicializadas.add(codigo)
+                finally:
+                    _inicializando.discard(codigo)
+    return _pool_de(codigo).acquire()
 
 
-def create_tables():
-    conn = get_connection()
+def close_all_connections():
+    """Cierra las conexiones de la tienda activa (p. ej. antes de restaurarla)."""
+    _pool_de(tienda_actual()).close_all()
+
+
+def _cerrar_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+
+atexit.register(_cerrar_pools)
+
+
+def pool_stats():
+    return _pool_de(tienda_actual()).stats()
+
+
+# ── Tablas de agregados (rollups) ─────────────────────────────────────
+# Mantenidas por triggers sobre `sales` y `employees`; se pueden regenerar
+# completas con rebuild_rollups().
+ROLLUP_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sales_daily (
+        employee_id    INTEGER NOT NULL,
+        date           DATE    NOT NULL,
+        autoliquidable INTEGER NOT NULL DEFAULT 0,
+        oferta         INTEGER NOT NULL DEFAULT 0,
+        marca          INTEGER NOT NULL DEFAULT 0,
+        adicional      INTEGER NOT NULL DEFAULT 0,
+        total          INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (employee_id, date),
+        FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS sales_monthly (
+        employee_id    INTEGER NOT NULL,
+        month          TEXT    NOT NULL,          -- 'YYYY-MM'
+        autoliquidable INTEGER NOT NULL DEFAULT 0,
+        oferta         INTEGER NOT NULL DEFAULT 0,
+        marca          INTEGER NOT NULL DEFAULT 0,
+        adicional      INTEGER NOT NULL DEFAULT 0,
+        total          INTEGER NOT NULL DEFAULT 0,
+        dias           INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (employee_id, month),
+        FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS sales_dept_monthly (
+        department     TEXT    NOT NULL,
+        month          TEXT    NOT NULL,
+        autoliquidable INTEGER NOT NULL DEFAULT 0,
+        oferta         INTEGER NOT NULL DEFAULT 0,
+        marca          INTEGER NOT NULL DEFAULT 0,
+        adicional      INTEGER NOT NULL DEFAULT 0,
+        total          INTEGER NOT NULL DEFAULT 0,
+        dias           INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (department, month)
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_sales_rollup_insert AFTER INSERT ON sales
+    BEGIN
+        INSERT INTO sales_daily (employee_id, date, autoliquidable, oferta, marca, adicional, total)
+        VALUES (NEW.employee_id, NEW.date,
+                IFNULL(NEW.autoliquidable,0), IFNULL(NEW.oferta,0), IFNULL(NEW.marca,0), IFNULL(NEW.adicional,0),
+                IFNULL(NEW.autoliquidable,0)+IFNULL(NEW.oferta,0)+IFNULL(NEW.marca,0)+IFNULL(NEW.adicional,0))
+        ON CONFLICT (employee_id, date) DO UPDATE SET
+            autoliquidable = autoliquidable + excluded.autoliquidable,
+            oferta         = oferta         + excluded.oferta,
+            marca          = marca          + excluded.marca,
+            adicional      = adicional      + excluded.adicional,
+            total          = total          + excluded.total;
+
+        INSERT INTO sales_monthly (employee_id, month, autoliquidable, oferta, marca, adicional, total, dias)
+        VALUES (NEW.employee_id, substr(NEW.date,1,7),
+                IFNULL(NEW.autoliquidable,0), IFNULL(NEW.oferta,0), IFNULL(NEW.marca,0), IFNULL(NEW.adicional,0),
+                IFNULL(NEW.autoliquidable,0)+IFNULL(NEW.oferta,0)+IFNULL(NEW.marca,0)+IFNULL(NEW.adicional,0), 1)
+        ON CONFLICT (employee_id, month) DO UPDATE SET
+            autoliquidable = autoliquidable + excluded.autoliquidable,
+            oferta         = oferta         + excluded.oferta,
+            marca          = marca          + excluded.marca,
+            adicional      = adicional      + excluded.adicional,
+            total          = total          + excluded.total,
+            dias           = dias + 1;
+
+        INSERT INTO sales_dept_monthly (department, month, autoliquidable, oferta, marca, adicional, total, dias)
+        SELECT IFNULL(e.department,''), substr(NEW.date,1,7),
+               IFNULL(NEW.autoliquidable,0), IFNULL(NEW.oferta,0), IFNULL(NEW.marca,0), IFNULL(NEW.adicional,0),
+               IFNULL(NEW.autoliquidable,0)+IFNULL(NEW.oferta,0)+IFNULL(NEW.marca,0)+IFNULL(NEW.adicional,0), 1
+        FROM employees e WHERE e.id = NEW.employee_id
+        ON CONFLICT (department, month) DO UPDATE SET
+            autoliquidable = autoliquidable + excluded.autoliquidable,
+            oferta         = oferta         + excluded.oferta,
+            marca          = marca          + excluded.marca,
+            adicional      = adicional      + excluded.adicional,
+            total          = total          + excluded.total,
+            dias           = dias + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_sales_rollup_delete AFTER DELETE ON sales
+    BEGIN
+        DELETE FROM sales_daily WHERE employee_id = OLD.employee_id AND date = OLD.date;
+
+        UPDATE sales_monthly SET
+            autoliquidable = autoliquidable - IFNULL(OLD.autoliquidable,0),
+            oferta         = oferta         - IFNULL(OLD.oferta,0),
+            marca          = marca          - IFNULL(OLD.marca,0),
+            adicional      = adicional      - IFNULL(OLD.adicional,0),
+            total          = total - (IFNULL(OLD.autoliquidable,0)+IFNULL(OLD.oferta,0)+IFNULL(OLD.marca,0)+IFNULL(OLD.adicional,0)),
+            dias           = dias - 1
+        WHERE employee_id = OLD.employee_id AND month = substr(OLD.date,1,7);
+        DELETE FROM sales_monthly WHERE employee_id = OLD.employee_id AND month = substr(OLD.date,1,7) AND dias <= 0;
+
+        -- En un borrado en cascada el empleado ya no existe: lo resta trg_employees_rollup_delete
+        UPDATE sales_dept_monthly SET
+            autoliquidable = autoliquidable - IFNULL(OLD.autoliquidable,0),
+            oferta         = oferta         - IFNULL(OLD.oferta,0),
+            marca          = marca          - IFNULL(OLD.marca,0),
+            adicional      = adicional      - IFNULL(OLD.adicional,0),
+            total          = total - (IFNULL(OLD.autoliquidable,0)+IFNULL(OLD.oferta,0)+IFNULL(OLD.marca,0)+IFNULL(OLD.adicional,0)),
+            dias           = dias - 1
+        WHERE department = (SELECT IFNULL(department,'') FROM employees WHERE id = OLD.employee_id)
+          AND month = substr(OLD.date,1,7);
+        DELETE FROM sales_dept_monthly WHERE dias <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_sales_rollup_update
+    AFTER UPDATE OF employee_id, date, autoliquidable, oferta, marca, adicional ON sales
+    BEGIN
+        UPDATE sales_daily SET
+            autoliquidable = autoliquidable - IFNULL(OLD.autoliquidable,0),
+            oferta         = oferta         - IFNULL(OLD.oferta,0),
+            marca          = marca          - IFNULL(OLD.marca,0),
+            adicional      = adicional      - IFNULL(OLD.adicional,0),
+            total          = total - (IFNULL(OLD.autoliquidable,0)+IFNULL(OLD.oferta,0)+IFNULL(OLD.marca,0)+IFNULL(OLD.adicional,0))
+        WHERE employee_id = OLD.employee_id AND date = OLD.date;
+        DELETE FROM sales_daily
+        WHERE employee_id = OLD.employee_id AND date = OLD.date
+          AND (OLD.employee_id IS NOT NEW.employee_id OR OLD.date IS NOT NEW.date);
+        INSERT INTO sales_daily (employee_id, date, autoliquidable, oferta, marca, adicional, total)
+        VALUES (NEW.employee_id, NEW.date,
+                IFNULL(NEW.autoliquidable,0), IFNULL(NEW.oferta,0), IFNULL(NEW.marca,0), IFNULL(NEW.adicional,0),
+                IFNULL(NEW.autoliquidable,0)+IFNULL(NEW.oferta,0)+IFNULL(NEW.marca,0)+IFNULL(NEW.adicional,0))
+        ON CONFLICT (employee_id, date) DO UPDATE SET
+            autoliquidable = autoliquidable + excluded.autoliquidable,
+            oferta         = oferta         + excluded.oferta,
+            marca          = marca          + excluded.marca,
+            adicional      = adicional      + excluded.adicional,
+            total          = total          + excluded.total;
+
+        UPDATE sales_monthly SET
+            autoliquidable = autoliquidable - IFNULL(OLD.autoliquidable,0),
+            oferta         = oferta         - IFNULL(OLD.oferta,0),
+            marca          = marca          - IFNULL(OLD.marca,0),
+            adicional      = adicional      - IFNULL(OLD.adicional,0),
+            total          = total - (IFNULL(OLD.autoliquidable,0)+IFNULL(OLD.oferta,0)+IFNULL(OLD.marca,0)+IFNULL(OLD.adicional,0)),
+            dias           = dias - 1
+        WHERE employee_id = OLD.employee_id AND month = substr(OLD.date,1,7);
+        INSERT INTO sales_monthly (employee_id, month, autoliquidable, oferta, marca, adicional, total, dias)
+        VALUES (NEW.employee_id, substr(NEW.date,1,7),
+                IFNULL(NEW.autoliquidable,0), IFNULL(NEW.oferta,0), IFNULL(NEW.marca,0), IFNULL(NEW.adicional,0),
+                IFNULL(NEW.autoliquidable,0)+IFNULL(NEW.oferta,0)+IFNULL(NEW.marca,0)+IFNULL(NEW.adicional,0), 1)
+        ON CONFLICT (employee_id, month) DO UPDATE SET
+            autoliquidable = autoliquidable + excluded.autoliquidable,
+            oferta         = oferta         + excluded.oferta,
+            marca          = marca          + excluded.marca,
+            adicional      = adicional      + excluded.adicional,
+            total          = total          + excluded.total,
+            dias           = dias + 1;
+        DELETE FROM sales_monthly WHERE employee_id = OLD.employee_id AND month = substr(OLD.date,1,7) AND dias <= 0;
+
+        UPDATE sales_dept_monthly SET
+            autoliquidable = autoliquidable - IFNULL(OLD.autoliquidable,0),
+            oferta         = oferta         - IFNULL(OLD.oferta,0),
+            marca          = marca          - IFNULL(OLD.marca,0),
+            adicional      = adicional      - IFNULL(OLD.adicional,0),
+            total          = total - (IFNULL(OLD.autoliquidable,0)+IFNULL(OLD.oferta,0)+IFNULL(OLD.marca,0)+IFNULL(OLD.adicional,0)),
+            dias           = dias - 1
+        WHERE department = (SELECT IFNULL(department,'') FROM employees WHERE id = OLD.employee_id)
+          AND month = substr(OLD.date,1,7);
+        INSERT INTO sales_dept_monthly (department, month, autoliquidable, oferta, marca, adicional, total, dias)
+        SELECT IFNULL(e.department,''), substr(NEW.date,1,7),
+               IFNULL(NEW.autoliquidable,0), IFNULL(NEW.oferta,0), IFNULL(NEW.marca,0), IFNULL(NEW.adicional,0),
+               IFNULL(NEW.autoliquidable,0)+IFNULL(NEW.oferta,0)+IFNULL(NEW.marca,0)+IFNULL(NEW.adicional,0), 1
+        FROM employees e WHERE e.id = NEW.employee_id
+        ON CONFLICT (department, month) DO UPDATE SET
+            autoliquidable = autoliquidable + excluded.autoliquidable,
+            oferta         = oferta         + excluded.oferta,
+            marca          = marca          + excluded.marca,
+            adicional      = adicional      + excluded.adicional,
+            total          = total          + excluded.total,
+            dias           = dias + 1;
+        DELETE FROM sales_dept_monthly WHERE dias <= 0;
+    END;
+
+    -- Cambio de departamento: mover los meses del empleado al nuevo departamento
+    CREATE TRIGGER IF NOT EXISTS trg_employees_rollup_department
+    AFTER UPDATE OF department ON employees
+    WHEN IFNULL(OLD.department,'') <> IFNULL(NEW.department,'')
+    BEGIN
+        UPDATE sales_dept_monthly SET
+            autoliquidable = autoliquidable - IFNULL((SELECT m.autoliquidable FROM sales_monthly m WHERE m.employee_id = NEW.id AND m.month = sales_dept_monthly.month),0),
+            oferta         = oferta         - IFNULL((SELECT m.oferta         FROM sales_monthly m WHERE m.employee_id = NEW.id AND m.month = sales_dept_monthly.month),0),
+            marca          = marca          - IFNULL((SELECT m.marca          FROM sales_monthly m WHERE m.employee_id = NEW.id AND m.month = sales_dept_monthly.month),0),
+            adicional      = adicional      - IFNULL((SELECT m.adicional      FROM sales_monthly m WHERE m.employee_id = NEW.id AND m.month = sales_dept_monthly.month),0),
+            total          = total          - IFNULL((SELECT m.total          FROM sales_monthly m WHERE m.employee_id = NEW.id AND m.month = sales_dept_monthly.month),0),
+            dias           = dias           - IFNULL((SELECT m.dias           FROM sales_monthly m WHERE m.employee_id = NEW.id AND m.month = sales_dept_monthly.month),0)
+        WHERE department = IFNULL(OLD.department,'');
+        DELETE FROM sales_dept_monthly WHERE dias <= 0;
+
+        INSERT INTO sales_dept_monthly (department, month, autoliquidable, oferta, marca, adicional, total, dias)
+        SELECT IFNULL(NEW.department,''), m.month, m.autoliquidable, m.oferta, m.marca, m.adicional, m.total, m.dias
+        FROM sales_monthly m WHERE m.employee_id = NEW.id
+        ON CONFLICT (department, month) DO UPDATE SET
+            autoliquidable = autoliquidable + excluded.autoliquidable,
+            oferta         = oferta         + excluded.oferta,
+            marca          = marca          + excluded.marca,
+            adicional      = adicional      + excluded.adicional,
+            total          = total          + excluded.total,
+            dias           = dias           + excluded.dias;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_employees_rollup_delete BEFORE DELETE ON employees
+    BEGIN
+        UPDATE sales_dept_monthly SET
+            autoliquidable = autoliquidable - IFNULL((SELECT m.autoliquidable FROM sales_monthly m WHERE m.employee_id = OLD.id AND m.month = sales_dept_monthly.month),0),
+            oferta         = oferta         - IFNULL((SELECT m.oferta         FROM sales_monthly m WHERE m.employee_id = OLD.id AND m.month = sales_dept_monthly.month),0),
+            marca          = marca          - IFNULL((SELECT m.marca          FROM sales_monthly m WHERE m.employee_id = OLD.id AND m.month = sales_dept_monthly.month),0),
+            adicional      = adicional      - IFNULL((SELECT m.adicional      FROM sales_monthly m WHERE m.employee_id = OLD.id AND m.month = sales_dept_monthly.month),0),
+            total          = total          - IFNULL((SELECT m.total          FROM sales_monthly m WHERE m.employee_id = OLD.id AND m.month = sales_dept_monthly.month),0),
+            dias           = dias           - IFNULL((SELECT m.dias           FROM sales_monthly m WHERE m.employee_id = OLD.id AND m.month = sales_dept_monthly.month),0)
+        WHERE department = IFNULL(OLD.department,'');
+        DELETE FROM sales_dept_monthly WHERE dias <= 0;
+    END;
+"""
+
+
+def create_tables(conn=None):
+    conn = conn or get_connection()
     cur = conn.cursor()
 
     cur.executescript("""
@@ -71,13 +464,13 @@ def create_tables():
             created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
     """)
+    cur.executescript(ROLLUP_SCHEMA)
 
     conn.commit()
-    conn.close()
 
 
-def migrate_database():
-    conn = get_connection()
+def migrate_database(conn=None):
+    conn = conn or get_connection()
     cur = conn.cursor()
 
     migrations = [
@@ -106,11 +499,200 @@ def migrate_database():
     """)
 
     conn.commit()
-    conn.close()
+
+    apply_schema_migrations(conn)
+
+    # BD anterior a los rollups: poblarlos una única vez desde `sales`
+    tiene_ventas = cur.execute("SELECT 1 FROM sales LIMIT 1").fetchone()
+    tiene_rollup = cur.execute("SELECT 1 FROM sales_daily LIMIT 1").fetchone()
+    if tiene_ventas and not tiene_rollup:
+        rebuild_rollups(conn)
+
+
+# ── Migraciones versionadas (PRAGMA user_version) ────────────────────
+# Cada entrada se aplica una sola vez, en orden; nunca editar una ya publicada.
+SCHEMA_MIGRATIONS = [
+    (1, [
+        # Dashboard / reportes filtran solo por rango de fechas
+        "CREATE INDEX IF NOT EXISTS idx_sales_date ON sales (date)",
+        """CREATE INDEX IF NOT EXISTS idx_sales_daily_date
+           ON sales_daily (date, employee_id, autoliquidable, oferta, marca, adicional, total)""",
+        "CREATE INDEX IF NOT EXISTS idx_sales_monthly_month ON sales_monthly (month, employee_id, total, dias)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_dept_monthly_month ON sales_dept_monthly (month)",
+        "CREATE INDEX IF NOT EXISTS idx_afiliaciones_fecha ON afiliaciones (fecha, employee_id, cantidad)",
+        # Auditoría: ORDER BY created_at DESC LIMIT n
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_created ON audit_log (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_employees_department ON employees (department)",
+        # Empleados pendientes de usuario, ordenados por nombre
+        "CREATE INDEX IF NOT EXISTS idx_employees_sin_usuario ON employees (name) WHERE user_id IS NULL",
+    ]),
+    (2, [
+        # Backups incrementales: filas modificadas desde la última marca.
+        # ALTER TABLE no admite DEFAULT CURRENT_TIMESTAMP; lo mantiene un
+        # trigger, salvo que la escritura traiga su propio updated_at (restaurar).
+        "ALTER TABLE afiliaciones ADD COLUMN updated_at TIMESTAMP",
+        """CREATE TRIGGER IF NOT EXISTS trg_afiliaciones_updated_at
+           AFTER UPDATE OF cantidad ON afiliaciones
+           WHEN NEW.cantidad IS NOT OLD.cantidad AND NEW.updated_at IS OLD.updated_at
+           BEGIN
+               UPDATE afiliaciones SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+           END""",
+        "CREATE INDEX IF NOT EXISTS idx_sales_updated ON sales (updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_afiliaciones_updated ON afiliaciones (updated_at)",
+    ]),
+    (3, [
+        # Auditoría: filtros por usuario/tabla paginados por (created_at, id)
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_user ON audit_log (username, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_tabla ON audit_log (table_name, created_at)",
+        # Búsqueda de texto completo. Tabla de contenido externo: el índice
+        # apunta a las filas de audit_log y los triggers lo mantienen al día.
+        """CREATE VIRTUAL TABLE IF NOT EXISTS audit_log_fts USING fts5(
+               username, action, table_name, detail,
+               content='audit_log', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')""",
+        """CREATE TRIGGER IF NOT EXISTS trg_audit_fts_insert AFTER INSERT ON audit_log BEGIN
+               INSERT INTO audit_log_fts (rowid, username, action, table_name, detail)
+               VALUES (NEW.id, NEW.username, NEW.action, NEW.table_name, NEW.detail);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_audit_fts_delete AFTER DELETE ON audit_log BEGIN
+               INSERT INTO audit_log_fts (audit_log_fts, rowid, username, action, table_name, detail)
+               VALUES ('delete', OLD.id, OLD.username, OLD.action, OLD.table_name, OLD.detail);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_audit_fts_update AFTER UPDATE ON audit_log BEGIN
+               INSERT INTO audit_log_fts (audit_log_fts, rowid, username, action, table_name, detail)
+               VALUES ('delete', OLD.id, OLD.username, OLD.action, OLD.table_name, OLD.detail);
+               INSERT INTO audit_log_fts (rowid, username, action, table_name, detail)
+               VALUES (NEW.id, NEW.username, NEW.action, NEW.table_name, NEW.detail);
+           END""",
+        "INSERT INTO audit_log_fts (audit_log_fts) VALUES ('rebuild')",
+    ]),
+    (4, [
+        # Calendario laboral para el reporte de ausencias (calendario.py).
+        # Una fila por día; los festivos se marcan por trigger.
+        """CREATE TABLE IF NOT EXISTS festivos (
+               fecha   DATE PRIMARY KEY,
+               nombre  TEXT NOT NULL DEFAULT ''
+           )""",
+        """CREATE TABLE IF NOT EXISTS calendario (
+               fecha       DATE PRIMARY KEY,
+               dia_semana  INTEGER NOT NULL,            -- 0 = lunes
+               festivo     INTEGER NOT NULL DEFAULT 0
+           ) WITHOUT ROWID""",
+        """CREATE TRIGGER IF NOT EXISTS trg_festivos_insert AFTER INSERT ON festivos BEGIN
+               UPDATE calendario SET festivo = 1 WHERE fecha = NEW.fecha;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_festivos_delete AFTER DELETE ON festivos BEGIN
+               UPDATE calendario SET festivo = 0 WHERE fecha = OLD.fecha;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_festivos_update AFTER UPDATE OF fecha ON festivos BEGIN
+               UPDATE calendario SET festivo = 0 WHERE fecha = OLD.fecha;
+               UPDATE calendario SET festivo = 1 WHERE fecha = NEW.fecha;
+           END""",
+    ]),
+]
 
 
-def verify_database():
+def apply_schema_migrations(conn=None):
+    conn = conn or get_connection()
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, statements in SCHEMA_MIGRATIONS:
+        if target <= version:
+            continue
+        # BEGIN explícito: sqlite3 ejecuta el DDL en autocommit y un rollback
+        # no desharía los pasos ya aplicados (p. ej. un ADD COLUMN).
+        conn.execute("BEGIN")
+        try:
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {int(target)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    conn.execute("PRAGMA optimize")   # estadísticas para el planificador
+    return version
+
+
+# ── Verificación de planes de consulta ───────────────────────────────
+# Cada módulo registra aquí las consultas de sus páginas con el mismo
+# constructor que usan ellas (al importarse). Ninguna debe recorrer una de
+# las tablas grandes: ni SCAN de la tabla ni SCAN de un índice completo.
+TABLAS_GRANDES = {"sales", "sales_daily", "sales_monthly", "afiliaciones", "audit_log"}
+
+QUERY_PLAN_CHECKS = {}   # nombre -> función sin argumentos que devuelve (sql, params)
+
+
+def registrar_consulta(nombre, construir):
+    """Registra una consulta para check_query_plans(); `construir()`
+    devuelve (sql, params) armados como los arma la página."""
+    QUERY_PLAN_CHECKS[nombre] = construir
+
+
+def check_query_plans():
+    """EXPLAIN QUERY PLAN de cada consulta registrada.
+
+    Devuelve {nombre: [pasos que recorren completa una tabla grande]};
+    un dict vacío significa que todas buscan por índice.
+    """
     conn = get_connection()
+    problemas = {}
+    for nombre, construir in QUERY_PLAN_CHECKS.items():
+        sql, params = construir()
+        # El plan nombra las tablas por su alias
+        alias = {t: t for t in TABLAS_GRANDES}
+        for tabla, al in re.findall(r"(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+)", sql, re.I):
+            if al.upper() not in ("WHERE", "ON", "JOIN", "LEFT", "GROUP", "ORDER", "LIMIT"):
+                alias[al] = tabla
+        malos = []
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", list(params)):
+            detalle = row[3]
+            partes = detalle.split()
+            # "SCAN t USING (COVERING) INDEX i" también lee la tabla entera
+            if len(partes) >= 2 and partes[0] == "SCAN" and alias.get(partes[1]) in TABLAS_GRANDES:
+                malos.append(detalle)
+        if malos:
+            problemas[nombre] = malos
+    return problemas
+
+
+def rebuild_rollups(conn=None):
+    """Regenera sales_daily, sales_monthly y sales_dept_monthly desde `sales`."""
+    conn = conn or get_connection()
+    try:
+        conn.executescript("""
+            BEGIN;
+            DELETE FROM sales_daily;
+            DELETE FROM sales_monthly;
+            DELETE FROM sales_dept_monthly;
+
+            INSERT INTO sales_daily (employee_id, date, autoliquidable, oferta, marca, adicional, total)
+            SELECT employee_id, date,
+                   SUM(IFNULL(autoliquidable,0)), SUM(IFNULL(oferta,0)),
+                   SUM(IFNULL(marca,0)), SUM(IFNULL(adicional,0)),
+                   SUM(IFNULL(autoliquidable,0)+IFNULL(oferta,0)+IFNULL(marca,0)+IFNULL(adicional,0))
+            FROM sales GROUP BY employee_id, date;
+
+            INSERT INTO sales_monthly (employee_id, month, autoliquidable, oferta, marca, adicional, total, dias)
+            SELECT employee_id, substr(date,1,7),
+                   SUM(autoliquidable), SUM(oferta), SUM(marca), SUM(adicional), SUM(total), COUNT(*)
+            FROM sales_daily GROUP BY employee_id, substr(date,1,7);
+
+            INSERT INTO sales_dept_monthly (department, month, autoliquidable, oferta, marca, adicional, total, dias)
+            SELECT IFNULL(e.department,''), m.month,
+                   SUM(m.autoliquidable), SUM(m.oferta), SUM(m.marca), SUM(m.adicional), SUM(m.total), SUM(m.dias)
+            FROM sales_monthly m JOIN employees e ON e.id = m.employee_id
+            GROUP BY IFNULL(e.department,''), m.month;
+            COMMIT;
+        """)
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+def verify_database(conn=None):
+    conn = conn or get_connection()
     cur = conn.cursor()
     tables = ['users', 'employees', 'sales', 'afiliaciones', 'audit_log']
     for table in tables:
@@ -119,28 +701,201 @@ def verify_database():
             (table,),
         )
         if cur.fetchone() is None:
-            conn.close()
-            create_tables()
+            create_tables(conn)
             return
-    conn.close()
 
 
-def log_audit(user_id, username, action, table_name=None, record_id=None, detail=None):
-    """Registra una acción en el log de auditoría."""
-    try:
+AUDIT_INSERT_SQL = """INSERT INTO audit_log (user_id, username, action, table_name, record_id, detail)
+                      VALUES (?, ?, ?, ?, ?, ?)"""
+
+
+# ── Auditoría con commit agrupado ─────────────────────────────────────
+# log_audit solo encola el evento; un hilo daemon lo escribe junto con los
+# demás pendientes en una sola transacción. En la hora de cierre, cuando
+# todos guardan a la vez, la auditoría deja de duplicar las transacciones
+# que compiten por el bloqueo de escritura de SQLite.
+AUDIT_COLA_MAX = int(os.environ.get("VENTAS_AUDIT_COLA", "10000"))
+AUDIT_LOTE = 500        # filas máximas por transacción
+AUDIT_INTERVALO = 0.25  # segundos entre vaciados del hilo
+AUDIT_REINTENTOS = (0.1, 0.5, 2.0)   # esperas antes de reintentar un lote fallido
+
+
+class AuditWriter:
+    """Cola acotada de eventos de auditoría vaciada en lotes.
+
+    Si la cola está llena el evento se escribe en línea: más lento, pero no
+    se pierde. Un lote que falla (p. ej. "database is locked") se reintenta
+    tras AUDIT_REINTENTOS y después fila a fila; solo se cuentan como
+    perdidas las filas que siguen fallando. Al terminar el proceso (atexit)
+    se vacía lo pendiente.
+    """
+
+    def __init__(self, maxsize=AUDIT_COLA_MAX):
+        self._cola = queue.Queue(maxsize)
+        self._hilo = None
+        self._activo = True
+        self._lock = threading.Lock()        # arranque del hilo y métricas
+        self._escritura = threading.RLock()  # un solo vaciado a la vez; ver pausa()
+        self.encolados = 0
+        self.escritos = 0
+        self.en_linea = 0
+        self.perdidos = 0
+        self.reintentos = 0
+        self.lotes = 0
+        self.max_profundidad = 0
+        self.ultima_latencia = 0.0   # ms
+        self._latencia_total = 0.0
+
+    def _asegurar_hilo(self):
+        with self._lock:
+            if self._activo and (self._hilo is None or not self._hilo.is_alive()):
+                self._hilo = threading.Thread(target=self._bucle, daemon=True, name="audit-writer")
+                self._hilo.start()
+
+    def registrar(self, evento):
+        self._asegurar_hilo()
+        try:
+            self._cola.put_nowait(evento)
+        except queue.Full:
+            with self._lock:
+                self.en_linea += 1
+            with self._escritura:
+                self._escribir([evento])
+            return
+        with self._lock:
+            self.encolados += 1
+            self.max_profundidad = max(self.max_profundidad, self._cola.qsize())
+
+    def _bucle(self):
+        while self._activo:
+            time.sleep(AUDIT_INTERVALO)
+            if not self._cola.empty():
+                self.vaciar()
+
+    def _escribir(self, lote):
+        """Escribe un lote: una transacción por tienda presente en él."""
+        por_tienda = {}
+        for tienda, *fila in lote:
+            por_tienda.setdefault(tienda, []).append(fila)
+        for tienda, filas in por_tienda.items():
+            with en_tienda(tienda):
+                self._escribir_tienda(filas)
+
+    @staticmethod
+    def _insertar(filas) -> bool:
         conn = get_connection()
-        conn.execute(
-            """INSERT INTO audit_log (user_id, username, action, table_name, record_id, detail)
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            (user_id, username, action, table_name, record_id, detail),
-        )
-        conn.commit()
-        conn.close()
-    except Exception:
-        pass  # log nunca debe romper el flujo principal
+        try:
+            conn.executemany(AUDIT_INSERT_SQL, filas)
+            conn.commit()
+            return True
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return False
+
+    def _escribir_tienda(self, filas):
+        inicio = time.perf_counter()
+        escrito = self._insertar(filas)
+        for espera in AUDIT_REINTENTOS:
+            if escrito:
+                break
+            with self._lock:
+                self.reintentos += 1
+            time.sleep(espera)
+            escrito = self._insertar(filas)
+        escritas = len(filas)
+        if not escrito:
+            # Fila a fila: una fila que no entra no arrastra a las demás.
+            # El log nunca debe romper el flujo principal.
+            escritas = sum(self._insertar([fila]) for fila in filas)
+            with self._lock:
+                self.perdidos += len(filas) - escritas
+            if not escritas:
+                return
+        ms = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.escritos += escritas
+            self.lotes += 1
+            self.ultima_latencia = ms
+            self._latencia_total += ms
+        _query_cache.invalidate("audit_log")
+
+    def vaciar(self):
+        """Escribe ya todo lo encolado (bloquea hasta terminar)."""
+        with self._escritura:
+            while True:
+                lote = []
+                while len(lote) < AUDIT_LOTE:
+                    try:
+                        lote.append(self._cola.get_nowait())
+                    except queue.Empty:
+                        break
+                if not lote:
+                    return
+                self._escribir(lote)
+
+    def pausa(self):
+        """Context manager: ningún lote se escribe mientras dure (el hilo que
+        lo tiene sí puede escribir)."""
+        return self._escritura
+
+    def cerrar(self):
+        self._activo = False
+        self.vaciar()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "profundidad":     self._cola.qsize(),
+                "max_profundidad": self.max_profundidad,
+                "capacidad":       self._cola.maxsize,
+                "encolados":       self.encolados,
+                "escritos":        self.escritos,
+                "en_linea":        self.en_linea,
+                "perdidos":        self.perdidos,
+                "reintentos":      self.reintentos,
+                "lotes":           self.lotes,
+                "filas_por_lote":  (self.escritos / self.lotes) if self.lotes else 0.0,
+                "ultima_ms":       self.ultima_latencia,
+                "media_ms":        (self._latencia_total / self.lotes) if self.lotes else 0.0,
+            }
+
+
+_audit = AuditWriter()
+atexit.register(_audit.cerrar)   # registrado después del pool: se ejecuta antes de cerrarlo
+
+
+def log_audit(user_id, username, action, table_name=None, record_id=None, detail=None):
+    """Registra una acción en el log de auditoría (se escribe en segundo plano)."""
+    _audit.registrar((tienda_actual(), user_id, username, action, table_name, record_id, detail))
+
+
+def flush_audit():
+    """Escribe los eventos de auditoría pendientes antes de leer o copiar la base."""
+    _audit.vaciar()
+
+
+def audit_stats():
+    return _audit.stats()
+
+
+@contextmanager
+def mantenimiento():
+    """Acceso exclusivo a la base de la tienda activa, p. ej. para reemplazar
+    el archivo: la auditoría no escribe y los demás hilos esperan en
+    get_connection() hasta que termine el bloque."""
+    with _audit.pausa(), _pool_de(tienda_actual()).exclusivo():
+        yield
+
 
+def init_database(conn=None):
+    """Crea o pone al día el esquema (por defecto, de la tienda activa).
 
-def init_database():
-    create_tables()
-    migrate_database()
-    verify_database()
+    Con `conn` trabaja sobre esa conexión, p. ej. un archivo que se está
+    restaurando y aún no es la base de la tienda.
+    """
+    create_tables(conn)
+    migrate_database(conn)
+    verify_database(conn)
@@ -5,6 +5,9 @@
 
 import io
 import base64
+import hashlib
+import numbers
+import tempfile
 from datetime import datetime
 import pandas as pd
 import streamlit as st
@@ -24,112 +27,162 @@ COLOR_WHITE      = "FFFFFF"
 # ════════════════════════════════════════════════════════════════════
 #  EXCEL
 # ════════════════════════════════════════════════════════════════════
-def exportar_excel(df: pd.DataFrame, titulo: str, subtitulo: str = "", hoja: str = "Reporte") -> bytes:
+_EXCEL_MIME    = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+_CHUNK_FILAS   = 2000    # filas leídas del cursor por cada fetchmany
+_MUESTRA_ANCHO = 500     # filas usadas para estimar el ancho de columnas
+_ANCHO_MAX     = 40
+
+
+def _estilos_excel() -> list:
     """
-    Genera un archivo Excel profesional con el DataFrame recibido.
-    Devuelve bytes listos para st.download_button.
+    Estilos con nombre compartidos por todo el libro. Cada celda referencia
+    uno por nombre en lugar de crear sus propios Fill/Border/Font/Alignment.
+    """
+    from openpyxl.styles import NamedStyle, PatternFill, Font, Alignment, Border, Side
+
+    def estilo(nombre, font, bg, h="left", borde=COLOR_BORDER, formato=None):
+        s = NamedStyle(name=nombre)
+        s.font      = font
+        s.fill      = PatternFill("solid", fgColor=bg)
+        s.alignment = Alignment(horizontal=h, vertical="center")
+        if borde:
+            side = Side(style="thin", color=borde)
+            s.border = Border(left=side, right=side, top=side, bottom=side)
+        if formato:
+            s.number_format = formato
+        return s
+
+    dato = Font(color=COLOR_HEADER_BG, size=10, name="Calibri")
+    estilos = [
+        estilo("ais_titulo", Font(bold=True, color=COLOR_WHITE, size=14, name="Calibri"),
+               COLOR_HEADER_BG, "center", borde=None),
+        estilo("ais_subtitulo", Font(italic=True, color="94A3B8", size=10, name="Calibri"),
+               "1E293B", "center", borde=None),
+        estilo("ais_encabezado", Font(bold=True, color=COLOR_WHITE, size=10, name="Calibri"),
+               COLOR_PRIMARY, "center", borde=COLOR_WHITE),
+    ]
+    for sufijo, bg in (("", COLOR_WHITE), ("_alt", COLOR_ROW_ALT)):
+        estilos += [
+            estilo(f"ais_texto{sufijo}",  dato, bg),
+            estilo(f"ais_entero{sufijo}", dato, bg, "right", formato="#,##0"),
+            estilo(f"ais_decimal{sufijo}", dato, bg, "right", formato="#,##0.00"),
+        ]
+    return estilos
+
+
+def _estilo_valor(value) -> str:
+    if isinstance(value, numbers.Integral) and not isinstance(value, bool):
+        return "ais_entero"
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        return "ais_decimal"
+    return "ais_texto"
+
+
+def _anchos_muestreados(columnas, muestra) -> list:
+    """Ancho de cada columna estimado sobre una muestra de filas."""
+    anchos = [len(str(c)) for c in columnas]
+    for fila in muestra:
+        for i, v in enumerate(fila):
+            if v is not None:
+                anchos[i] = max(anchos[i], len(str(v)))
+    return [min(a + 4, _ANCHO_MAX) for a in anchos]
+
+
+def _escribir_libro(columnas, filas, muestra, titulo, subtitulo, hoja):
+    """
+    Escribe un libro en modo write-only: las filas se emiten una a una y no
+    quedan en memoria. Devuelve un archivo temporal posicionado al inicio
+    (en RAM hasta 8 MB, después en disco) o None si falta openpyxl.
     """
     try:
         from openpyxl import Workbook
-        from openpyxl.styles import (
-            PatternFill, Font, Alignment, Border, Side, GradientFill
-        )
+        from openpyxl.cell import WriteOnlyCell
         from openpyxl.utils import get_column_letter
-        from openpyxl.chart import BarChart, Reference
     except ImportError:
         st.error("📦 Instala openpyxl: `pip install openpyxl`")
-        return b""
+        return None
+
+    wb = Workbook(write_only=True)
+    for s in _estilos_excel():
+        wb.add_named_style(s)
+    ws = wb.create_sheet(hoja)
+
+    n_cols   = len(columnas)
+    last_col = get_column_letter(n_cols)
+    # En write-only los anchos y altos deben fijarse antes de escribir filas
+    for i, ancho in enumerate(_anchos_muestreados(columnas, muestra), start=1):
+        ws.column_dimensions[get_column_letter(i)].width = ancho
+    for fila, alto in ((1, 36), (2, 22), (3, 6), (4, 24)):
+        ws.row_dimensions[fila].height = alto
+    header_row = 4
+    ws.freeze_panes = f"A{header_row + 1}"
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = hoja
+    def celda(valor, estilo):
+        c = WriteOnlyCell(ws, value=valor)
+        c.style = estilo   # NamedStyle registrado arriba, por nombre
+        return c
 
-    # ── Helpers de estilo ──
-    def fill(hex_color):
-        return PatternFill("solid", fgColor=hex_color)
+    def fila_combinada(texto, estilo):
+        return [celda(texto, estilo)] + [celda(None, estilo) for _ in range(n_cols - 1)]
 
-    def border(color=COLOR_BORDER):
-        side = Side(style="thin", color=color)
-        return Border(left=side, right=side, top=side, bottom=side)
+    # ── Filas 1-3: título, subtítulo y separador ──
+    ws.append(fila_combinada(titulo.upper(), "ais_titulo"))
+    fecha_str = f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}  |  {subtitulo}"
+    ws.append(fila_combinada(fecha_str, "ais_subtitulo"))
+    ws.append([])
+    ws.merged_cells.add(f"A1:{last_col}1")
+    ws.merged_cells.add(f"A2:{last_col}2")
 
-    def font(bold=False, color=COLOR_HEADER_BG, size=11, italic=False):
-        return Font(bold=bold, color=color, size=size, italic=italic, name="Calibri")
+    # ── Fila 4: encabezados ──
+    ws.append([celda(str(c).upper(), "ais_encabezado") for c in columnas])
 
-    def align(h="left", v="center", wrap=False):
-        return Alignment(horizontal=h, vertical=v, wrap_text=wrap)
+    # ── Filas de datos ──
+    n = 0
+    for n, row in enumerate(filas, start=1):
+        sufijo = "_alt" if n % 2 == 0 else ""
+        ws.append([celda(v, _estilo_valor(v) + sufijo) for v in row])
 
-    # ── Fila 1: Título principal ──
-    ws.merge_cells(f"A1:{get_column_letter(len(df.columns))}1")
-    c = ws["A1"]
-    c.value        = titulo.upper()
-    c.font         = Font(bold=True, color=COLOR_WHITE, size=14, name="Calibri")
-    c.fill         = fill(COLOR_HEADER_BG)
-    c.alignment    = align("center")
-    ws.row_dimensions[1].height = 36
+    ws.auto_filter.ref = f"A{header_row}:{last_col}{header_row + n}"
 
-    # ── Fila 2: Subtítulo / fecha ──
-    fecha_str = f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}  |  {subtitulo}"
-    ws.merge_cells(f"A2:{get_column_letter(len(df.columns))}2")
-    c = ws["A2"]
-    c.value     = fecha_str
-    c.font      = Font(italic=True, color="94A3B8", size=10, name="Calibri")
-    c.fill      = fill("1E293B")
-    c.alignment = align("center")
-    ws.row_dimensions[2].height = 22
-
-    # ── Fila 3: vacía (separador) ──
-    ws.row_dimensions[3].height = 6
-
-    # ── Fila 4: Encabezados ──
-    header_row = 4
-    for col_idx, col_name in enumerate(df.columns, start=1):
-        c = ws.cell(row=header_row, column=col_idx, value=str(col_name).upper())
-        c.font      = Font(bold=True, color=COLOR_WHITE, size=10, name="Calibri")
-        c.fill      = fill(COLOR_PRIMARY)
-        c.alignment = align("center")
-        c.border    = border(COLOR_WHITE)
-    ws.row_dimensions[header_row].height = 24
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    wb.save(out)
+    out.seek(0)
+    return out
 
-    # ── Filas de datos ──
-    for row_idx, row in enumerate(df.itertuples(index=False), start=header_row + 1):
-        is_alt = (row_idx - header_row) % 2 == 0
-        bg = COLOR_ROW_ALT if is_alt else COLOR_WHITE
-        for col_idx, value in enumerate(row, start=1):
-            c = ws.cell(row=row_idx, column=col_idx, value=value)
-            c.fill      = fill(bg)
-            c.border    = border()
-            c.font      = font(size=10)
-            # Alineación según tipo
-            if isinstance(value, (int, float)):
-                c.alignment = align("right")
-                if isinstance(value, float):
-                    c.number_format = "#,##0.00"
-                else:
-                    c.number_format = "#,##0"
-            else:
-                c.alignment = align("left")
-        ws.row_dimensions[row_idx].height = 20
-
-    # ── Ancho de columnas automático ──
-    for col_idx, col_name in enumerate(df.columns, start=1):
-        col_letter = get_column_letter(col_idx)
-        max_len = max(
-            len(str(col_name)),
-            *(len(str(v)) for v in df.iloc[:, col_idx - 1].astype(str))
-        )
-        ws.column_dimensions[col_letter].width = min(max_len + 4, 40)
 
-    # ── Freeze panes ──
-    ws.freeze_panes = f"A{header_row + 1}"
+def exportar_excel(df: pd.DataFrame, titulo: str, subtitulo: str = "", hoja: str = "Reporte"):
+    """
+    Genera un archivo Excel profesional con el DataFrame recibido.
+    Devuelve un archivo temporal listo para st.download_button (None si falla).
+    """
+    muestra = df.head(_MUESTRA_ANCHO).itertuples(index=False)
+    return _escribir_libro(list(df.columns), df.itertuples(index=False, name=None),
+                           muestra, titulo, subtitulo, hoja)
 
-    # ── Auto-filter ──
-    last_col = get_column_letter(len(df.columns))
-    ws.auto_filter.ref = f"A{header_row}:{last_col}{header_row + len(df)}"
 
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    return buf.read()
+def exportar_excel_consulta(query: str, params=None, titulo: str = "", subtitulo: str = "",
+                            hoja: str = "Reporte"):
+    """
+    Exporta el resultado de una consulta leyendo el cursor por bloques, sin
+    cargarlo en un DataFrame. Pensado para historiales completos.
+    """
+    from database import get_connection
+
+    cur = get_connection().cursor()
+    cur.execute(query, params or [])
+    columnas = [d[0] for d in cur.description]
+    primero  = cur.fetchmany(_CHUNK_FILAS)
+
+    def filas():
+        bloque = primero
+        while bloque:
+            yield from bloque
+            bloque = cur.fetchmany(_CHUNK_FILAS)
+
+    try:
+        return _escribir_libro(columnas, filas(), primero[:_MUESTRA_ANCHO], titulo, subtitulo, hoja)
+    finally:
+        cur.close()
 
 
 # ════════════════════════════════════════════════════════════════════
@@ -274,16 +327,37 @@ def boton_descarga_excel(
     key: str = None,
 ):
     """Renderiza un botón de descarga Excel de Streamlit."""
-    data = exportar_excel(df, titulo, subtitulo)
-    if data:
-        fname = f"{nombre_archivo}_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
-        st.download_button(
-            label=label,
-            data=data,
-            file_name=fname,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key=key or f"dl_excel_{nombre_archivo}",
-        )
+    _boton_excel(exportar_excel(df, titulo, subtitulo), nombre_archivo, label, key)
+
+
+def boton_descarga_excel_consulta(
+    query: str,
+    params=None,
+    titulo: str = "",
+    subtitulo: str = "",
+    nombre_archivo: str = "reporte",
+    label: str = "⬇️ Descargar Excel",
+    key: str = None,
+):
+    """Botón de descarga Excel que exporta una consulta por bloques."""
+    _boton_excel(exportar_excel_consulta(query, params, titulo, subtitulo), nombre_archivo, label, key)
+
+
+def _boton_excel(archivo, nombre_archivo, label, key):
+    if archivo is None:
+        return
+    fname = f"{nombre_archivo}_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
+    # Streamlit solo acepta bytes o buffers propios: se lee el archivo una
+    # vez y se libera en el acto.
+    with archivo:
+        data = archivo.read()
+    st.download_button(
+        label=label,
+        data=data,
+        file_name=fname,
+        mime=_EXCEL_MIME,
+        key=key or f"dl_excel_{nombre_archivo}",
+    )
 
 
 def boton_descarga_pdf(
@@ -317,19 +391,62 @@ def barra_exportacion(
     """
     Renderiza una fila con los dos botones de exportación (Excel + PDF)
     alineados a la derecha. Llamar DESPUÉS de mostrar la tabla.
+
+    Los archivos se generan solo al pulsar el botón y se guardan en la
+    sesión junto a la huella del DataFrame: mientras los datos no cambien,
+    los reruns muestran directamente el botón de descarga sin regenerar.
     """
     if df is None or df.empty:
         return
+    huella = huella_dataframe(df, titulo, subtitulo)
     _, col_excel, col_pdf = st.columns([6, 1, 1])
     with col_excel:
-        boton_descarga_excel(
-            df, titulo, subtitulo, nombre_archivo,
-            label="📊 Excel",
-            key=f"{key_prefix}_excel"
-        )
+        _descarga_diferida("xlsx", df, titulo, subtitulo, nombre_archivo, huella,
+                           label="📊 Excel", key=f"{key_prefix}_excel")
     with col_pdf:
-        boton_descarga_pdf(
-            df, titulo, subtitulo, nombre_archivo,
-            label="📄 PDF",
-            key=f"{key_prefix}_pdf"
-        )
+        _descarga_diferida("pdf", df, titulo, subtitulo, nombre_archivo, huella,
+                           label="📄 PDF", key=f"{key_prefix}_pdf")
+
+
+def huella_dataframe(df: pd.DataFrame, *extra) -> str:
+    """Hash del contenido (valores, índice y columnas) más datos extra."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    h.update(repr((list(df.columns), extra)).encode())
+    return h.hexdigest()
+
+
+def _excel_bytes(df, titulo, subtitulo) -> bytes:
+    archivo = exportar_excel(df, titulo, subtitulo)
+    if archivo is None:
+        return b""
+    with archivo:
+        return archivo.read()
+
+
+_FORMATOS = {
+    "xlsx": (_excel_bytes, _EXCEL_MIME),
+    "pdf":  (exportar_pdf, "application/pdf"),
+}
+
+
+def _descarga_diferida(formato, df, titulo, subtitulo, nombre_archivo, huella, label, key):
+    generar, mime = _FORMATOS[formato]
+    slot = f"_export_{key}"
+    guardado = st.session_state.get(slot)
+    if guardado is None or guardado[0] != huella:
+        if not st.button(label, key=f"{key}_preparar", help="Generar archivo"):
+            return
+        with st.spinner("Generando…"):
+            data = generar(df, titulo, subtitulo)
+        if not data:
+            return
+        guardado = st.session_state[slot] = (huella, data)
+    fname = f"{nombre_archivo}_{datetime.now().strftime('%Y%m%d_%H%M')}.{formato}"
+    st.download_button(
+        label=f"⬇️ {label.split(' ', 1)[-1]}",
+        data=guardado[1],
+        file_name=fname,
+        mime=mime,
+        key=key,
+    )
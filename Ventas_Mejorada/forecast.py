@@ -0,0 +1,162 @@
+"""Proyección de ventas a fin de mes por empleado y departamento.
+
+Se ajusta una vez por día, para todos los empleados a la vez, con las
+últimas HISTORIA_DIAS jornadas de `sales_daily` hasta ayer (matriz
+empleados × días). Con lo vendido en el mes, cada modelo estima las
+unidades de los días que faltan:
+
+- ritmo:      promedio diario del mes en curso × días del mes.
+- estacional: promedio histórico de cada día de la semana, sumado sobre
+              los días restantes (los domingos no pesan como los viernes).
+- suavizado:  nivel diario por suavizado exponencial simple (α = ALFA)
+              × días restantes.
+
+El pronóstico es la media de los tres. Como el ajuste no depende de hoy,
+lo vendido en el día se aplica al vuelo y guardar ventas no obliga a
+reajustar.
+"""
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from database import get_connection
+from query_cache import cache as _query_cache
+from tiendas import tienda_actual
+
+HISTORIA_DIAS = 56
+ALFA = 0.3
+MODELOS = ["ritmo", "estacional", "suavizado"]
+
+
+def _fin_de_mes(d: date) -> date:
+    siguiente = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return siguiente - timedelta(days=1)
+
+
+class ModeloMes:
+    """Parámetros ajustados el día `hoy` para proyectar el mes en curso.
+
+    `tasa_dia[e, w]` son las unidades medias del empleado e en el día de la
+    semana w; `nivel[e]` su nivel diario suavizado.
+    """
+
+    def __init__(self, hoy: date, empleados: pd.DataFrame, ventas: pd.DataFrame):
+        self.hoy = hoy
+        self.fin = _fin_de_mes(hoy)
+        self.transcurridos = hoy.day
+        self.restantes = (self.fin - hoy).days
+        self.dias_mes = self.fin.day
+
+        self.empleados = empleados.reset_index(drop=True)
+        self._fila = {eid: i for i, eid in enumerate(self.empleados["id"])}
+
+        inicio = hoy - timedelta(days=HISTORIA_DIAS)
+        dias = pd.date_range(inicio, hoy - timedelta(days=1))
+        n_emp, n_dia = len(self.empleados), len(dias)
+        y = np.zeros((n_emp, n_dia))
+        if not ventas.empty:
+            fila = ventas["employee_id"].map(self._fila)
+            ok = fila.notna().to_numpy()
+            t = (pd.to_datetime(ventas["date"]) - pd.Timestamp(inicio)).dt.days.to_numpy()
+            np.add.at(y, (fila.to_numpy()[ok].astype(np.int64), t[ok]), ventas["total"].to_numpy()[ok])
+
+        # Estacionalidad semanal: media por día de la semana
+        semana = dias.weekday.to_numpy()
+        uno = np.eye(7)[semana]                              # días × 7
+        self.tasa_dia = (y @ uno) / np.maximum(uno.sum(axis=0), 1)
+
+        # Suavizado exponencial simple en forma cerrada: pesos α(1-α)^k
+        k = np.arange(n_dia - 1, -1, -1)
+        pesos = ALFA * (1 - ALFA) ** k
+        pesos[0] += (1 - ALFA) ** n_dia                      # valor inicial = primer día
+        self.nivel = y @ pesos
+
+        # Días de la semana que faltan en el mes
+        restantes = pd.date_range(hoy + timedelta(days=1), self.fin).weekday.to_numpy()
+        self._conteo_restantes = np.bincount(restantes, minlength=7).astype(float)
+
+    def proyectar(self, employee_ids, actuales) -> pd.DataFrame:
+        """Proyección de cada modelo para los empleados dados y su total del mes."""
+        filas = np.array([self._fila.get(e, -1) for e in employee_ids], dtype=np.int64)
+        conocidos = filas >= 0
+        actual = np.asarray(actuales, dtype=float)
+
+        estacional = np.zeros(len(filas))
+        suavizado = np.zeros(len(filas))
+        estacional[conocidos] = self.tasa_dia[filas[conocidos]] @ self._conteo_restantes
+        suavizado[conocidos] = self.nivel[filas[conocidos]] * self.restantes
+
+        res = pd.DataFrame({
+            "employee_id": list(employee_ids),
+            "actual":      actual,
+            "ritmo":       actual / self.transcurridos * self.dias_mes,
+            "estacional":  actual + estacional,
+            "suavizado":   actual + suavizado,
+        })
+        # Sin historial (empleado nuevo) solo cuenta el ritmo del mes
+        res.loc[~conocidos, ["estacional", "suavizado"]] = res.loc[~conocidos, "ritmo"]
+        res[MODELOS] = res[MODELOS].round()
+        res["pronostico"] = res[MODELOS].mean(axis=1).round()
+        return res
+
+    def proyectar_empleado(self, employee_id, actual) -> int:
+        return int(self.proyectar([employee_id], [actual])["pronostico"].iloc[0])
+
+    def tabla(self, actuales: pd.Series) -> pd.DataFrame:
+        """
+        Proyección de todos los empleados (`actuales`: total del mes por id;
+        los que falten cuentan 0), con meta, % proyectado y unidades por día
+        necesarias para llegar a la meta.
+        """
+        emp = self.empleados
+        actual = actuales.reindex(emp["id"]).fillna(0).to_numpy()
+        df = self.proyectar(emp["id"].tolist(), actual)
+        df.insert(1, "name", emp["name"].to_numpy())
+        df.insert(2, "department", emp["department"].to_numpy())
+        df.insert(3, "goal", emp["goal"].to_numpy())
+        metas = df["goal"].where(df["goal"] > 0)
+        df["pct_proyectado"] = (df["pronostico"] / metas * 100).round(1).fillna(0)
+        faltan = (df["goal"] - df["actual"]).clip(lower=0)
+        df["por_dia_necesario"] = (faltan / max(self.restantes, 1)).round(1)
+        return df
+
+    @staticmethod
+    def por_departamento(tabla: pd.DataFrame) -> pd.DataFrame:
+        return (tabla.groupby("department", as_index=False)[["goal", "actual", *MODELOS, "pronostico"]].sum()
+                .assign(pct_proyectado=lambda d: (d["pronostico"] / d["goal"].where(d["goal"] > 0) * 100)
+                        .round(1).fillna(0))
+                .sort_values("pronostico", ascending=False, ignore_index=True))
+
+
+_lock = threading.Lock()
+_modelos = {}   # tienda -> ModeloMes
+
+
+def modelo_del_dia(hoy: date = None) -> ModeloMes:
+    """Modelo de la tienda activa ajustado hoy (se reajusta al cambiar el día o los empleados)."""
+    hoy = hoy or date.today()
+    tienda = tienda_actual()
+    with _lock:
+        modelo = _modelos.get(tienda)
+        if modelo is None or modelo.hoy != hoy:
+            conn = get_connection()
+            empleados = pd.read_sql("SELECT id, name, department, goal FROM employees ORDER BY id", conn)
+            ventas = pd.read_sql(
+                "SELECT employee_id, date, total FROM sales_daily WHERE date >= ? AND date < ?",
+                conn, params=[str(hoy - timedelta(days=HISTORIA_DIAS)), str(hoy)],
+            )
+            modelo = _modelos[tienda] = ModeloMes(hoy, empleados, ventas)
+        return modelo
+
+
+def _al_invalidar(tablas, employee_id, fecha):
+    """Empleados nuevos o cargas masivas cambian el ajuste; un guardado
+    individual no (lo del mes se aplica al proyectar)."""
+    if tablas is None or "employees" in tablas or ("sales" in tablas and employee_id is None):
+        with _lock:
+            _modelos.pop(tienda_actual(), None)
+
+
+_query_cache.suscribir(_al_invalidar)
@@ -0,0 +1,272 @@
+"""Importación masiva de ventas y afiliaciones desde CSV o Excel.
+
+Las filas se leen en streaming (csv.reader / openpyxl en modo read-only),
+se validan contra `employees` y se escriben con executemany en
+transacciones de CHUNK_FILAS filas. Cada fila es el mismo upsert que usa el
+formulario (utils.UPSERT_SQL): una fila repetida actualiza la existente.
+Si un lote falla, los anteriores ya quedaron guardados: la importación se
+detiene y el resultado trae el error y lo que se alcanzó a guardar.
+"""
+import csv
+import io
+import re
+import time
+import unicodedata
+from datetime import date, datetime
+
+from database import get_connection
+from query_cache import cache as query_cache
+from utils import invalidar_acumulado, UPSERT_SQL
+
+CHUNK_FILAS = 1000
+MAX_RECHAZOS = 1000     # detalle conservado; el conteo sigue siendo exacto
+_LOTE_CLAVES = 400      # claves por consulta de existencia (límite de variables de SQLite)
+
+TIPOS = {
+    "ventas": {
+        "tabla":   "sales",
+        "fecha":   "date",
+        "valores": ["autoliquidable", "oferta", "marca", "adicional"],
+        "sql":     UPSERT_SQL["sales"],
+    },
+    "afiliaciones": {
+        "tabla":   "afiliaciones",
+        "fecha":   "fecha",
+        "valores": ["cantidad"],
+        "sql":     UPSERT_SQL["afiliaciones"],
+    },
+}
+
+# Encabezados aceptados para cada campo (ya normalizados)
+ALIAS = {
+    "empleado":       {"empleado", "employee", "employee_id", "id_empleado", "nombre", "name"},
+    "fecha":          {"fecha", "date", "dia"},
+    "autoliquidable": {"autoliquidable", "auto"},
+    "oferta":         {"oferta", "oferta_semana"},
+    "marca":          {"marca", "marca_propia"},
+    "adicional":      {"adicional", "producto_adicional"},
+    "cantidad":       {"cantidad", "afiliaciones"},
+}
+
+_FORMATOS_FECHA = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d")
+
+
+def _normalizar(texto) -> str:
+    """Minúsculas, sin tildes y con '_' en lugar de espacios."""
+    texto = unicodedata.normalize("NFKD", str(texto or "").strip().lower())
+    return "".join(c for c in texto if not unicodedata.combining(c)).replace(" ", "_")
+
+
+def leer_filas(archivo, nombre: str):
+    """Itera las filas (tuplas) de un CSV o XLSX sin cargar el archivo entero."""
+    if nombre.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        wb = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+        return
+
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    try:
+        muestra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        yield from csv.reader(texto, dialecto)
+    finally:
+        texto.detach()   # no cerrar el archivo subido
+
+
+def _fecha(valor) -> str:
+    if isinstance(valor, datetime):
+        valor = valor.date()
+    if isinstance(valor, date):
+        d = valor
+    else:
+        texto = str(valor or "").strip()
+        for formato in _FORMATOS_FECHA:
+            try:
+                d = datetime.strptime(texto, formato).date()
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"fecha inválida: {valor!r}")
+    if d > date.today():
+        raise ValueError(f"fecha futura: {d}")
+    return str(d)
+
+
+def _cantidad(valor) -> int:
+    """Entero no negativo. Una celda numérica debe ser entera y un texto
+    solo dígitos: "1.000" o "1,000" se rechazan, el separador es ambiguo."""
+    if isinstance(valor, bool):
+        raise ValueError(f"cantidad inválida: {valor!r}")
+    if isinstance(valor, int):
+        n = valor
+    elif isinstance(valor, float):
+        if not valor.is_integer():
+            raise ValueError(f"cantidad inválida: {valor!r}")
+        n = int(valor)
+    else:
+        texto = str(valor or "").strip()
+        if texto == "":
+            return 0
+        if not re.fullmatch(r"\d+", texto):
+            raise ValueError(f"cantidad inválida: {valor!r}")
+        n = int(texto)
+    if n < 0:
+        raise ValueError(f"cantidad inválida: {valor!r}")
+    return n
+
+
+def _id_empleado(valor):
+    """Id de una celda numérica o de un texto de solo dígitos; None si es un
+    nombre. Como en _cantidad, no se redondea ni se acepta un booleano."""
+    if isinstance(valor, bool) or (isinstance(valor, float) and not valor.is_integer()):
+        raise ValueError(f"empleado inválido: {valor!r}")
+    if isinstance(valor, (int, float)):
+        return int(valor)
+    texto = str(valor or "").strip()
+    return int(texto) if re.fullmatch(r"\d+", texto) else None
+
+
+def _mapa_empleados(conn):
+    """(por id, por nombre normalizado); los nombres repetidos quedan en None."""
+    por_id, por_nombre = set(), {}
+    for emp_id, nombre in conn.execute("SELECT id, name FROM employees"):
+        por_id.add(emp_id)
+        clave = _normalizar(nombre)
+        por_nombre[clave] = None if clave in por_nombre else emp_id
+    return por_id, por_nombre
+
+
+def _existentes(conn, spec, claves) -> set:
+    """Claves (employee_id, fecha) que ya están en la tabla."""
+    encontradas = set()
+    claves = list(claves)
+    for i in range(0, len(claves), _LOTE_CLAVES):
+        bloque = claves[i:i + _LOTE_CLAVES]
+        valores = ", ".join(["(?, ?)"] * len(bloque))
+        params = [v for clave in bloque for v in clave]
+        encontradas.update(
+            tuple(r) for r in conn.execute(
+                f"SELECT employee_id, {spec['fecha']} FROM {spec['tabla']} "
+                f"WHERE (employee_id, {spec['fecha']}) IN (VALUES {valores})", params)
+        )
+    return encontradas
+
+
+def _volcar(conn, spec, lote, resultado):
+    """Escribe un lote en una transacción; si se confirma, suma el reparto
+    nuevas/actualizadas al resultado."""
+    existentes = _existentes(conn, spec, {(f[0], f[1]) for f in lote})
+    nuevas = actualizadas = 0
+    for fila in lote:
+        clave = (fila[0], fila[1])
+        if clave in existentes:
+            actualizadas += 1
+        else:
+            nuevas += 1
+            existentes.add(clave)   # una repetición dentro del archivo actualiza
+    try:
+        conn.execute("BEGIN")
+        conn.executemany(spec["sql"], lote)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    resultado["insertadas"] += nuevas
+    resultado["actualizadas"] += actualizadas
+
+
+def importar(archivo, nombre: str, tipo: str = "ventas", progreso=None) -> dict:
+    """
+    Importa un archivo de ventas o afiliaciones.
+
+    Columnas: empleado (id o nombre exacto), fecha y las cantidades del
+    tipo. Lanza ValueError si faltan columnas; las filas inválidas no
+    detienen la importación y se devuelven en `rechazos`. Si falla la
+    escritura de un lote se detiene: `error` trae el motivo e
+    insertadas/actualizadas cuentan solo los lotes ya guardados.
+    `progreso(resultado)` se llama tras cada lote.
+    """
+    spec = TIPOS[tipo]
+    filas = leer_filas(archivo, nombre)
+    encabezado = next(filas, None) or ()
+    campos = {}
+    for i, col in enumerate(encabezado):
+        for campo, alias in ALIAS.items():
+            if _normalizar(col) in alias and campo not in campos:
+                campos[campo] = i
+    requeridos = ["empleado", "fecha", *spec["valores"]]
+    faltan = [c for c in requeridos if c not in campos]
+    if faltan:
+        raise ValueError(f"Faltan columnas: {', '.join(faltan)}")
+
+    conn = get_connection()
+    por_id, por_nombre = _mapa_empleados(conn)
+    resultado = {"leidas": 0, "insertadas": 0, "actualizadas": 0, "rechazadas": 0,
+                 "segundos": 0.0, "filas_seg": 0.0, "rechazos": [], "error": None}
+    inicio = time.perf_counter()
+    lote = []
+
+    def valor(fila, campo):
+        i = campos[campo]
+        return fila[i] if i < len(fila) else None
+
+    def _avance():
+        resultado["segundos"] = time.perf_counter() - inicio
+        resultado["filas_seg"] = resultado["leidas"] / max(resultado["segundos"], 1e-6)
+        if progreso:
+            progreso(resultado)
+
+    for n, fila in enumerate(filas, start=2):
+        if not any(v not in (None, "") for v in fila):
+            continue
+        resultado["leidas"] += 1
+        try:
+            emp = valor(fila, "empleado")
+            emp_id = _id_empleado(emp)
+            if emp_id is not None:
+                if emp_id not in por_id:
+                    raise ValueError(f"empleado {emp_id} no existe")
+            else:
+                clave = _normalizar(emp)
+                if clave not in por_nombre:
+                    raise ValueError(f"empleado {emp!r} no existe")
+                emp_id = por_nombre[clave]
+                if emp_id is None:
+                    raise ValueError(f"nombre {emp!r} ambiguo: usar el id")
+            lote.append((emp_id, _fecha(valor(fila, "fecha")), *(_cantidad(valor(fila, c)) for c in spec["valores"])))
+        except ValueError as e:
+            resultado["rechazadas"] += 1
+            if len(resultado["rechazos"]) < MAX_RECHAZOS:
+                resultado["rechazos"].append({"fila": n, "motivo": str(e),
+                                              "valores": ", ".join("" if v is None else str(v) for v in fila)})
+            continue
+        if len(lote) >= CHUNK_FILAS:
+            try:
+                _volcar(conn, spec, lote, resultado)
+            except Exception as e:
+                resultado["error"] = str(e)
+                lote = []
+                break
+            lote = []
+            _avance()
+
+    if lote:
+        try:
+            _volcar(conn, spec, lote, resultado)
+        except Exception as e:
+            resultado["error"] = str(e)
+    _avance()
+
+    if resultado["insertadas"] or resultado["actualizadas"]:
+        query_cache.invalidate(spec["tabla"])
+        invalidar_acumulado(tabla=spec["tabla"])
+    return resultado
@@ -0,0 +1,174 @@
+"""Ranking de ventas materializado por (tienda, rango de fechas, departamento).
+
+Cada tablero se construye una vez desde los rollups y queda en memoria
+ordenado, con un índice empleado -> posición: la posición de cualquier
+empleado y el top-N se obtienen sin consultar la base.
+
+Al guardar ventas, la invalidación de la caché de consultas marca al
+empleado como pendiente en los tableros cuyo rango contiene la fecha. En la
+siguiente lectura solo se recalculan los totales de los pendientes (una
+consulta a sales_daily) y cada uno se mueve a su nuevo puesto. Cambios en
+empleados o escrituras masivas descartan los tableros.
+
+Los tableros solo se leen y modifican bajo el lock; las páginas reciben una
+Vista inmutable construida bajo el lock y reutilizada hasta el próximo cambio.
+"""
+import bisect
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+import pandas as pd
+
+from database import get_connection
+from query_cache import cache as _query_cache
+from tiendas import tienda_actual
+from utils import ventas_por_empleado_sql
+
+MAX_TABLEROS = 32
+
+COLUMNAS = ["employee_id", "name", "department", "position", "goal",
+            "total", "auto", "oferta", "marca", "adicional", "dias_activos"]
+_TOTAL = COLUMNAS.index("total")
+
+
+def _clave(fila):
+    """Orden del ranking: más unidades primero; empate por nombre."""
+    return (-fila[_TOTAL], fila[1], fila[0])
+
+
+class Tablero:
+    def __init__(self, inicio, fin, depto, filas):
+        self.inicio = str(inicio)
+        self.fin = str(fin)
+        self.depto = depto
+        self.filas = sorted(filas, key=_clave)
+        self._claves = [_clave(f) for f in self.filas]
+        self._pos = {f[0]: i for i, f in enumerate(self.filas)}
+        self.pendientes = set()
+        self._vista = None
+
+    def vista(self) -> "Vista":
+        if self._vista is None:
+            self._vista = Vista(self)
+        return self._vista
+
+    def actualizar(self, employee_id, totales):
+        """Reemplaza los totales del empleado y lo mueve a su nuevo puesto."""
+        self._vista = None
+        i = self._pos[employee_id]
+        fila = self.filas.pop(i)
+        self._claves.pop(i)
+        fila[_TOTAL:] = totales
+        j = bisect.bisect_left(self._claves, _clave(fila))
+        self.filas.insert(j, fila)
+        self._claves.insert(j, _clave(fila))
+        for k in range(min(i, j), max(i, j) + 1):
+            self._pos[self.filas[k][0]] = k
+
+
+class Vista:
+    """Copia inmutable de un tablero en un instante."""
+
+    def __init__(self, tablero):
+        self.inicio = tablero.inicio
+        self.fin = tablero.fin
+        self.depto = tablero.depto
+        self._df = pd.DataFrame(tablero.filas, columns=COLUMNAS)
+        self._pos = MappingProxyType({eid: i + 1 for eid, i in tablero._pos.items()})
+
+    def __len__(self):
+        return len(self._df)
+
+    def posicion(self, employee_id):
+        """Puesto (1 = primero) del empleado, o None si no está en el tablero."""
+        return self._pos.get(employee_id)
+
+    def top(self, n=None) -> pd.DataFrame:
+        """Los primeros `n` (todos si None); el DataFrame es del que llama."""
+        return (self._df if n is None else self._df.head(n)).copy()
+
+
+class _Leaderboards:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tableros = OrderedDict()   # (tienda, inicio, fin, depto) -> Tablero
+        self.construidos = 0
+        self.incrementales = 0
+        self.aciertos = 0
+
+    def _construir(self, inicio, fin, depto):
+        sub, params = ventas_por_empleado_sql(inicio, fin)
+        sql = f"""
+            SELECT e.id, e.name, e.department, e.position, e.goal,
+                   COALESCE(v.total, 0), COALESCE(v.autoliquidable, 0), COALESCE(v.oferta, 0),
+                   COALESCE(v.marca, 0), COALESCE(v.adicional, 0), COALESCE(v.dias, 0)
+            FROM employees e
+            LEFT JOIN ({sub}) v ON v.employee_id = e.id
+        """
+        if depto:
+            sql += " WHERE e.department = ?"
+            params.append(depto)
+        filas = [list(r) for r in get_connection().execute(sql, params)]
+        self.construidos += 1
+        return Tablero(inicio, fin, depto, filas)
+
+    def _refrescar(self, t):
+        ids = list(t.pendientes)
+        t.pendientes.clear()
+        totales = {eid: (0, 0, 0, 0, 0, 0) for eid in ids}
+        for r in get_connection().execute(
+                f"""SELECT employee_id, SUM(total), SUM(autoliquidable), SUM(oferta),
+                           SUM(marca), SUM(adicional), COUNT(*)
+                    FROM sales_daily
+                    WHERE employee_id IN ({", ".join("?" * len(ids))}) AND date BETWEEN ? AND ?
+                    GROUP BY employee_id""",
+                [*ids, t.inicio, t.fin]):
+            totales[r[0]] = tuple(r[1:])
+        for eid, valores in totales.items():
+            t.actualizar(eid, valores)
+        self.incrementales += len(ids)
+
+    def obtener(self, inicio, fin, depto=None) -> Vista:
+        """Vista del tablero del rango [inicio, fin] (`depto` None = todos) de
+        la tienda activa, al día."""
+        clave = (tienda_actual(), str(inicio), str(fin), depto)
+        with self._lock:
+            t = self._tableros.get(clave)
+            if t is None:
+                t = self._tableros[clave] = self._construir(inicio, fin, depto)
+                while len(self._tableros) > MAX_TABLEROS:
+                    self._tableros.popitem(last=False)
+            else:
+                self._tableros.move_to_end(clave)
+                self.aciertos += 1
+                if t.pendientes:
+                    self._refrescar(t)
+            return t.vista()
+
+    def al_invalidar(self, tablas, employee_id, fecha):
+        if tablas is not None and not tablas & {"sales", "employees"}:
+            return
+        tienda = tienda_actual()
+        with self._lock:
+            propios = [(k, t) for k, t in self._tableros.items() if k[0] == tienda]
+            if tablas is None or "employees" in tablas or employee_id is None:
+                for k, _ in propios:
+                    del self._tableros[k]
+                return
+            for _, t in propios:
+                if employee_id in t._pos and (fecha is None or t.inicio <= fecha <= t.fin):
+                    t.pendientes.add(employee_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tableros":      len(self._tableros),
+                "construidos":   self.construidos,
+                "incrementales": self.incrementales,
+                "aciertos":      self.aciertos,
+            }
+
+
+leaderboards = _Leaderboards()
+_query_cache.suscribir(leaderboards.al_invalidar)
@@ -1,13 +1,62 @@
-"""Páginas de administración: Empleados, Usuarios, Reportes, Auditoría."""
+"""Páginas de administración: Empleados, Usuarios, Reportes, Tiendas, Auditoría, Sistema."""
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import time
-from datetime import date
-from utils import (execute_query, execute_insert, safe_dataframe,
+from datetime import date, timedelta
+from utils import (execute_query, execute_insert, safe_dataframe, invalidar_cache,
+                   rango_mensual, ventas_por_empleado_sql,
                    CARGOS, DEPARTAMENTOS, get_badge_class)
 from auth import create_user, get_all_users, hash_password, verify_password
-from export_utils import barra_exportacion
+from database import (pool_stats, audit_stats, flush_audit, rebuild_rollups, check_query_plans,
+                      registrar_consulta)
+from query_cache import cache as query_cache
+from export_utils import barra_exportacion, boton_descarga_excel_consulta
+from forecast import modelo_del_dia
+from audit_utils import (buscar_auditoria, contar_auditoria, listar_archivo, archivar_auditoria,
+                         PAGINA, DIAS_EN_LINEA)
+from multitienda import resumen_tiendas, departamentos_por_tienda, tendencia_mensual, top_empleados
+from tiendas import TIENDAS
+from calendario import (reporte_ausencias, detalle_ausencias, listar_festivos, agregar_festivo,
+                        quitar_festivo, DIAS_LABORABLES)
+
+
+def _sql_ventas_departamento(fi, ff):
+    meses = rango_mensual(fi, ff)
+    if meses:
+        return """
+            SELECT d.department, SUM(d.total) total,
+                   SUM(d.total)*1.0/SUM(d.dias) promedio,
+                   (SELECT COUNT(DISTINCT m.employee_id) FROM sales_monthly m
+                      JOIN employees e ON e.id=m.employee_id
+                     WHERE IFNULL(e.department,'')=d.department AND m.month BETWEEN ? AND ?) empleados,
+                   SUM(d.dias) dias_reg
+            FROM sales_dept_monthly d
+            WHERE d.month BETWEEN ? AND ? GROUP BY d.department ORDER BY total DESC
+        """, (*meses, *meses)
+    sub, sub_params = ventas_por_empleado_sql(fi, ff)
+    return f"""
+        SELECT e.department, SUM(v.total) total,
+               SUM(v.total)*1.0/SUM(v.dias) promedio,
+               COUNT(*) empleados, SUM(v.dias) dias_reg
+        FROM ({sub}) v JOIN employees e ON v.employee_id=e.id
+        GROUP BY e.department ORDER BY total DESC
+    """, sub_params
+
+
+def _sql_historial(fi, ff):
+    return """
+        SELECT s.date fecha, e.name empleado, e.department departamento,
+               s.autoliquidable, s.oferta, s.marca, s.adicional,
+               s.autoliquidable+s.oferta+s.marca+s.adicional total
+        FROM sales s JOIN employees e ON e.id=s.employee_id
+        WHERE s.date >= ? AND s.date < ?
+        ORDER BY s.date, e.name
+    """, [str(fi), str(ff + timedelta(days=1))]
+
+
+registrar_consulta("reporte_depto", lambda: _sql_ventas_departamento(date(2024, 1, 1), date(2024, 12, 31)))
+registrar_consulta("historial_detallado", lambda: _sql_historial(date(2024, 1, 1), date(2024, 1, 31)))
 
 
 # ══════════════════════════════════════════════════════════════════════
@@ -138,7 +187,8 @@ def page_empleados():
                 ca,cb = st.columns(2)
                 with ca:
                     if st.button("✅ Sí", key="si_emp"):
-                        execute_insert("DELETE FROM employees WHERE id=?", (sel,), audit_action=f"Eliminar empleado {emp[1]}")
+                        execute_insert("DELETE FROM employees WHERE id=?", (sel,), audit_action=f"Eliminar empleado {emp[1]}",
+                                       employee_id=sel)
                         del st.session_state.confirmar_eliminar_emp
                         st.rerun()
                 with cb:
@@ -244,6 +294,7 @@ def page_reportes():
         "Ventas por cargo",
         "Días sin registro (empleados ausentes)",
         "Cumplimiento de metas",
+        "Historial detallado de ventas",
     ])
 
     col_f1, col_f2 = st.columns(2)
@@ -251,17 +302,13 @@ def page_reportes():
     with col_f2: ff = st.date_input("Hasta", value=date.today(), format="DD/MM/YYYY")
 
     if st.button("🔄 Generar reporte"):
-        st.cache_data.clear()
+        invalidar_cache("sales", "employees")
         st.rerun()
 
+    sub, sub_params = ventas_por_empleado_sql(fi, ff)
+
     if tipo == "Ventas por departamento":
-        df = safe_dataframe("""
-            SELECT e.department, SUM(s.autoliquidable+s.oferta+s.marca+s.adicional) total,
-                   AVG(s.autoliquidable+s.oferta+s.marca+s.adicional) promedio,
-                   COUNT(DISTINCT e.id) empleados, COUNT(s.id) dias_reg
-            FROM sales s JOIN employees e ON s.employee_id=e.id
-            WHERE s.date BETWEEN ? AND ? GROUP BY e.department ORDER BY total DESC
-        """, (fi, ff))
+        df = safe_dataframe(*_sql_ventas_departamento(fi, ff), desde=fi, hasta=ff)
         if not df.empty:
             st.dataframe(df, use_container_width=True, hide_index=True)
             fig = px.bar(df, x="department", y="total", color="department",
@@ -271,39 +318,78 @@ def page_reportes():
             barra_exportacion(df, "Reporte Dept.", nombre_archivo="reporte_depto", key_prefix="rep_d")
 
     elif tipo == "Ventas por cargo":
-        df = safe_dataframe("""
-            SELECT e.position, SUM(s.autoliquidable+s.oferta+s.marca+s.adicional) total,
-                   COUNT(DISTINCT e.id) empleados
-            FROM sales s JOIN employees e ON s.employee_id=e.id
-            WHERE s.date BETWEEN ? AND ? GROUP BY e.position ORDER BY total DESC
-        """, (fi, ff))
+        df = safe_dataframe(f"""
+            SELECT e.position, SUM(v.total) total, COUNT(*) empleados
+            FROM ({sub}) v JOIN employees e ON v.employee_id=e.id
+            GROUP BY e.position ORDER BY total DESC
+        """, sub_params, desde=fi, hasta=ff)
         if not df.empty:
             st.dataframe(df, use_container_width=True, hide_index=True)
             fig = px.pie(df, values="total", names="position", title="Distribución por cargo")
             st.plotly_chart(fig, use_container_width=True)
 
     elif tipo == "Días sin registro (empleados ausentes)":
-        df = safe_dataframe("""
-            SELECT e.name, e.department,
-                   MAX(s.date) ultimo_registro,
-                   CAST(julianday('now') - julianday(MAX(s.date)) AS INTEGER) dias_sin_reg
-            FROM employees e LEFT JOIN sales s ON e.id=s.employee_id
-            GROUP BY e.id HAVING dias_sin_reg > 0 OR MAX(s.date) IS NULL
-            ORDER BY dias_sin_reg DESC
-        """)
+        depto = st.selectbox("Departamento", ["Todos"] + DEPARTAMENTOS, key="aus_depto")
+        df = reporte_ausencias(fi, ff, None if depto == "Todos" else depto)
+        dias = ", ".join(["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"][d] for d in DIAS_LABORABLES)
+        st.caption(f"📅 Días laborables: {dias}, sin festivos. Cada empleado se cuenta desde su primer registro.")
         if not df.empty:
-            st.dataframe(df, use_container_width=True, hide_index=True)
-            st.info("💡 Empleados sin registros recientes pueden necesitar seguimiento.")
+            st.dataframe(df.drop(columns="id").rename(columns={
+                "name": "Empleado", "department": "Departamento", "laborables": "Laborables",
+                "dias_sin_registro": "Sin registro", "racha_max": "Racha máx.",
+                "racha_actual": "Racha actual", "ultimo_registro": "Último registro",
+                "pct_asistencia": "% asistencia"}), use_container_width=True, hide_index=True)
+            st.info("💡 Una racha actual mayor que 0 indica que el empleado lleva esos días laborables sin registrar.")
+            barra_exportacion(df.drop(columns="id"), "Ausencias", nombre_archivo="ausencias", key_prefix="rep_a")
+
+            con_faltas = df[df["dias_sin_registro"] > 0]
+            if not con_faltas.empty:
+                nombres = dict(zip(con_faltas["id"], con_faltas["name"]))
+                emp = st.selectbox("Ver días sin registro de", list(nombres), format_func=nombres.get, key="aus_emp")
+                faltas = detalle_ausencias(emp, fi, ff)
+                st.write(", ".join(f"{d:%d/%m/%Y}" for d in faltas) or "—")
+
+        with st.expander("🎉 Festivos"):
+            with st.form("form_festivo", clear_on_submit=True):
+                c1, c2 = st.columns([1, 2])
+                with c1: f_fecha = st.date_input("Fecha", format="DD/MM/YYYY")
+                with c2: f_nombre = st.text_input("Nombre", placeholder="Ej: Navidad")
+                if st.form_submit_button("➕ Agregar festivo") and agregar_festivo(f_fecha, f_nombre):
+                    st.success(f"✅ Festivo {f_fecha:%d/%m/%Y} guardado.")
+                    st.rerun()
+            festivos = listar_festivos()
+            if festivos.empty:
+                st.caption("No hay festivos registrados.")
+            for _, f in festivos.iterrows():
+                c1, c2 = st.columns([4, 1])
+                c1.write(f"**{f['fecha']}** {f['nombre']}")
+                if c2.button("🗑️", key=f"fest_del_{f['fecha']}") and quitar_festivo(f["fecha"]):
+                    st.rerun()
 
     elif tipo == "Cumplimiento de metas":
-        df = safe_dataframe("""
-            SELECT e.name, e.department, e.goal meta,
-                   COALESCE(SUM(s.autoliquidable+s.oferta+s.marca+s.adicional),0) actual,
-                   ROUND(COALESCE(SUM(s.autoliquidable+s.oferta+s.marca+s.adicional),0)*100.0/e.goal,1) pct
-            FROM employees e LEFT JOIN sales s ON e.id=s.employee_id AND s.date BETWEEN ? AND ?
-            GROUP BY e.id ORDER BY pct DESC
-        """, (fi, ff))
+        df = safe_dataframe(f"""
+            SELECT e.id, e.name, e.department, e.goal meta,
+                   COALESCE(v.total,0) actual,
+                   ROUND(COALESCE(v.total,0)*100.0/e.goal,1) pct
+            FROM employees e LEFT JOIN ({sub}) v ON v.employee_id=e.id
+            ORDER BY pct DESC
+        """, sub_params, desde=fi, hasta=ff)
+        # Mes en curso: se agrega la proyección a fin de mes
+        hoy = date.today()
+        if not df.empty and fi == hoy.replace(day=1) and ff >= hoy:
+            modelo = modelo_del_dia()
+            proy = modelo.tabla(df.set_index("id")["actual"])
+            df = df.merge(proy[["employee_id", "pronostico", "pct_proyectado", "por_dia_necesario"]]
+                          .rename(columns={"employee_id": "id", "pronostico": "proyeccion"}), on="id", how="left")
+            st.caption(f"📈 Proyección a fin de mes (media de ritmo, estacionalidad semanal y suavizado "
+                       f"exponencial) · faltan {modelo.restantes} día(s)")
+            st.dataframe(modelo.por_departamento(proy)
+                         .rename(columns={"department": "Departamento", "goal": "Meta", "actual": "Actual",
+                                          "pronostico": "Proyección", "pct_proyectado": "% proyectado"})
+                         [["Departamento", "Meta", "Actual", "Proyección", "% proyectado"]],
+                         use_container_width=True, hide_index=True)
         if not df.empty:
+            df = df.drop(columns="id")
             fig = px.bar(df, x="name", y="pct", color="pct",
                          color_continuous_scale=["#dc2626","#d97706","#16a34a"],
                          range_color=[0,120], title="Cumplimiento de metas (%)",
@@ -314,6 +400,75 @@ def page_reportes():
             st.plotly_chart(fig, use_container_width=True)
             barra_exportacion(df, "Cumplimiento Metas", nombre_archivo="cumplimiento", key_prefix="rep_c")
 
+    elif tipo == "Historial detallado de ventas":
+        # Un año de historial no cabe cómodo en un DataFrame: se exporta
+        # directamente desde el cursor, por bloques.
+        hist_sql, hist_params = _sql_historial(fi, ff)
+        n = safe_dataframe("SELECT COUNT(*) n FROM sales WHERE date >= ? AND date < ?",
+                           hist_params, desde=fi, hasta=ff)
+        n = int(n["n"].iloc[0]) if not n.empty else 0
+        st.info(f"📄 {n:,} registros entre {fi:%d/%m/%Y} y {ff:%d/%m/%Y}.")
+        if n and st.button("📊 Preparar Excel", key="rep_hist_prep"):
+            with st.spinner("Generando Excel…"):
+                boton_descarga_excel_consulta(
+                    hist_sql, hist_params, "Historial de Ventas",
+                    f"{fi:%d/%m/%Y} → {ff:%d/%m/%Y}", nombre_archivo="historial_ventas",
+                    label="⬇️ Descargar Excel", key="rep_hist_excel",
+                )
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  TIENDAS (vista consolidada)
+# ══════════════════════════════════════════════════════════════════════
+def page_tiendas():
+    st.title("🏬 Comparativo de tiendas")
+    st.caption(f"{len(TIENDAS)} tiendas · cada una se consulta en su propia base y solo se combinan los totales.")
+
+    col_f1, col_f2 = st.columns(2)
+    with col_f1: fi = st.date_input("Desde", value=date.today().replace(day=1), format="DD/MM/YYYY", key="tie_fi")
+    with col_f2: ff = st.date_input("Hasta", value=date.today(), format="DD/MM/YYYY", key="tie_ff")
+
+    resumen = resumen_tiendas(fi, ff)
+    if resumen.empty:
+        st.info("ℹ️ No hay datos en el período seleccionado.")
+        return
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Unidades (todas las tiendas)", f"{int(resumen['unidades'].sum()):,}")
+    c2.metric("Empleados", f"{int(resumen['empleados'].sum()):,}")
+    meta = resumen["meta"].sum()
+    c3.metric("Cumplimiento global", f"{resumen['unidades'].sum() * 100 / meta:.1f}%" if meta else "—")
+
+    st.dataframe(resumen.rename(columns={
+        "tienda": "Tienda", "empleados": "Empleados", "meta": "Meta", "unidades": "Unidades",
+        "dias_registrados": "Días registrados", "pct_meta": "% meta", "por_empleado": "Por empleado"}),
+        use_container_width=True, hide_index=True)
+    fig = px.bar(resumen, x="tienda", y="unidades", color="tienda", text="unidades",
+                 title="Unidades por tienda", labels={"tienda": "Tienda", "unidades": "Unidades"})
+    fig.update_traces(texttemplate="%{text:,}", textposition="outside")
+    st.plotly_chart(fig, use_container_width=True)
+
+    tab_d, tab_m, tab_t = st.tabs(["🏷️ Departamentos", "📅 Tendencia mensual", "🏆 Top empleados"])
+    with tab_d:
+        deptos = departamentos_por_tienda(fi, ff)
+        if not deptos.empty:
+            st.dataframe(deptos.rename(columns={"department": "Departamento"}),
+                         use_container_width=True, hide_index=True)
+            barra_exportacion(deptos, "Departamentos por tienda", nombre_archivo="tiendas_deptos",
+                              key_prefix="tie_d")
+    with tab_m:
+        meses = tendencia_mensual(fi, ff)
+        if not meses.empty:
+            fig = px.line(meses, x="month", y="total", color="tienda", markers=True,
+                          labels={"month": "Mes", "total": "Unidades", "tienda": "Tienda"})
+            st.plotly_chart(fig, use_container_width=True)
+    with tab_t:
+        top = top_empleados(fi, ff, 10)
+        if not top.empty:
+            st.dataframe(top.rename(columns={"tienda": "Tienda", "name": "Empleado", "department": "Departamento",
+                                             "goal": "Meta", "total": "Unidades"}),
+                         use_container_width=True, hide_index=True)
+
 
 # ══════════════════════════════════════════════════════════════════════
 #  LOG DE AUDITORÍA
@@ -322,26 +477,154 @@ def page_auditoria():
     st.title("🔍 Log de Auditoría")
     st.caption("Registro de acciones realizadas por usuarios en el sistema.")
 
-    df = safe_dataframe("""
-        SELECT username, action, table_name, detail,
-               datetime(created_at,'localtime') as fecha
-        FROM audit_log ORDER BY created_at DESC LIMIT 200
-    """)
+    flush_audit()   # mostrar también lo que sigue en la cola de escritura
+
+    usuarios = safe_dataframe("SELECT DISTINCT username FROM audit_log WHERE username IS NOT NULL ORDER BY username")
+    tablas = safe_dataframe("SELECT DISTINCT table_name FROM audit_log WHERE table_name IS NOT NULL ORDER BY table_name")
+
+    buscar = st.text_input("🔎 Buscar en acciones, usuarios y detalles",
+                           placeholder="Ej: editar ventas, importación, admin…")
+    col_u, col_t, col_d, col_h = st.columns(4)
+    with col_u:
+        usuario = st.selectbox("Usuario", ["Todos"] + usuarios["username"].tolist() if not usuarios.empty else ["Todos"])
+    with col_t:
+        tabla = st.selectbox("Tabla", ["Todas"] + tablas["table_name"].tolist() if not tablas.empty else ["Todas"])
+    with col_d:
+        desde = st.date_input("Desde", value=None, max_value=date.today())
+    with col_h:
+        hasta = st.date_input("Hasta", value=None, max_value=date.today())
+
+    archivados = listar_archivo()
+    if archivados and not desde:
+        st.caption(f"🗄️ {len(archivados)} mes(es) archivados ({archivados[-1]} a {archivados[0]}). "
+                   "Elige una fecha «Desde» para incluirlos en la búsqueda.")
+
+    filtros = dict(
+        usuario=None if usuario == "Todos" else usuario,
+        tabla=None if tabla == "Todas" else tabla,
+        desde=desde, hasta=hasta, texto=buscar.strip() or None,
+    )
+    # Pila de cursores: cursores[i] es el inicio de la página i. Se reinicia
+    # cuando cambian los filtros.
+    huella = tuple(filtros.items())
+    if st.session_state.get("aud_filtros") != huella:
+        st.session_state.aud_filtros = huella
+        st.session_state.aud_cursores = [None]
+    cursores = st.session_state.aud_cursores
+
+    df, siguiente = buscar_auditoria(**filtros, despues_de=cursores[-1])
+    total = contar_auditoria(**filtros)
 
     if df.empty:
-        st.info("No hay registros de auditoría aún.")
+        st.info("No hay registros de auditoría con estos filtros." if total == 0 and any(filtros.values())
+                else "No hay registros de auditoría aún.")
         return
 
-    col_f, col_u = st.columns(2)
-    with col_f:
-        buscar = st.text_input("🔎 Buscar acción o usuario")
-    with col_u:
+    pagina = len(cursores)
+    paginas = max(1, -(-total // PAGINA))
+    st.caption(f"{total:,} registro(s) · página {pagina:,} de {paginas:,}")
+    st.dataframe(df[["fecha", "username", "action", "table_name", "detail"]],
+                 use_container_width=True, hide_index=True)
+
+    c_ant, c_sig, c_act = st.columns([1, 1, 4])
+    with c_ant:
+        if st.button("⬅️ Anterior", disabled=pagina == 1, use_container_width=True):
+            cursores.pop(); st.rerun()
+    with c_sig:
+        if st.button("Siguiente ➡️", disabled=siguiente is None, use_container_width=True):
+            cursores.append(siguiente); st.rerun()
+    with c_act:
         if st.button("🔄 Actualizar"):
-            st.cache_data.clear(); st.rerun()
+            invalidar_cache("audit_log"); st.rerun()
 
-    if buscar:
-        mask = df.apply(lambda r: buscar.lower() in str(r).lower(), axis=1)
-        df = df[mask]
+    barra_exportacion(df.drop(columns=["id", "created_at"]), "Auditoría",
+                      nombre_archivo="auditoria", key_prefix="aud")
 
-    st.dataframe(df, use_container_width=True, hide_index=True)
-    barra_exportacion(df, "Auditoría", nombre_archivo="auditoria", key_prefix="aud")
+
+# ══════════════════════════════════════════════════════════════════════
+#  SISTEMA
+# ══════════════════════════════════════════════════════════════════════
+def page_sistema():
+    st.title("🖥️ Estado del Sistema")
+    st.caption("Métricas internas del proceso actual (se reinician al reiniciar la app).")
+
+    st.subheader("🔌 Conexiones a la base de datos")
+    ps = pool_stats()
+    total = ps["abiertas"] + ps["reutilizadas"]
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Abiertas", f"{ps['abiertas']:,}")
+    c2.metric("Reutilizadas", f"{ps['reutilizadas']:,}")
+    c3.metric("Activas", ps["activas"])
+    c4.metric("Tasa de reutilización", f"{(ps['reutilizadas'] / total * 100) if total else 0:.1f}%")
+
+    st.subheader("⚡ Caché de consultas")
+    cs = query_cache.stats()   # todas las tiendas: el presupuesto es común
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("Entradas", cs["entradas"])
+    c2.metric("Aciertos", f"{cs['aciertos']:,}", help=f"Tasa de aciertos: {cs['tasa_aciertos']:.1f}%")
+    c3.metric("Fallos", f"{cs['fallos']:,}")
+    c4.metric("Expiradas (TTL)", f"{cs['expiradas']:,}")
+    c5.metric("Invalidadas", f"{cs['invalidadas']:,}")
+
+    uso = cs["bytes"] / cs["max_bytes"] if cs["max_bytes"] else 0
+    st.progress(min(uso, 1.0),
+                text=f"Memoria: {cs['bytes'] / 1048576:.1f} MB de {cs['max_bytes'] / 1048576:.0f} MB "
+                     f"· {cs['desalojadas']:,} desalojadas por presupuesto (LRU)")
+    if len(TIENDAS) > 1:
+        por_tienda = []
+        for codigo, nombre in TIENDAS.items():
+            st_t = query_cache.stats(codigo)
+            por_tienda.append({"Tienda": nombre, "Entradas": st_t["entradas"], "Aciertos": st_t["aciertos"],
+                               "Fallos": st_t["fallos"], "Invalidadas": st_t["invalidadas"],
+                               "MB": round(st_t["bytes"] / 1048576, 1)})
+        st.caption("Las tiendas comparten la caché y su presupuesto de memoria; arriba, el total.")
+        st.dataframe(pd.DataFrame(por_tienda), use_container_width=True, hide_index=True)
+
+    st.subheader("📝 Escritura de auditoría")
+    au = audit_stats()
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("En cola", au["profundidad"], help=f"Máximo: {au['max_profundidad']:,} de {au['capacidad']:,}")
+    c2.metric("Escritos", f"{au['escritos']:,}")
+    c3.metric("Transacciones", f"{au['lotes']:,}", help=f"{au['filas_por_lote']:.1f} eventos por transacción")
+    c4.metric("Latencia de vaciado", f"{au['media_ms']:.1f} ms", help=f"Último lote: {au['ultima_ms']:.1f} ms")
+    c5.metric("Escritos en línea", f"{au['en_linea']:,}", help="Eventos escritos sin cola porque estaba llena")
+    if au["perdidos"]:
+        st.warning(f"⚠️ {au['perdidos']:,} evento(s) de auditoría no se pudieron escribir.")
+
+    st.subheader("🗄️ Archivo de auditoría")
+    archivados = listar_archivo()
+    st.caption(f"Los meses con más de {DIAS_EN_LINEA} días se mueven a archivos comprimidos "
+               f"(uno por mes) y siguen disponibles en la página de Auditoría. "
+               f"Meses archivados: {len(archivados)}.")
+    if st.button("🗄️ Archivar auditoría antigua"):
+        with st.spinner("Archivando…"):
+            try:
+                r = archivar_auditoria()
+                if r["filas"]:
+                    st.success(f"✅ {r['filas']:,} registro(s) de {len(r['meses'])} mes(es) archivados "
+                               f"({r['bytes'] / 1024:.0f} KB).")
+                else:
+                    st.info("No hay meses para archivar.")
+            except Exception as e:
+                st.error(f"❌ Error al archivar: {e}")
+
+    st.subheader("🧮 Agregados de ventas")
+    st.caption("Las tablas de agregados diarios y mensuales se actualizan solas al guardar ventas. "
+               "Reconstrúyelas solo si se modificó la base de datos por fuera de la aplicación.")
+    if st.button("🔁 Reconstruir agregados"):
+        with st.spinner("Reconstruyendo agregados desde la tabla de ventas…"):
+            try:
+                rebuild_rollups()
+                invalidar_cache("sales")
+                st.success("✅ Agregados reconstruidos.")
+            except Exception as e:
+                st.error(f"❌ Error al reconstruir: {e}")
+
+    st.subheader("🗂️ Planes de consulta")
+    if st.button("🔎 Verificar índices"):
+        problemas = check_query_plans()
+        if not problemas:
+            st.success("✅ Todas las consultas de las páginas usan índices.")
+        else:
+            for nombre, pasos in problemas.items():
+                st.error(f"❌ {nombre}: {'; '.join(pasos)}")
@@ -6,8 +6,36 @@ import time
 from datetime import date
 from utils import (execute_query, execute_insert, safe_dataframe,
                    get_employee_info, get_badge_class, periodo_a_fecha,
-                   render_progress, check_meta_celebration, DEPARTAMENTOS)
+                   render_progress, check_meta_celebration, acumulado_mes,
+                   guardar_afiliaciones, invalidar_cache, DEPARTAMENTOS)
 from export_utils import barra_exportacion
+from database import registrar_consulta
+
+
+def _sql_ranking(desde, depto=None):
+    q = """
+        SELECT e.name Empleado, e.department Departamento, e.meta_afiliaciones Meta,
+               COALESCE(SUM(a.cantidad),0) Total,
+               COUNT(DISTINCT a.fecha) Dias,
+               ROUND(COALESCE(SUM(a.cantidad),0)*100.0/e.meta_afiliaciones,1) Pct
+        FROM employees e LEFT JOIN afiliaciones a ON e.id=a.employee_id AND a.fecha>=?
+    """
+    params = [desde]
+    if depto: q += " WHERE e.department=?"; params.append(depto)
+    q += " GROUP BY e.id ORDER BY Total DESC"
+    return q, params
+
+
+def _sql_reporte(desde, hasta):
+    return """
+        SELECT a.fecha, e.department, e.name empleado, a.cantidad
+        FROM afiliaciones a JOIN employees e ON a.employee_id=e.id
+        WHERE a.fecha BETWEEN ? AND ? ORDER BY a.fecha DESC
+    """, (desde, hasta)
+
+
+registrar_consulta("afiliaciones_ranking", lambda: _sql_ranking(date(2024, 1, 1), "Droguería"))
+registrar_consulta("afiliaciones_reporte", lambda: _sql_reporte(date(2024, 1, 1), date(2024, 1, 31)))
 
 
 def page_registrar_afiliaciones():
@@ -49,10 +77,7 @@ def page_registrar_afiliaciones():
         cantidad = st.number_input("Cantidad de afiliaciones", min_value=0, step=1,
                                    value=cant_existente if ya_reg else 1)
 
-        mes  = fecha.strftime("%Y-%m")
-        res  = execute_query("SELECT SUM(cantidad) FROM afiliaciones WHERE employee_id=? AND fecha LIKE ?",
-                             (emp_info[0], f"{mes}%"))
-        afil_mes = res[0][0] or 0 if res else 0
+        afil_mes = acumulado_mes(emp_info[0], fecha, "afiliaciones")
         afil_mes_adj = (afil_mes - cant_existente + cantidad) if ya_reg else (afil_mes + cantidad)
 
         render_progress(afil_mes_adj, meta_afil, "Progreso mensual de afiliaciones")
@@ -65,28 +90,19 @@ def page_registrar_afiliaciones():
             if cantidad == 0:
                 st.warning("⚠️ Ingresa al menos una afiliación.")
             else:
-                if ya_reg:
-                    ok = execute_insert(
-                        "UPDATE afiliaciones SET cantidad=? WHERE employee_id=? AND fecha=?",
-                        (cantidad, emp_info[0], str(fecha)),
-                        audit_action=f"Editar afiliaciones {fecha}",
-                    )
-                else:
-                    ok = execute_insert(
-                        "INSERT INTO afiliaciones (employee_id,fecha,cantidad) VALUES (?,?,?)",
-                        (emp_info[0], str(fecha), cantidad),
-                        audit_action=f"Registrar afiliaciones {fecha}",
-                    )
-                if ok:
+                accion = "Editar" if ya_reg else "Registrar"
+                total_mes = guardar_afiliaciones(emp_info[0], fecha, cantidad,
+                                                 audit_action=f"{accion} afiliaciones {fecha}")
+                if total_mes is not None:
                     st.success(f"✅ {cantidad} afiliación(es) guardadas para el {fecha.strftime('%d/%m/%Y')}.")
-                    check_meta_celebration(afil_mes_adj, meta_afil)
+                    check_meta_celebration(total_mes, meta_afil)
                     time.sleep(1); st.rerun()
 
     st.divider()
     st.subheader("📋 Historial reciente")
     df_h = safe_dataframe(
         "SELECT fecha Fecha, cantidad Afiliaciones FROM afiliaciones WHERE employee_id=? ORDER BY fecha DESC LIMIT 15",
-        (emp_info[0],),
+        (emp_info[0],), employee_id=emp_info[0],
     )
     if not df_h.empty:
         df_h["Fecha"] = pd.to_datetime(df_h["Fecha"]).dt.strftime("%d/%m/%Y")
@@ -108,12 +124,13 @@ def page_mis_afiliaciones():
     with col_p: periodo = st.selectbox("Período", ["Esta semana","Este mes","Este trimestre","Este año","Todo"])
     with col_b:
         st.markdown("<br>", unsafe_allow_html=True)
-        if st.button("🔄 Actualizar"): st.cache_data.clear(); st.rerun()
+        if st.button("🔄 Actualizar"):
+            invalidar_cache("afiliaciones", employee_id=emp_info[0]); st.rerun()
 
     fi = periodo_a_fecha(periodo)
     df = safe_dataframe(
         "SELECT fecha, cantidad FROM afiliaciones WHERE employee_id=? AND fecha>=? ORDER BY fecha DESC",
-        (emp_info[0], fi),
+        (emp_info[0], fi), employee_id=emp_info[0], desde=fi,
     )
 
     if df.empty:
@@ -167,17 +184,7 @@ def page_admin_afiliaciones():
         with col_d: depto   = st.selectbox("Departamento", ["Todos"]+DEPARTAMENTOS, key="r_depto")
 
         fi = periodo_a_fecha(periodo)
-        q = """
-            SELECT e.name Empleado, e.department Departamento, e.meta_afiliaciones Meta,
-                   COALESCE(SUM(a.cantidad),0) Total,
-                   COUNT(DISTINCT a.fecha) Dias,
-                   ROUND(COALESCE(SUM(a.cantidad),0)*100.0/e.meta_afiliaciones,1) Pct
-            FROM employees e LEFT JOIN afiliaciones a ON e.id=a.employee_id AND a.fecha>=?
-        """
-        params = [fi]
-        if depto != "Todos": q += " WHERE e.department=?"; params.append(depto)
-        q += " GROUP BY e.id ORDER BY Total DESC"
-        df = safe_dataframe(q, params)
+        df = safe_dataframe(*_sql_ranking(fi, depto if depto != "Todos" else None), desde=fi)
 
         if not df.empty:
             st.dataframe(df, use_container_width=True, hide_index=True)
@@ -192,11 +199,7 @@ def page_admin_afiliaciones():
         c1, c2 = st.columns(2)
         with c1: fi = st.date_input("Desde", value=date.today().replace(day=1), key="rep_fi", format="DD/MM/YYYY")
         with c2: ff = st.date_input("Hasta", value=date.today(), key="rep_ff", format="DD/MM/YYYY")
-        df = safe_dataframe("""
-            SELECT a.fecha, e.department, e.name empleado, a.cantidad
-            FROM afiliaciones a JOIN employees e ON a.employee_id=e.id
-            WHERE a.fecha BETWEEN ? AND ? ORDER BY a.fecha DESC
-        """, (fi, ff))
+        df = safe_dataframe(*_sql_reporte(fi, ff), desde=fi, hasta=ff)
         if df.empty: st.info("Sin registros en el período.")
         else:
             c1,c2,c3 = st.columns(3)
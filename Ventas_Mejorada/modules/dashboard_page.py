@@ -4,8 +4,11 @@ import pandas as pd
 import plotly.express as px
 from datetime import date
 from dateutil.relativedelta import relativedelta
-from utils import safe_dataframe, DEPARTAMENTOS, DEPT_COLORS
+from utils import safe_dataframe, invalidar_cache, DEPARTAMENTOS, DEPT_COLORS
+from database import registrar_consulta
 from export_utils import barra_exportacion
+from query_cache import cache as query_cache
+from sales_cube import VentasCubo, CATEGORIAS, ETIQUETAS
 
 
 def _mes_anterior_range(fecha_inicio, fecha_fin):
@@ -16,6 +19,73 @@ def _mes_anterior_range(fecha_inicio, fecha_fin):
     return ini_ant, fin_ant
 
 
+def _sql_dashboard(fecha_inicio, fecha_fin, ini_ant, fin_ant, departamentos):
+    filtro, filtro_params = "", []
+    if departamentos:
+        filtro = f" AND e.department IN ({','.join(['?'] * len(departamentos))})"
+        filtro_params = list(departamentos)
+    query = f"""
+        SELECT 'actual' AS periodo, s.date, e.name, e.department,
+               s.autoliquidable, s.oferta, s.marca, s.adicional, s.total
+        FROM sales_daily s JOIN employees e ON s.employee_id = e.id
+        WHERE s.date BETWEEN ? AND ?{filtro}
+        UNION ALL
+        SELECT 'anterior', NULL, NULL, NULL,
+               COALESCE(SUM(s.autoliquidable),0), COALESCE(SUM(s.oferta),0),
+               COALESCE(SUM(s.marca),0), COALESCE(SUM(s.adicional),0), COALESCE(SUM(s.total),0)
+        FROM sales_daily s JOIN employees e ON s.employee_id = e.id
+        WHERE s.date BETWEEN ? AND ?{filtro}
+    """
+    params = [str(fecha_inicio), str(fecha_fin), *filtro_params,
+              str(ini_ant), str(fin_ant), *filtro_params]
+    return query, params
+
+
+registrar_consulta("dashboard", lambda: _sql_dashboard(
+    date(2024, 1, 1), date(2024, 1, 31), date(2023, 12, 1), date(2023, 12, 31), ["Droguería", "Cajas"]))
+
+
+def cargar_datos_dashboard(fecha_inicio, fecha_fin, departamentos):
+    """Detalle del período y agregados del período anterior en una consulta.
+
+    Devuelve (df, anterior, (ini_ant, fin_ant)): `df` trae solo las columnas
+    que usan los gráficos (una fila por empleado y día) y `anterior` es un
+    dict con los totales por categoría y el total del período anterior.
+    La fila 'anterior' siempre existe: sin filas, la consulta falló y `df`
+    es None.
+    """
+    ini_ant, fin_ant = _mes_anterior_range(fecha_inicio, fecha_fin)
+    query, params = _sql_dashboard(fecha_inicio, fecha_fin, ini_ant, fin_ant, departamentos)
+    res = safe_dataframe(query, params, desde=ini_ant, hasta=fecha_fin)
+    if res.empty:
+        return None, {c: 0 for c in CATEGORIAS + ["total"]}, (ini_ant, fin_ant)
+
+    es_anterior = res["periodo"] == "anterior"
+    fila_ant = res.loc[es_anterior].iloc[0]
+    anterior = {c: int(fila_ant[c]) for c in CATEGORIAS + ["total"]}
+    df = res.loc[~es_anterior].drop(columns="periodo").reset_index(drop=True)
+    return df, anterior, (ini_ant, fin_ant)
+
+
+def cargar_cubo(fecha_inicio, fecha_fin, departamentos):
+    """VentasCubo del filtro, construido una vez y guardado en la caché de
+    consultas con las mismas etiquetas que sus datos.
+
+    Devuelve (cubo o None si no hay ventas, anterior, (ini_ant, fin_ant)).
+    """
+    clave = ("cubo_dashboard", str(fecha_inicio), str(fecha_fin), tuple(departamentos or ()))
+    guardado = query_cache.get(clave)
+    if guardado is not None:
+        return guardado
+    df, anterior, rango_ant = cargar_datos_dashboard(fecha_inicio, fecha_fin, departamentos)
+    if df is None:
+        return None, anterior, rango_ant   # un error no se guarda: se reintenta en la próxima carga
+    resultado = (VentasCubo(df) if not df.empty else None, anterior, rango_ant)
+    query_cache.put(clave, resultado, frozenset({"sales_daily", "employees"}),
+                    desde=rango_ant[0], hasta=fecha_fin)
+    return resultado
+
+
 def page_dashboard():
     st.title("📊 Dashboard de Ventas")
 
@@ -29,47 +99,20 @@ def page_dashboard():
         depto_filtro = st.multiselect("Departamento", DEPARTAMENTOS, default=DEPARTAMENTOS)
 
     if st.button("🔄 Recargar"):
-        st.cache_data.clear()
+        invalidar_cache("sales", "employees")
         st.rerun()
 
-    # ── Query principal ───────────────────────────────────────────────
-    base_query = """
-        SELECT s.*, e.name, e.position, e.department
-        FROM sales s JOIN employees e ON s.employee_id = e.id
-        WHERE date BETWEEN ? AND ?
-    """
-    params = [fecha_inicio, fecha_fin]
-    if depto_filtro:
-        ph = ",".join(["?"] * len(depto_filtro))
-        base_query += f" AND e.department IN ({ph})"
-        params.extend(depto_filtro)
-    base_query += " ORDER BY date DESC"
-
-    df = safe_dataframe(base_query, params)
-    if df.empty:
+    # ── Datos: período actual + agregados del anterior (una consulta) ──
+    cubo, anterior, (ini_ant, fin_ant) = cargar_cubo(fecha_inicio, fecha_fin, depto_filtro)
+    if cubo is None:
         st.info("ℹ️ No hay ventas en el período seleccionado.")
         return
 
-    df["total"] = df[["autoliquidable", "oferta", "marca", "adicional"]].sum(axis=1)
-    df["date"] = pd.to_datetime(df["date"])
-
-    # ── Comparativo período anterior ──────────────────────────────────
-    ini_ant, fin_ant = _mes_anterior_range(fecha_inicio, fecha_fin)
-    params_ant = [ini_ant, fin_ant]
-    q_ant = base_query.replace("WHERE date BETWEEN ? AND ?", "WHERE date BETWEEN ? AND ?")
-    if depto_filtro:
-        ph = ",".join(["?"] * len(depto_filtro))
-        params_ant_full = [ini_ant, fin_ant] + depto_filtro
-    else:
-        params_ant_full = [ini_ant, fin_ant]
-    df_ant = safe_dataframe(base_query, params_ant_full)
-    total_anterior = 0
-    if not df_ant.empty:
-        df_ant["total"] = df_ant[["autoliquidable", "oferta", "marca", "adicional"]].sum(axis=1)
-        total_anterior = int(df_ant["total"].sum())
+    total_anterior = anterior["total"]
+    cat = cubo.totales_categoria()
 
     # ── KPIs ──────────────────────────────────────────────────────────
-    total_actual = int(df["total"].sum())
+    total_actual = cubo.total()
     delta_pct = ((total_actual - total_anterior) / total_anterior * 100) if total_anterior else None
     delta_str = f"{delta_pct:+.1f}% vs período anterior" if delta_pct is not None else None
 
@@ -77,11 +120,11 @@ def page_dashboard():
     with col1:
         st.metric("Total Unidades", f"{total_actual:,}", delta=delta_str)
     with col2:
-        st.metric("Autoliquidable", f"{int(df['autoliquidable'].sum()):,}")
+        st.metric("Autoliquidable", f"{cat['autoliquidable']:,}")
     with col3:
-        st.metric("Oferta Semana", f"{int(df['oferta'].sum()):,}")
+        st.metric("Oferta Semana", f"{cat['oferta']:,}")
     with col4:
-        st.metric("Marca Propia", f"{int(df['marca'].sum()):,}")
+        st.metric("Marca Propia", f"{cat['marca']:,}")
 
     # ── Tabs ──────────────────────────────────────────────────────────
     tab1, tab2, tab3, tab4 = st.tabs(["📈 Evolución", "📊 Distribución", "👥 Por empleado", "📅 Comparativo"])
@@ -89,7 +132,7 @@ def page_dashboard():
     with tab1:
         vista = st.radio("Ver:", ["📊 Todas las áreas", "🔍 Por departamento"], horizontal=True)
         if vista == "📊 Todas las áreas":
-            df_pivot = df.pivot_table(index="date", columns="department", values="total", aggfunc="sum", fill_value=0).reset_index()
+            df_pivot = cubo.serie_departamentos()
             if len(df_pivot.columns) > 1:
                 fig = px.area(df_pivot, x="date", y=df_pivot.columns[1:],
                               title="Evolución de ventas – todas las áreas",
@@ -98,55 +141,40 @@ def page_dashboard():
                 fig.update_layout(hovermode="x unified", height=450)
                 st.plotly_chart(fig, use_container_width=True)
         else:
-            deptos = df["department"].unique()
-            depto = st.selectbox("Departamento:", deptos)
-            df_d = df[df["department"] == depto].groupby("date").agg(
-                autoliquidable=("autoliquidable","sum"), oferta=("oferta","sum"),
-                marca=("marca","sum"), adicional=("adicional","sum")
-            ).reset_index()
-            df_m = df_d.melt(id_vars=["date"], value_vars=["autoliquidable","oferta","marca","adicional"],
-                             var_name="Categoría", value_name="Unidades")
-            df_m["Categoría"] = df_m["Categoría"].map({
-                "autoliquidable":"Autoliquidable","oferta":"Oferta","marca":"Marca Propia","adicional":"Adicional"})
+            depto = st.selectbox("Departamento:", list(cubo.deptos))
+            df_m = cubo.serie_categorias(depto)
             fig = px.line(df_m, x="date", y="Unidades", color="Categoría",
                           title=f"Evolución {depto}", markers=True)
             fig.update_layout(height=450, hovermode="x unified")
             st.plotly_chart(fig, use_container_width=True)
 
         st.divider()
-        df_daily = df.groupby("date")["total"].sum().reset_index()
+        diario = cubo.estadisticas_diarias()
         c1, c2, c3 = st.columns(3)
-        c1.metric("Promedio diario", f"{int(df_daily['total'].mean()):,}")
-        mejor = df_daily.loc[df_daily["total"].idxmax()]
-        c2.metric("Mejor día", f"{int(mejor['total']):,}", help=f"{mejor['date'].strftime('%d/%m/%Y')}")
-        c3.metric("Total período", f"{int(df_daily['total'].sum()):,}")
+        c1.metric("Promedio diario", f"{int(diario['promedio']):,}")
+        c2.metric("Mejor día", f"{diario['mejor']:,}", help=f"{diario['mejor_dia'].strftime('%d/%m/%Y')}")
+        c3.metric("Total período", f"{diario['total']:,}")
 
     with tab2:
-        dist = df.groupby("department")[["autoliquidable","oferta","marca","adicional"]].sum().reset_index()
-        dist_m = dist.melt(id_vars=["department"], var_name="Tipo", value_name="Cantidad")
-        dist_m["Tipo"] = dist_m["Tipo"].map({"autoliquidable":"Autoliquidable","oferta":"Oferta","marca":"Marca Propia","adicional":"Adicional"})
+        dist_m = cubo.distribucion()
         fig2 = px.bar(dist_m, x="department", y="Cantidad", color="Tipo", barmode="stack",
                       title="Distribución por departamento", text="Cantidad")
         fig2.update_traces(texttemplate="%{text}", textposition="inside")
         st.plotly_chart(fig2, use_container_width=True)
 
-        totales = df[["autoliquidable","oferta","marca","adicional"]].sum()
         pie_df = pd.DataFrame({
-            "Tipo":["Autoliquidable","Oferta","Marca Propia","Adicional"],
-            "Cantidad":[totales["autoliquidable"],totales["oferta"],totales["marca"],totales["adicional"]]
+            "Tipo": [ETIQUETAS[c] for c in CATEGORIAS],
+            "Cantidad": [cat[c] for c in CATEGORIAS],
         })
         fig_pie = px.pie(pie_df, values="Cantidad", names="Tipo", title="Distribución porcentual total")
         fig_pie.update_traces(textposition="inside", textinfo="percent+label")
         st.plotly_chart(fig_pie, use_container_width=True)
 
     with tab3:
-        emp_res = df.groupby(["name","department"]).agg(
-            autoliquidable=("autoliquidable","sum"), oferta=("oferta","sum"),
-            marca=("marca","sum"), adicional=("adicional","sum"), total=("total","sum")
-        ).reset_index().sort_values(["department","total"], ascending=[True,False])
+        emp_res = cubo.por_empleado()
 
         if not emp_res.empty:
-            em = emp_res.melt(id_vars=["name","department"], value_vars=["autoliquidable","oferta","marca","adicional"],
+            em = emp_res.melt(id_vars=["name","department"], value_vars=CATEGORIAS,
                               var_name="Categoría", value_name="Cantidad")
             em["Categoría"] = em["Categoría"].map({"autoliquidable":"Auto","oferta":"Oferta","marca":"Marca","adicional":"Adicional"})
             fig_e = px.bar(em, x="name", y="Cantidad", color="Categoría", barmode="stack",
@@ -155,11 +183,15 @@ def page_dashboard():
             st.plotly_chart(fig_e, use_container_width=True)
 
             st.subheader("📋 Tabla de rendimiento")
-            tabla = emp_res.copy()
-            for c in ["autoliquidable","oferta","marca","adicional","total"]:
-                tabla[c] = tabla[c].apply(lambda x: f"{int(x):,}")
-            tabla.columns = ["Empleado","Departamento","Autoliquidable","Oferta","Marca","Adicional","Total"]
-            st.dataframe(tabla, use_container_width=True, hide_index=True)
+            tabla = emp_res.rename(columns={
+                "name": "Empleado", "department": "Departamento", "autoliquidable": "Autoliquidable",
+                "oferta": "Oferta", "marca": "Marca", "adicional": "Adicional", "total": "Total",
+            })
+            st.dataframe(
+                tabla, use_container_width=True, hide_index=True,
+                column_config={c: st.column_config.NumberColumn(c, format="localized")
+                               for c in ["Autoliquidable", "Oferta", "Marca", "Adicional", "Total"]},
+            )
             barra_exportacion(emp_res, titulo="Ventas por Empleado", subtitulo=f"{fecha_inicio} → {fecha_fin}",
                               nombre_archivo="ventas_empleados", key_prefix="dash_emp")
 
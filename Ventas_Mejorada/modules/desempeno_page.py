@@ -3,9 +3,11 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import date
-from utils import safe_dataframe, execute_query, execute_insert, get_employee_info, get_badge_class, periodo_a_fecha, render_progress
+from utils import (safe_dataframe, execute_query, execute_insert, get_employee_info, get_badge_class,
+                   periodo_a_fecha, render_progress, acumulado_mes, invalidar_cache)
 from auth import hash_password
 from export_utils import barra_exportacion
+from forecast import modelo_del_dia
 
 
 def page_mi_desempeno():
@@ -22,7 +24,7 @@ def page_mi_desempeno():
     with col_btn:
         st.markdown("<br>", unsafe_allow_html=True)
         if st.button("🔄 Actualizar"):
-            st.cache_data.clear()
+            invalidar_cache("sales", employee_id=emp_info[0])
             st.rerun()
 
     fecha_inicio = periodo_a_fecha(periodo)
@@ -30,7 +32,7 @@ def page_mi_desempeno():
     df = safe_dataframe(
         """SELECT date, autoliquidable, oferta, marca, adicional
            FROM sales WHERE employee_id=? AND date>=? ORDER BY date""",
-        (emp_info[0], fecha_inicio),
+        (emp_info[0], fecha_inicio), employee_id=emp_info[0], desde=fecha_inicio,
     )
 
     if df.empty:
@@ -51,7 +53,8 @@ def page_mi_desempeno():
     col3.metric("Mejor día", f"{mejor:,}")
     col4.metric("Días registrados", dias_reg)
 
-    render_progress(total_p, emp_info[4], "Progreso vs meta mensual")
+    proyectado = modelo_del_dia().proyectar_empleado(emp_info[0], total_p) if periodo == "Este mes" else None
+    render_progress(total_p, emp_info[4], "Progreso vs meta mensual", proyectado)
 
     # Gráfico combinado: barras por categoría + línea total
     tab1, tab2 = st.tabs(["📈 Evolución", "🥧 Por categoría"])
@@ -87,14 +90,7 @@ def page_mi_perfil():
     if emp_info:
         badge_class = get_badge_class(emp_info[2])
         # Ventas del mes actual
-        from datetime import date as d
-        mes = d.today().strftime("%Y-%m")
-        from utils import execute_query as eq
-        res = eq(
-            "SELECT SUM(autoliquidable+oferta+marca+adicional) FROM sales WHERE employee_id=? AND date LIKE ?",
-            (emp_info[0], f"{mes}%"),
-        )
-        ventas_mes = res[0][0] or 0 if res else 0
+        ventas_mes = acumulado_mes(emp_info[0])
 
         st.markdown(
             f"""
@@ -111,7 +107,8 @@ def page_mi_perfil():
             unsafe_allow_html=True,
         )
 
-        render_progress(ventas_mes, emp_info[4], "Progreso mes actual")
+        render_progress(ventas_mes, emp_info[4], "Progreso mes actual",
+                        modelo_del_dia().proyectar_empleado(emp_info[0], ventas_mes))
     else:
         st.warning("⚠️ No tienes perfil de empleado configurado. Contacta al administrador.")
 
@@ -132,12 +129,8 @@ def page_mi_perfil():
             elif pass_nueva != pass_conf:
                 st.error("❌ Las contraseñas nuevas no coinciden.")
             else:
-                from database import get_connection
-                conn = get_connection()
-                cur = conn.cursor()
-                cur.execute("SELECT password FROM users WHERE id=?", (user["id"],))
-                row = cur.fetchone()
-                conn.close()
+                res = execute_query("SELECT password FROM users WHERE id=?", (user["id"],))
+                row = res[0] if res else None
                 if row and hash_password(pass_actual) == row[0]:
                     from utils import execute_insert as ei
                     ok = ei(
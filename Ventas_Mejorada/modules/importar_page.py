@@ -0,0 +1,87 @@
+"""Página: Importación masiva de ventas y afiliaciones (CSV / Excel)."""
+import streamlit as st
+import pandas as pd
+from database import log_audit
+from import_utils import importar, TIPOS
+
+
+def page_importar():
+    st.title("📥 Importación Masiva")
+
+    st.markdown(
+        """
+        <div class="card">
+            <h4>Cargar historial desde CSV o Excel</h4>
+            <p>Columnas: <strong>empleado</strong> (id o nombre exacto), <strong>fecha</strong>
+            (AAAA-MM-DD o DD/MM/AAAA) y las cantidades, como enteros sin separador de
+            miles. Si ya existe un registro para el mismo empleado y fecha, se reemplaza.</p>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+
+    tipo = st.radio("Datos a importar", ["Ventas", "Afiliaciones"], horizontal=True)
+    clave = tipo.lower()
+    columnas = ["empleado", "fecha", *TIPOS[clave]["valores"]]
+    st.download_button(
+        "📄 Descargar plantilla CSV",
+        data=(",".join(columnas) + "\n").encode("utf-8"),
+        file_name=f"plantilla_{clave}.csv",
+        mime="text/csv",
+    )
+
+    archivo = st.file_uploader("Archivo (.csv o .xlsx)", type=["csv", "xlsx"])
+    if archivo is None:
+        return
+    if not st.button("🚀 Importar", type="primary"):
+        return
+
+    estado = st.empty()
+
+    def avance(r):
+        estado.caption(f"⏳ {r['leidas']:,} filas procesadas · {r['filas_seg']:,.0f} filas/s")
+
+    try:
+        with st.spinner("Importando…"):
+            r = importar(archivo, archivo.name, clave, progreso=avance)
+    except ValueError as e:
+        estado.empty()
+        st.error(f"❌ {e}")
+        return
+    except Exception as e:
+        estado.empty()
+        st.error(f"❌ Error al importar: {e}")
+        return
+    estado.empty()
+
+    u = st.session_state.user
+    log_audit(u["id"], u["username"], f"Importación masiva de {clave}", TIPOS[clave]["tabla"],
+              detail=f"{r['insertadas']} nuevas, {r['actualizadas']} actualizadas, "
+                     f"{r['rechazadas']} rechazadas ({archivo.name})"
+                     + (f"; interrumpida: {r['error']}" if r["error"] else ""))
+
+    if r["error"]:
+        st.error(f"❌ La importación se detuvo: {r['error']}. "
+                 f"Quedaron guardadas {r['insertadas'] + r['actualizadas']:,} filas de los lotes "
+                 f"anteriores; al volver a importar el archivo se actualizan sin duplicarse.")
+
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("Filas leídas", f"{r['leidas']:,}")
+    c2.metric("Nuevas", f"{r['insertadas']:,}")
+    c3.metric("Actualizadas", f"{r['actualizadas']:,}")
+    c4.metric("Rechazadas", f"{r['rechazadas']:,}")
+    c5.metric("Filas/seg", f"{r['filas_seg']:,.0f}")
+    st.caption(f"⏱️ {r['segundos']:.2f} s")
+
+    if r["rechazadas"]:
+        st.warning(f"⚠️ {r['rechazadas']:,} fila(s) no se importaron.")
+        df_rech = pd.DataFrame(r["rechazos"])
+        st.dataframe(df_rech, use_container_width=True, hide_index=True)
+        st.download_button(
+            "⬇️ Descargar filas rechazadas",
+            data=df_rech.to_csv(index=False).encode("utf-8"),
+            file_name=f"rechazadas_{clave}.csv",
+            mime="text/csv",
+        )
+    elif r["leidas"] and not r["error"]:
+        st.success("✅ Todas las filas se importaron correctamente.")
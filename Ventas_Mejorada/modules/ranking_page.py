@@ -1,9 +1,11 @@
 """Página: Ranking de ventas."""
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 from datetime import date
-from utils import safe_dataframe, execute_query, periodo_a_fecha, DEPARTAMENTOS
+from utils import periodo_a_fecha, get_employee_info, DEPARTAMENTOS
+from leaderboard import leaderboards
+from ui_components import render_ranking_cards
+from forecast import modelo_del_dia
 
 
 def _medal(pos):
@@ -23,76 +25,32 @@ def page_ranking():
         depto = st.selectbox("Departamento", ["Todos"] + DEPARTAMENTOS, key="rank_depto")
 
     if periodo == "Mes anterior":
-        from datetime import date
         from dateutil.relativedelta import relativedelta
         hoy = date.today()
-        primer_dia_mes_ant = hoy.replace(day=1) - relativedelta(months=1)
-        ultimo_dia_mes_ant = hoy.replace(day=1) - relativedelta(days=1)
-        fecha_inicio = primer_dia_mes_ant
-        fecha_fin_custom = ultimo_dia_mes_ant
+        fecha_inicio = hoy.replace(day=1) - relativedelta(months=1)
+        fecha_fin = hoy.replace(day=1) - relativedelta(days=1)
     else:
         fecha_inicio = periodo_a_fecha(periodo)
-        fecha_fin_custom = None
+        fecha_fin = date.today()
 
-    query = """
-        SELECT e.name, e.department, e.position, e.goal,
-               COALESCE(SUM(s.autoliquidable+s.oferta+s.marca+s.adicional),0) as total,
-               COALESCE(SUM(s.autoliquidable),0) as auto,
-               COALESCE(SUM(s.oferta),0) as oferta,
-               COALESCE(SUM(s.marca),0) as marca,
-               COALESCE(SUM(s.adicional),0) as adicional,
-               COUNT(DISTINCT s.date) as dias_activos
-        FROM employees e
-        LEFT JOIN sales s ON e.id = s.employee_id AND s.date >= ? AND s.date <= ?
-    """
-    fecha_fin = fecha_fin_custom if fecha_fin_custom else date.today()
-    params = [fecha_inicio, fecha_fin]
-    if depto != "Todos":
-        query += " WHERE e.department = ?"
-        params.append(depto)
-    query += " GROUP BY e.id ORDER BY total DESC"
-
-    df = safe_dataframe(query, params)
-    if df.empty:
+    tablero = leaderboards.obtener(fecha_inicio, fecha_fin, None if depto == "Todos" else depto)
+    if not len(tablero):
         st.info("No hay datos para este período.")
         return
 
-    df["Cumplimiento %"] = (df["total"] / df["goal"] * 100).round(1)
+    emp = get_employee_info(st.session_state.user["id"])
+    pos = tablero.posicion(emp[0]) if emp else None
+    if pos:
+        st.markdown(f"**Tu posición:** {_medal(pos)} de {len(tablero)}")
 
-    # Cards del ranking
-    st.subheader(f"📋 Ranking – {periodo}" + (f" – {depto}" if depto != "Todos" else ""))
-    for i, row in df.iterrows():
-        pos = i + 1
-        pct = row["Cumplimiento %"]
-        bar_color = "#16a34a" if pct >= 100 else "#d97706" if pct >= 70 else "#1a56db"
-        bar_w = min(pct, 100)
-        medal = _medal(pos)
+    df = tablero.top()
+    if periodo == "Este mes":
+        proy = modelo_del_dia().tabla(df.set_index("employee_id")["total"])
+        df = df.merge(proy[["employee_id", "pronostico"]], on="employee_id", how="left")
 
-        rank_class = f"rank-{min(pos,4) if pos <= 3 else 'n'}"
-        st.markdown(
-            f"""
-            <div class="rank-card">
-              <div class="rank-medal {rank_class}">{medal}</div>
-              <div class="rank-info">
-                <div class="rank-name">{row['name']}</div>
-                <div class="rank-dept">{row['department']} · {row['position']} · {int(row['dias_activos'])} días activos</div>
-                <div style="margin-top:6px">
-                  <div style="display:flex;justify-content:space-between;font-size:.72rem;color:var(--text-muted);margin-bottom:3px">
-                    <span>Meta: {int(row['goal']):,}</span><span>{pct:.1f}%</span>
-                  </div>
-                  <div style="background:var(--border);border-radius:999px;height:6px;overflow:hidden">
-                    <div style="width:{bar_w}%;height:100%;background:{bar_color};border-radius:999px"></div>
-                  </div>
-                </div>
-              </div>
-              <div style="text-align:right;flex-shrink:0">
-                <div class="rank-score">{int(row['total']):,}</div>
-                <div class="rank-score-label">unidades</div>
-              </div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+    # Cards del ranking: un único elemento
+    st.subheader(f"📋 Ranking – {periodo}" + (f" – {depto}" if depto != "Todos" else ""))
+    render_ranking_cards(df)
 
     # Gráfico
     st.divider()
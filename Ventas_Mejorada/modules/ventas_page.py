@@ -3,8 +3,18 @@ import streamlit as st
 import pandas as pd
 from datetime import date, datetime
 import time
-from utils import execute_query, execute_insert, get_employee_info, get_badge_class, render_progress, check_meta_celebration
+from utils import (execute_query, get_employee_info, get_badge_class,
+                   render_progress, check_meta_celebration, acumulado_mes, guardar_ventas)
+from database import registrar_consulta
 from export_utils import barra_exportacion
+from forecast import modelo_del_dia
+
+HISTORIAL_SQL = """SELECT date as Fecha, autoliquidable as Auto, oferta as Oferta,
+                          marca as Marca, adicional as Adicional,
+                          (autoliquidable+oferta+marca+adicional) as Total
+                   FROM sales WHERE employee_id=? ORDER BY date DESC LIMIT 15"""
+
+registrar_consulta("historial_ventas", lambda: (HISTORIAL_SQL, (1,)))
 
 
 def page_registrar_ventas():
@@ -63,15 +73,13 @@ def page_registrar_ventas():
         total = aut + of + ma + ad
 
         # Progreso mensual en tiempo real
-        mes_actual = fecha_registro.strftime("%Y-%m")
-        res_mes = execute_query(
-            "SELECT SUM(autoliquidable + oferta + marca + adicional) FROM sales WHERE employee_id = ? AND date LIKE ?",
-            (emp_info[0], f"{mes_actual}%"),
-        )
-        ventas_mes = res_mes[0][0] or 0 if res_mes else 0
+        ventas_mes = acumulado_mes(emp_info[0], fecha_registro)
         ventas_mes_ajustadas = ventas_mes - sum(vals_existentes) + total if ya_registro else ventas_mes + total
 
-        render_progress(ventas_mes_ajustadas, emp_info[4], "Progreso mensual con este registro")
+        hoy = date.today()
+        proyectado = (modelo_del_dia().proyectar_empleado(emp_info[0], ventas_mes_ajustadas)
+                      if (fecha_registro.year, fecha_registro.month) == (hoy.year, hoy.month) else None)
+        render_progress(ventas_mes_ajustadas, emp_info[4], "Progreso mensual con este registro", proyectado)
 
         col_b1, col_b2, col_b3 = st.columns([1, 2, 1])
         with col_b2:
@@ -83,25 +91,13 @@ def page_registrar_ventas():
             if total == 0:
                 st.warning("⚠️ Debes ingresar al menos una unidad.")
             else:
-                if ya_registro:
-                    ok = execute_insert(
-                        """UPDATE sales SET autoliquidable=?, oferta=?, marca=?, adicional=?, updated_at=CURRENT_TIMESTAMP
-                           WHERE employee_id=? AND date=?""",
-                        (aut, of, ma, ad, emp_info[0], str(fecha_registro)),
-                        audit_action=f"Editar ventas {fecha_registro}",
-                    )
-                    msg = f"✅ Ventas actualizadas para el {fecha_registro.strftime('%d/%m/%Y')}."
-                else:
-                    ok = execute_insert(
-                        "INSERT INTO sales (employee_id, date, autoliquidable, oferta, marca, adicional) VALUES (?,?,?,?,?,?)",
-                        (emp_info[0], str(fecha_registro), aut, of, ma, ad),
-                        audit_action=f"Registrar ventas {fecha_registro}",
-                    )
-                    msg = f"✅ Ventas registradas para el {fecha_registro.strftime('%d/%m/%Y')}."
-
-                if ok:
-                    st.success(msg)
-                    check_meta_celebration(ventas_mes_ajustadas, emp_info[4])
+                accion = "Editar" if ya_registro else "Registrar"
+                total_mes = guardar_ventas(emp_info[0], fecha_registro, aut, of, ma, ad,
+                                           audit_action=f"{accion} ventas {fecha_registro}")
+                if total_mes is not None:
+                    estado = "actualizadas" if ya_registro else "registradas"
+                    st.success(f"✅ Ventas {estado} para el {fecha_registro.strftime('%d/%m/%Y')}.")
+                    check_meta_celebration(total_mes, emp_info[4])
                     time.sleep(1)
                     st.rerun()
 
@@ -109,13 +105,7 @@ def page_registrar_ventas():
     st.divider()
     st.subheader("📋 Historial reciente (últimos 15 días)")
     from utils import safe_dataframe
-    df_hist = safe_dataframe(
-        """SELECT date as Fecha, autoliquidable as Auto, oferta as Oferta,
-                  marca as Marca, adicional as Adicional,
-                  (autoliquidable+oferta+marca+adicional) as Total
-           FROM sales WHERE employee_id=? ORDER BY date DESC LIMIT 15""",
-        (emp_info[0],),
-    )
+    df_hist = safe_dataframe(HISTORIAL_SQL, (emp_info[0],), employee_id=emp_info[0])
     if not df_hist.empty:
         df_hist["Fecha"] = pd.to_datetime(df_hist["Fecha"]).dt.strftime("%d/%m/%Y")
         st.dataframe(df_hist, use_container_width=True, hide_index=True)
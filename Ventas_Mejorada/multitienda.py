@@ -0,0 +1,99 @@
+"""Vistas agregadas de todas las tiendas.
+
+Cada consulta se resuelve dentro de la base de cada tienda sobre los
+rollups (sales_monthly / sales_daily / sales_dept_monthly), con la conexión
+y las entradas de caché de esa tienda: a pandas solo llegan filas ya
+agregadas (una por tienda, departamento o mes), nunca las ventas crudas. Una escritura en una
+tienda invalida únicamente su parte del resultado.
+"""
+from datetime import date, timedelta
+
+import pandas as pd
+
+from tiendas import TIENDAS, en_tienda
+from utils import rango_mensual, safe_dataframe, ventas_por_empleado_sql
+
+
+def por_tienda(query: str, params=None, desde=None, hasta=None) -> pd.DataFrame:
+    """Ejecuta `query` en cada tienda y une los resultados con una columna `tienda`."""
+    partes = []
+    for codigo, nombre in TIENDAS.items():
+        with en_tienda(codigo):
+            df = safe_dataframe(query, params, desde=desde, hasta=hasta)
+        if not df.empty:
+            df.insert(0, "tienda", nombre)
+            partes.append(df)
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+
+def resumen_tiendas(desde: date, hasta: date) -> pd.DataFrame:
+    """Por tienda: empleados, meta, unidades, % de meta y promedio por empleado."""
+    sub, params = ventas_por_empleado_sql(desde, hasta)
+    df = por_tienda(f"""
+        SELECT COUNT(*) empleados, COALESCE(SUM(e.goal), 0) meta,
+               COALESCE(SUM(v.total), 0) unidades, COALESCE(SUM(v.dias), 0) dias_registrados
+        FROM employees e LEFT JOIN ({sub}) v ON v.employee_id = e.id
+    """, params, desde, hasta)
+    if df.empty:
+        return df
+    df["pct_meta"] = (df["unidades"] * 100 / df["meta"].where(df["meta"] > 0)).round(1).fillna(0)
+    df["por_empleado"] = (df["unidades"] / df["empleados"].where(df["empleados"] > 0)).round(1).fillna(0)
+    return df.sort_values("unidades", ascending=False, ignore_index=True)
+
+
+def departamentos_por_tienda(desde: date, hasta: date) -> pd.DataFrame:
+    """Unidades por departamento (filas) y tienda (columnas), con total."""
+    sub, params = ventas_por_empleado_sql(desde, hasta)
+    df = por_tienda(f"""
+        SELECT IFNULL(e.department, '') department, SUM(v.total) unidades
+        FROM ({sub}) v JOIN employees e ON e.id = v.employee_id
+        GROUP BY IFNULL(e.department, '')
+    """, params, desde, hasta)
+    if df.empty:
+        return df
+    tabla = df.pivot_table(index="department", columns="tienda", values="unidades",
+                           aggfunc="sum", fill_value=0)
+    tabla["Total"] = tabla.sum(axis=1)
+    return tabla.sort_values("Total", ascending=False).reset_index()
+
+
+def tendencia_mensual(desde: date, hasta: date) -> pd.DataFrame:
+    """Unidades por mes y tienda (filas: tienda, month, total).
+
+    Los meses completos salen de sales_dept_monthly; un mes del borde
+    cubierto a medias se suma desde sales_daily con sus días exactos, como
+    en resumen_tiendas, para que ambos den el mismo total.
+    """
+    inicio = desde if desde.day == 1 else (desde.replace(day=28) + timedelta(days=4)).replace(day=1)
+    fin = hasta if rango_mensual(hasta.replace(day=1), hasta) else hasta.replace(day=1) - timedelta(days=1)
+    partes, params = [], []
+    tramos = [(desde, hasta)]
+    if inicio <= fin:
+        partes.append("SELECT month, total FROM sales_dept_monthly WHERE month BETWEEN ? AND ?")
+        params += [inicio.strftime("%Y-%m"), fin.strftime("%Y-%m")]
+        tramos = [(desde, inicio - timedelta(days=1)), (fin + timedelta(days=1), hasta)]
+    for a, b in tramos:
+        if a <= b:
+            partes.append("SELECT substr(date, 1, 7) month, total FROM sales_daily WHERE date BETWEEN ? AND ?")
+            params += [str(a), str(b)]
+    return por_tienda(f"""
+        SELECT month, SUM(total) total FROM ({" UNION ALL ".join(partes)})
+        GROUP BY month ORDER BY month
+    """, params, desde, hasta)
+
+
+def top_empleados(desde: date, hasta: date, n: int = 10) -> pd.DataFrame:
+    """Los `n` empleados con más unidades entre todas las tiendas.
+
+    Cada tienda devuelve solo su top `n`; el top global está contenido en la
+    unión de esos tops.
+    """
+    sub, params = ventas_por_empleado_sql(desde, hasta)
+    df = por_tienda(f"""
+        SELECT e.name, e.department, e.goal, v.total
+        FROM ({sub}) v JOIN employees e ON e.id = v.employee_id
+        ORDER BY v.total DESC LIMIT ?
+    """, [*params, n], desde, hasta)
+    if df.empty:
+        return df
+    return df.sort_values("total", ascending=False, ignore_index=True).head(n)
@@ -0,0 +1,212 @@
+"""Caché de consultas con invalidación dirigida por tabla, empleado y fechas.
+
+Cada resultado se etiqueta con las tablas que lee y, opcionalmente, con el
+empleado y el rango de fechas que cubre. Una escritura invalida solo las
+entradas que podría haber cambiado, en lugar de vaciar toda la caché.
+
+La caché tiene un presupuesto en bytes (VENTAS_CACHE_MB, 64 MB por defecto)
+y descarta primero los resultados usados hace más tiempo (LRU). Hay una
+sola caché para todas las tiendas: el presupuesto y el orden LRU son
+comunes, y cada entrada lleva la tienda activa al guardarla en su clave.
+Una tienda solo lee sus entradas y sus escrituras solo invalidan las suyas.
+
+Otras estructuras derivadas de la base (p. ej. leaderboard.py) se suscriben
+con `suscribir()` y reciben las mismas invalidaciones.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from tiendas import tienda_actual
+
+_TABLAS_LEIDAS = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)", re.I)
+
+# Escribir en una tabla modifica también las que dependen de ella
+# (triggers de rollups y borrados en cascada).
+DEPENDENCIAS = {
+    "sales":     {"sales_daily", "sales_monthly", "sales_dept_monthly"},
+    "employees": {"sales", "afiliaciones"},
+    "users":     {"employees"},
+    "festivos":  {"calendario"},
+}
+
+
+def tamano_bytes(valor) -> int:
+    """Memoria ocupada por un resultado (DataFrame medido en profundidad)."""
+    if hasattr(valor, "memory_usage"):
+        try:
+            return int(valor.memory_usage(index=True, deep=True).sum())
+        except TypeError:
+            pass
+    if hasattr(valor, "nbytes"):
+        return int(valor.nbytes)
+    if isinstance(valor, tuple):
+        return sys.getsizeof(valor) + sum(tamano_bytes(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+def tablas_de(query: str) -> frozenset:
+    return frozenset(t.lower() for t in _TABLAS_LEIDAS.findall(query))
+
+
+def tablas_afectadas(tabla: str) -> set:
+    """La tabla escrita más todas las que cambian por efecto de ella."""
+    afectadas, pendientes = set(), [tabla.lower()]
+    while pendientes:
+        t = pendientes.pop()
+        if t not in afectadas:
+            afectadas.add(t)
+            pendientes.extend(DEPENDENCIAS.get(t, ()))
+    return afectadas
+
+
+class _Entrada:
+    __slots__ = ("tienda", "valor", "tamano", "tablas", "employee_id", "desde", "hasta", "creada")
+
+    def __init__(self, tienda, valor, tamano, tablas, employee_id, desde, hasta):
+        self.tienda = tienda
+        self.valor = valor
+        self.tamano = tamano
+        self.tablas = tablas
+        self.employee_id = employee_id
+        self.desde = str(desde) if desde is not None else None
+        self.hasta = str(hasta) if hasta is not None else None
+        self.creada = time.monotonic()
+
+    def afectada_por(self, tienda, tablas, employee_id, fecha):
+        if self.tienda != tienda or not (self.tablas & tablas):
+            return False
+        if employee_id is not None and self.employee_id is not None and employee_id != self.employee_id:
+            return False
+        if fecha is not None:
+            if self.desde is not None and fecha < self.desde:
+                return False
+            if self.hasta is not None and fecha > self.hasta:
+                return False
+        return True
+
+
+class QueryCache:
+    """LRU común a todas las tiendas; cada operación actúa sobre las entradas
+    de la tienda activa del hilo.
+
+    Los suscriptores reciben la invalidación en el hilo que escribió, con
+    esa tienda activa.
+    """
+
+    def __init__(self, ttl: float = 60, max_bytes: int = 64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entradas = OrderedDict()   # (tienda, clave), de menos a más recientemente usada
+        self._lock = threading.Lock()
+        # Por tienda: aciertos, fallos, expiradas (TTL), desalojadas (por
+        # presupuesto de memoria), invalidadas (por escrituras) y bytes
+        self._metricas = defaultdict(Counter)
+        self._suscriptores = []
+
+    def _quitar(self, clave):
+        entrada = self._entradas.pop(clave)
+        self.bytes -= entrada.tamano
+        self._metricas[entrada.tienda]["bytes"] -= entrada.tamano
+        return entrada
+
+    def get(self, clave):
+        tienda = tienda_actual()
+        clave = (tienda, clave)
+        with self._lock:
+            metricas = self._metricas[tienda]
+            entrada = self._entradas.get(clave)
+            if entrada is not None and time.monotonic() - entrada.creada > self.ttl:
+                self._quitar(clave)
+                metricas["expiradas"] += 1
+                entrada = None
+            if entrada is None:
+                metricas["fallos"] += 1
+                return None
+            self._entradas.move_to_end(clave)
+            metricas["aciertos"] += 1
+            return entrada.valor
+
+    def put(self, clave, valor, tablas, employee_id=None, desde=None, hasta=None):
+        tamano = tamano_bytes(valor)
+        tienda = tienda_actual()
+        clave = (tienda, clave)
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            if tamano > self.max_bytes:
+                return   # no cabe: se sirve sin cachear
+            while self._entradas and self.bytes + tamano > self.max_bytes:
+                desalojada = self._quitar(next(iter(self._entradas)))
+                self._metricas[desalojada.tienda]["desalojadas"] += 1
+            self._entradas[clave] = _Entrada(tienda, valor, tamano, tablas, employee_id, desde, hasta)
+            self.bytes += tamano
+            self._metricas[tienda]["bytes"] += tamano
+
+    def suscribir(self, funcion):
+        """`funcion(tablas, employee_id, fecha)` se llama tras cada invalidación;
+        `tablas` es None cuando se vacía toda la caché."""
+        self._suscriptores.append(funcion)
+
+    def _avisar(self, tablas, employee_id, fecha):
+        for funcion in self._suscriptores:
+            funcion(tablas, employee_id, fecha)
+
+    def invalidate(self, tabla: str, employee_id=None, fecha=None) -> int:
+        """Elimina las entradas de la tienda activa que una escritura en
+        `tabla` pudo cambiar.
+
+        `employee_id` y `fecha` acotan la escritura: las entradas de otro
+        empleado o cuyo rango no contiene la fecha se conservan.
+        """
+        tienda = tienda_actual()
+        tablas = tablas_afectadas(tabla)
+        fecha = str(fecha) if fecha is not None else None
+        with self._lock:
+            claves = [k for k, e in self._entradas.items()
+                      if e.afectada_por(tienda, tablas, employee_id, fecha)]
+            for k in claves:
+                self._quitar(k)
+            self._metricas[tienda]["invalidadas"] += len(claves)
+        self._avisar(tablas, employee_id, fecha)
+        return len(claves)
+
+    def clear(self):
+        """Vacía la caché de la tienda activa."""
+        tienda = tienda_actual()
+        with self._lock:
+            claves = [k for k in self._entradas if k[0] == tienda]
+            for k in claves:
+                self._quitar(k)
+            self._metricas[tienda]["invalidadas"] += len(claves)
+        self._avisar(None, None, None)
+
+    def stats(self, tienda: str = None) -> dict:
+        """Métricas de una tienda o, sin `tienda`, de toda la caché."""
+        with self._lock:
+            if tienda is None:
+                m = sum(self._metricas.values(), Counter())
+                entradas, usados = len(self._entradas), self.bytes
+            else:
+                m = self._metricas[tienda]
+                entradas = sum(1 for k in self._entradas if k[0] == tienda)
+                usados = m["bytes"]
+            consultas = m["aciertos"] + m["fallos"]
+            return {
+                "entradas":      entradas,
+                "aciertos":      m["aciertos"],
+                "fallos":        m["fallos"],
+                "expiradas":     m["expiradas"],
+                "desalojadas":   m["desalojadas"],
+                "invalidadas":   m["invalidadas"],
+                "bytes":         usados,
+                "max_bytes":     self.max_bytes,
+                "tasa_aciertos": (m["aciertos"] / consultas * 100) if consultas else 0.0,
+            }
+
+
+cache = QueryCache(ttl=60, max_bytes=int(float(os.environ.get("VENTAS_CACHE_MB", "64")) * 1024 * 1024))
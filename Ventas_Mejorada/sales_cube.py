@@ -0,0 +1,102 @@
+"""Cubo de ventas categoría × departamento × día para el dashboard.
+
+Se construye una vez por conjunto de filtros con operaciones vectorizadas
+de NumPy; cada pestaña del dashboard obtiene su vista recortando el cubo
+en lugar de volver a agrupar el DataFrame.
+"""
+import numpy as np
+import pandas as pd
+
+CATEGORIAS = ["autoliquidable", "oferta", "marca", "adicional"]
+ETIQUETAS = {
+    "autoliquidable": "Autoliquidable",
+    "oferta":         "Oferta",
+    "marca":          "Marca Propia",
+    "adicional":      "Adicional",
+}
+
+
+class VentasCubo:
+    """Totales precalculados a partir de filas (empleado, día).
+
+    `cubo[c, d, t]` son las unidades de la categoría c, departamento d y
+    día t; `por_emp[e, c]` las unidades de cada empleado por categoría.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        valores = df[CATEGORIAS].to_numpy(dtype=np.int64)
+        dia_idx, self.dias = pd.factorize(pd.to_datetime(df["date"]), sort=True)
+        dep_idx, self.deptos = pd.factorize(df["department"].fillna(""), sort=True)
+        emp_idx, empleados = pd.factorize(
+            pd.MultiIndex.from_arrays([df["name"], df["department"].fillna("")]), sort=True
+        )
+        self.empleados = empleados
+
+        n_dep, n_dia = len(self.deptos), len(self.dias)
+        celda = dep_idx * n_dia + dia_idx
+        self.cubo = np.stack([
+            np.bincount(celda, weights=valores[:, k], minlength=n_dep * n_dia)
+            for k in range(len(CATEGORIAS))
+        ]).astype(np.int64).reshape(len(CATEGORIAS), n_dep, n_dia)
+
+        self.por_emp = np.zeros((len(empleados), len(CATEGORIAS)), dtype=np.int64)
+        np.add.at(self.por_emp, emp_idx, valores)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.cubo.nbytes + self.por_emp.nbytes + self.dias.nbytes)
+
+    @property
+    def vacio(self) -> bool:
+        return self.cubo.size == 0
+
+    # ── Escalares ────────────────────────────────────────────────────
+    def totales_categoria(self) -> dict:
+        t = self.cubo.sum(axis=(1, 2))
+        return {c: int(t[k]) for k, c in enumerate(CATEGORIAS)}
+
+    def total(self) -> int:
+        return int(self.cubo.sum())
+
+    def estadisticas_diarias(self) -> dict:
+        diario = self.cubo.sum(axis=(0, 1))
+        mejor = int(diario.argmax())
+        return {
+            "promedio":   float(diario.mean()),
+            "mejor":      int(diario[mejor]),
+            "mejor_dia":  self.dias[mejor],
+            "total":      int(diario.sum()),
+        }
+
+    # ── Vistas para gráficos ─────────────────────────────────────────
+    def serie_departamentos(self) -> pd.DataFrame:
+        """Ancho: una fila por día y una columna por departamento."""
+        df = pd.DataFrame(self.cubo.sum(axis=0).T, columns=list(self.deptos))
+        df.insert(0, "date", self.dias)
+        return df
+
+    def serie_categorias(self, depto: str) -> pd.DataFrame:
+        """Largo: (date, Categoría, Unidades) de un departamento."""
+        d = self.deptos.get_loc(depto)
+        bloque = self.cubo[:, d, :]                      # categorías × días
+        return pd.DataFrame({
+            "date":      np.tile(self.dias, len(CATEGORIAS)),
+            "Categoría": np.repeat([ETIQUETAS[c] for c in CATEGORIAS], len(self.dias)),
+            "Unidades":  bloque.ravel(),
+        })
+
+    def distribucion(self) -> pd.DataFrame:
+        """Largo: (department, Tipo, Cantidad) sumando todos los días."""
+        bloque = self.cubo.sum(axis=2)                   # categorías × deptos
+        return pd.DataFrame({
+            "department": np.tile(np.asarray(self.deptos), len(CATEGORIAS)),
+            "Tipo":       np.repeat([ETIQUETAS[c] for c in CATEGORIAS], len(self.deptos)),
+            "Cantidad":   bloque.ravel(),
+        })
+
+    def por_empleado(self) -> pd.DataFrame:
+        df = pd.DataFrame(self.por_emp, columns=CATEGORIAS)
+        df.insert(0, "name", self.empleados.get_level_values(0))
+        df.insert(1, "department", self.empleados.get_level_values(1))
+        df["total"] = self.por_emp.sum(axis=1)
+        return df.sort_values(["department", "total"], ascending=[True, False]).reset_index(drop=True)
@@ -0,0 +1,47 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audit_utils
+import database
+from query_cache import cache
+from utils import invalidar_acumulado
+
+
+def _reiniciar():
+    database.flush_audit()
+    database._cerrar_pools()
+    database._pools.clear()
+    database._inicializadas.clear()
+    cache.clear()
+    invalidar_acumulado()
+    audit_utils._memorias.clear()
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """Base vacía de la tienda por defecto dentro de un directorio temporal."""
+    monkeypatch.chdir(tmp_path)
+    _reiniciar()
+    yield database.get_connection()
+    _reiniciar()
+
+
+def sembrar(conn, empleados=5, dias=30, desde=date(2024, 1, 1)):
+    """Empleados en dos departamentos con una venta diaria cada uno."""
+    conn.executemany(
+        "INSERT INTO employees (name, department, goal) VALUES (?, ?, 300)",
+        [(f"Empleado {i}", "Droguería" if i % 2 else "Cajas") for i in range(empleados)],
+    )
+    ids = [r[0] for r in conn.execute("SELECT id FROM employees")]
+    conn.executemany(
+        "INSERT INTO sales (employee_id, date, autoliquidable, oferta, marca, adicional) "
+        "VALUES (?, ?, 1, 2, 3, 4)",
+        [(e, str(desde + timedelta(days=d))) for e in ids for d in range(dias)],
+    )
+    conn.commit()
+    return ids
@@ -0,0 +1,36 @@
+from datetime import date
+
+import utils
+from conftest import sembrar
+
+
+def test_lectura_lenta_no_pisa_una_escritura(conn, monkeypatch):
+    emp = sembrar(conn, empleados=1, dias=3, desde=date(2024, 1, 1))[0]
+    consultar = utils.execute_query
+
+    def consulta_con_escritura(query, params=None):
+        res = consultar(query, params)   # total previo a la escritura
+        monkeypatch.setattr(utils, "execute_query", consultar)
+        utils.guardar_ventas(emp, date(2024, 1, 10), 5, 0, 0, 0)
+        return res
+
+    monkeypatch.setattr(utils, "execute_query", consulta_con_escritura)
+    assert utils.acumulado_mes(emp, date(2024, 1, 1)) == 30
+    assert utils.acumulado_mes(emp, date(2024, 1, 1)) == 35
+
+
+def test_invalidacion_durante_la_lectura(conn, monkeypatch):
+    emp = sembrar(conn, empleados=1, dias=3, desde=date(2024, 1, 1))[0]
+    consultar = utils.execute_query
+
+    def consulta_con_invalidacion(query, params=None):
+        res = consultar(query, params)
+        conn.execute("UPDATE sales SET adicional = 14 WHERE employee_id = ?", (emp,))
+        conn.commit()
+        utils.invalidar_acumulado(emp, "sales")
+        return res
+
+    monkeypatch.setattr(utils, "execute_query", consulta_con_invalidacion)
+    assert utils.acumulado_mes(emp, date(2024, 1, 1)) == 30
+    monkeypatch.setattr(utils, "execute_query", consultar)
+    assert utils.acumulado_mes(emp, date(2024, 1, 1)) == 60
@@ -0,0 +1,56 @@
+from datetime import date
+
+import audit_utils
+from audit_utils import archivar_auditoria, buscar_auditoria, contar_auditoria
+
+DESDE = date(2023, 12, 1)
+
+
+def _sembrar_auditoria(conn):
+    filas = [(i, f"user{i % 3}", f"Editar ventas {i}", f"2024-{(i - 1) // 10 + 1:02d}-{(i - 1) % 10 + 10} 12:00:00")
+             for i in range(1, 31)]
+    conn.executemany("INSERT INTO audit_log (id, username, action, table_name, created_at) "
+                     "VALUES (?, ?, ?, 'sales', ?)", filas)
+    conn.commit()
+    return filas
+
+
+def _todas(limite, **filtros):
+    ids, cursor = [], None
+    while True:
+        df, cursor = buscar_auditoria(desde=DESDE, despues_de=cursor, limite=limite, **filtros)
+        ids += df["id"].tolist()
+        if cursor is None:
+            return ids
+
+
+def test_filas_restauradas_no_se_duplican(conn):
+    filas = _sembrar_auditoria(conn)
+    assert archivar_auditoria(dias=0)["filas"] == 30
+    # Una restauración devuelve a la base viva parte de lo ya archivado
+    conn.executemany("INSERT INTO audit_log (id, username, action, table_name, created_at) "
+                     "VALUES (?, ?, ?, 'sales', ?)", filas[10:15])
+    conn.commit()
+
+    for limite in (50, 7):
+        ids = _todas(limite)
+        assert ids == list(range(30, 0, -1))
+    assert contar_auditoria(desde=DESDE) == 30
+    assert sorted(_todas(4, texto="editar")) == list(range(1, 31))
+    assert contar_auditoria(desde=DESDE, texto="editar") == 30
+    assert contar_auditoria(desde=DESDE, usuario="user1") == 10
+
+
+def test_archivo_carga_solo_los_meses_de_la_pagina(conn, monkeypatch):
+    monkeypatch.setattr(audit_utils, "MESES_EN_MEMORIA", 2)
+    _sembrar_auditoria(conn)
+    archivar_auditoria(dias=0)
+    memoria = audit_utils._memoria()
+
+    df, cursor = buscar_auditoria(desde=DESDE, limite=5)
+    assert df["id"].tolist() == [30, 29, 28, 27, 26]
+    assert list(memoria._meses) == ["2024-03"]
+
+    assert _todas(7) == list(range(30, 0, -1))
+    assert contar_auditoria(desde=DESDE) == 30
+    assert len(memoria._meses) == 2
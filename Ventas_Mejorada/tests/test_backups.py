@@ -0,0 +1,106 @@
+import os
+
+import backup_manager
+import backup_scheduler
+from backup_manager import create_backup, create_incremental_backup, list_backups
+from conftest import sembrar
+from database import get_connection
+
+
+def _nombres():
+    return {b["name"] for b in list_backups()}
+
+
+def test_automatico_no_inicia_cadena(conn):
+    sembrar(conn, empleados=2, dias=3)
+    ok, base, _ = create_backup()
+    assert ok
+    ok, auto, _ = backup_scheduler.create_backup(prefijo=backup_scheduler.PREFIJO_AUTO,
+                                                 iniciar_cadena=False)
+    assert ok
+    manifest = backup_manager._leer_manifest()
+    assert manifest["actual"] == os.path.basename(base)
+    assert os.path.basename(auto) not in manifest["cadenas"]
+
+
+def test_poda_conserva_cadena_manual(conn, monkeypatch):
+    sembrar(conn, empleados=2, dias=3)
+    monkeypatch.setattr(backup_scheduler, "RETENCION", {"horas": 1, "dias": 1, "semanas": 1})
+    ok, base, _ = create_backup()
+    backup_scheduler.ejecutar_backup_programado()
+    conn.execute("UPDATE employees SET goal = 500")
+    conn.commit()
+    ok, delta, _ = create_incremental_backup()
+    assert ok
+    for _ in range(3):
+        backup_scheduler.ejecutar_backup_programado()
+
+    nombres = _nombres()
+    assert os.path.basename(base) in nombres
+    assert os.path.basename(delta) in nombres
+    assert len([n for n in nombres if n.startswith(backup_scheduler.PREFIJO_AUTO)]) == 1
+    assert backup_manager._leer_manifest()["cadenas"][os.path.basename(base)]["deltas"]
+
+
+def test_poda_conserva_base_automatica_con_incrementales(conn, monkeypatch):
+    # Manifiesto de una versión en que los automáticos iniciaban cadena
+    sembrar(conn, empleados=2, dias=3)
+    ok, base, _ = create_backup(prefijo=backup_scheduler.PREFIJO_AUTO)
+    ok, delta, _ = create_incremental_backup()
+    assert ok
+
+    monkeypatch.setattr(backup_scheduler, "RETENCION", {"horas": 1, "dias": 1, "semanas": 1})
+    backup_scheduler.ejecutar_backup_programado()
+    backup_scheduler.ejecutar_backup_programado()
+
+    nombres = _nombres()
+    assert os.path.basename(base) in nombres
+    assert os.path.basename(delta) in nombres
+
+
+def _metas(conn):
+    return [r[0] for r in conn.execute("SELECT goal FROM employees ORDER BY id")]
+
+
+def test_restaurar_incremental(conn):
+    sembrar(conn, empleados=2, dias=3)
+    ok, base, _ = create_backup()
+    conn.execute("UPDATE employees SET goal = 500")
+    conn.commit()
+    ok, delta, _ = create_incremental_backup()
+    get_connection().execute("UPDATE employees SET goal = 1")
+    get_connection().commit()
+
+    ok, msg = backup_manager.restore_incremental(os.path.basename(delta))
+    assert ok, msg
+    assert _metas(get_connection()) == [500, 500]
+    # El backup de seguridad de la restauración no inicia cadena
+    assert backup_manager._leer_manifest()["actual"] is None
+    assert os.path.basename(base) in backup_manager._leer_manifest()["cadenas"]
+
+
+def test_incremental_fallido_no_toca_la_base(conn, monkeypatch):
+    sembrar(conn, empleados=2, dias=3)
+    create_backup()
+    conn.execute("UPDATE employees SET goal = 500")
+    conn.commit()
+    ok, delta, _ = create_incremental_backup()
+    get_connection().execute("UPDATE employees SET goal = 1")
+    get_connection().commit()
+
+    def falla(conn, delta):
+        raise ValueError("delta dañado")
+    monkeypatch.setattr(backup_manager, "_aplicar_delta", falla)
+    ok, msg = backup_manager.restore_incremental(os.path.basename(delta))
+    assert not ok and "no se modificó" in msg
+    assert _metas(get_connection()) == [1, 1]
+
+
+def test_error_del_automatico_queda_en_el_estado(conn, monkeypatch):
+    def falla():
+        raise OSError("disco lleno")
+    monkeypatch.setattr(backup_scheduler, "_ultima", {})
+    monkeypatch.setattr(backup_scheduler, "ejecutar_backup_programado", falla)
+    backup_scheduler._ejecutar_todas()
+    ultima = backup_scheduler.get_scheduler_status()["ultima"]
+    assert not ultima["ok"] and "disco lleno" in ultima["mensaje"]
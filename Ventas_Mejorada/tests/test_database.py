@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+
+import database
+from tiendas import TIENDA_DEFECTO
+
+
+def _en_hilo(funcion):
+    hecho = threading.Event()
+
+    def correr():
+        funcion()
+        hecho.set()
+    threading.Thread(target=correr, daemon=True).start()
+    return hecho
+
+
+def test_mantenimiento_detiene_a_los_demas_hilos(conn):
+    with database.mantenimiento():
+        entregada = _en_hilo(database.get_connection)
+        assert not entregada.wait(0.3)
+        database.close_all_connections()
+        assert database.get_connection().execute("SELECT 1").fetchone()[0] == 1
+    assert entregada.wait(5)
+
+
+def test_mantenimiento_pausa_la_auditoria(conn):
+    database.log_audit(1, "admin", "Prueba")
+    with database.mantenimiento():
+        vaciado = _en_hilo(database.flush_audit)
+        assert not vaciado.wait(0.3)
+        assert conn.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0] == 0
+    assert vaciado.wait(5)
+    nueva = database.get_connection()
+    assert nueva.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0] == 1
+
+
+def test_migracion_fallida_no_deja_pasos_aplicados(conn, monkeypatch):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    monkeypatch.setattr(database, "SCHEMA_MIGRATIONS", [
+        (version + 1, ["ALTER TABLE employees ADD COLUMN apodo TEXT", "SELECT * FROM no_existe"]),
+    ])
+    try:
+        database.apply_schema_migrations(conn)
+    except Exception:
+        pass
+    columnas = {r[1] for r in conn.execute("PRAGMA table_info(employees)")}
+    assert "apodo" not in columnas
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == version
+
+
+class _Conexion:
+    """Envuelve la conexión real y hace fallar los lotes que `falla` rechaza."""
+
+    def __init__(self, conn, falla):
+        self._conn, self._falla = conn, falla
+
+    def executemany(self, sql, filas):
+        filas = list(filas)
+        if self._falla(filas):
+            raise sqlite3.OperationalError("database is locked")
+        return self._conn.executemany(sql, filas)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+
+def _escribir_con_fallos(conn, monkeypatch, falla, eventos):
+    monkeypatch.setattr(database, "AUDIT_REINTENTOS", (0, 0))
+    monkeypatch.setattr(database, "get_connection", lambda: _Conexion(conn, falla))
+    escritor = database.AuditWriter()
+    escritor._activo = False
+    escritor._escribir([(TIENDA_DEFECTO, 1, "admin", e, None, None, None) for e in eventos])
+    return escritor.stats()
+
+
+def test_lote_bloqueado_se_reintenta(conn, monkeypatch):
+    intentos = []
+    stats = _escribir_con_fallos(conn, monkeypatch, lambda filas: intentos.append(1) or len(intentos) < 3,
+                                 ["a", "b", "c"])
+    assert (stats["escritos"], stats["perdidos"], stats["reintentos"]) == (3, 0, 2)
+    assert conn.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0] == 3
+
+
+def test_lote_fallido_se_escribe_fila_a_fila(conn, monkeypatch):
+    stats = _escribir_con_fallos(conn, monkeypatch, lambda filas: any(f[2] == "mala" for f in filas),
+                                 ["a", "mala", "c"])
+    assert (stats["escritos"], stats["perdidos"]) == (2, 1)
+    acciones = [r[0] for r in conn.execute("SELECT action FROM audit_log ORDER BY id")]
+    assert acciones == ["a", "c"]
@@ -0,0 +1,20 @@
+from openpyxl import load_workbook
+import pandas as pd
+
+from export_utils import exportar_excel
+
+
+def test_libro_se_abre_con_sus_estilos():
+    df = pd.DataFrame({"empleado": ["Ana", "Luis", "Eva"], "total": [120, 95, 80], "pct": [40.5, 31.7, 26.7]})
+    archivo = exportar_excel(df, "Ranking", "Enero", hoja="Ranking")
+    ws = load_workbook(archivo)["Ranking"]
+
+    assert ws["A1"].value == "RANKING" and ws["A1"].style == "ais_titulo"
+    assert "A1:C1" in {str(r) for r in ws.merged_cells.ranges}
+    assert [c.value for c in ws[4]] == ["EMPLEADO", "TOTAL", "PCT"]
+    assert all(c.style == "ais_encabezado" for c in ws[4])
+    assert [c.value for c in ws[5]] == ["Ana", 120, 40.5]
+    assert [c.style for c in ws[5]] == ["ais_texto", "ais_entero", "ais_decimal"]
+    assert [c.style for c in ws[6]] == ["ais_texto_alt", "ais_entero_alt", "ais_decimal_alt"]
+    assert ws["B5"].number_format == "#,##0"
+    assert ws.auto_filter.ref == "A4:C7"
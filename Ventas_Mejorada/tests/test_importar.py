@@ -0,0 +1,67 @@
+import io
+import sqlite3
+
+import pytest
+
+import import_utils
+from import_utils import _cantidad, importar
+from conftest import sembrar
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    (None, 0), ("", 0), (" 12 ", 12), (7, 7), (7.0, 7), ("0", 0),
+])
+def test_cantidad_valida(valor, esperado):
+    assert _cantidad(valor) == esperado
+
+
+@pytest.mark.parametrize("valor", ["1.000", "1,000", "1,5", "2.0", "-3", "1e3", 2.5, -1, True, "abc"])
+def test_cantidad_invalida(valor):
+    with pytest.raises(ValueError):
+        _cantidad(valor)
+
+
+def _csv(filas):
+    texto = "empleado,fecha,cantidad\n" + "".join(f"{e},{f},{c}\n" for e, f, c in filas)
+    return io.BytesIO(texto.encode("utf-8"))
+
+
+def test_lote_fallido_informa_lo_guardado(conn, monkeypatch):
+    emp = sembrar(conn, empleados=1, dias=0)[0]
+    monkeypatch.setattr(import_utils, "CHUNK_FILAS", 2)
+    volcar, llamadas = import_utils._volcar, []
+
+    def falla_el_segundo(*args):
+        llamadas.append(1)
+        if len(llamadas) == 2:
+            raise sqlite3.OperationalError("database is locked")
+        volcar(*args)
+
+    monkeypatch.setattr(import_utils, "_volcar", falla_el_segundo)
+    archivo = _csv([(emp, f"2024-01-0{d}", d) for d in range(1, 6)])
+    r = importar(archivo, "afiliaciones.csv", "afiliaciones")
+
+    assert r["error"] == "database is locked"
+    assert r["insertadas"] == 2 and r["actualizadas"] == 0
+    assert conn.execute("SELECT COUNT(*) FROM afiliaciones").fetchone()[0] == 2
+
+
+@pytest.mark.parametrize("celda", [2.7, True])
+def test_empleado_no_entero_se_rechaza(conn, monkeypatch, celda):
+    sembrar(conn, empleados=3, dias=0)
+    filas = iter([("empleado", "fecha", "cantidad"), (celda, "2024-01-02", 4)])
+    monkeypatch.setattr(import_utils, "leer_filas", lambda archivo, nombre: filas)
+    r = importar(None, "afiliaciones.xlsx", "afiliaciones")
+
+    assert r["rechazadas"] == 1 and r["insertadas"] == 0
+    assert "empleado inválido" in r["rechazos"][0]["motivo"]
+    assert conn.execute("SELECT COUNT(*) FROM afiliaciones").fetchone()[0] == 0
+
+
+def test_empleado_de_celda_numerica_entera(conn, monkeypatch):
+    emp = sembrar(conn, empleados=2, dias=0)[1]
+    filas = iter([("empleado", "fecha", "cantidad"), (float(emp), "2024-01-02", 4)])
+    monkeypatch.setattr(import_utils, "leer_filas", lambda archivo, nombre: filas)
+    r = importar(None, "afiliaciones.xlsx", "afiliaciones")
+    assert r["insertadas"] == 1
+    assert conn.execute("SELECT employee_id FROM afiliaciones").fetchone()[0] == emp
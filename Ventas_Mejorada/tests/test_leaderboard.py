@@ -0,0 +1,31 @@
+from datetime import date
+
+from conftest import sembrar
+from leaderboard import leaderboards
+from utils import guardar_ventas
+
+
+def test_vista_no_cambia_con_escrituras_posteriores(conn):
+    ids = sembrar(conn, empleados=3, dias=5, desde=date(2024, 1, 1))
+    desde, hasta = date(2024, 1, 1), date(2024, 1, 5)
+    ultimo = leaderboards.obtener(desde, hasta).top().iloc[-1]["employee_id"]
+    vista = leaderboards.obtener(desde, hasta)
+    assert vista.posicion(ultimo) == 3
+
+    assert guardar_ventas(int(ultimo), date(2024, 1, 3), 100, 0, 0, 0) is not None
+    nueva = leaderboards.obtener(desde, hasta)
+
+    assert nueva.posicion(ultimo) == 1
+    assert vista.posicion(ultimo) == 3
+    assert vista.top().iloc[-1]["employee_id"] == ultimo
+    assert sorted(vista.top()["employee_id"]) == sorted(ids)
+
+
+def test_vista_se_reutiliza_sin_cambios(conn):
+    sembrar(conn, empleados=2, dias=2, desde=date(2024, 1, 1))
+    a = leaderboards.obtener(date(2024, 1, 1), date(2024, 1, 2))
+    b = leaderboards.obtener(date(2024, 1, 1), date(2024, 1, 2))
+    assert a is b
+    df = a.top()
+    df["total"] = 0
+    assert b.top()["total"].sum() > 0
@@ -0,0 +1,25 @@
+from datetime import date
+
+import pytest
+
+from conftest import sembrar
+from multitienda import resumen_tiendas, tendencia_mensual
+
+
+@pytest.mark.parametrize("desde, hasta", [
+    (date(2024, 1, 15), date(2024, 3, 5)),    # bordes a medias y un mes completo
+    (date(2024, 1, 15), date(2024, 2, 10)),   # solo bordes
+    (date(2024, 2, 3), date(2024, 2, 20)),    # dentro de un mes
+    (date(2024, 1, 1), date(2024, 2, 29)),    # meses completos
+])
+def test_tendencia_coincide_con_el_resumen(conn, desde, hasta):
+    sembrar(conn, empleados=3, dias=70, desde=date(2024, 1, 1))
+    tendencia = tendencia_mensual(desde, hasta)
+    assert tendencia["total"].sum() == resumen_tiendas(desde, hasta)["unidades"].sum()
+
+
+def test_tendencia_por_dias_en_los_bordes(conn):
+    sembrar(conn, empleados=2, dias=70, desde=date(2024, 1, 1))
+    tendencia = tendencia_mensual(date(2024, 1, 15), date(2024, 3, 5))
+    assert tendencia.set_index("month")["total"].to_dict() == {
+        "2024-01": 2 * 17 * 10, "2024-02": 2 * 29 * 10, "2024-03": 2 * 5 * 10}
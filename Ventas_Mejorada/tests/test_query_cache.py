@@ -0,0 +1,53 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import tiendas
+from conftest import sembrar
+from modules import dashboard_page
+from query_cache import QueryCache
+from tiendas import en_tienda
+
+
+@pytest.fixture
+def dos_tiendas(monkeypatch):
+    monkeypatch.setitem(tiendas.TIENDAS, "norte", "Tienda Norte")
+    return tiendas.TIENDA_DEFECTO, "norte"
+
+
+def test_presupuesto_comun(dos_tiendas):
+    cache = QueryCache(max_bytes=10_000)
+    valor = b"x" * 3_000
+    for tienda in dos_tiendas:
+        with en_tienda(tienda):
+            for i in range(5):
+                cache.put(i, valor, frozenset({"sales"}))
+    assert cache.bytes <= cache.max_bytes
+    assert cache.stats()["entradas"] == 3
+    assert sum(cache.stats(t)["bytes"] for t in dos_tiendas) == cache.bytes
+    assert cache.stats()["desalojadas"] == 7
+
+
+def test_tiendas_aisladas(dos_tiendas):
+    a, b = dos_tiendas
+    cache = QueryCache()
+    with en_tienda(a):
+        cache.put("q", "de a", frozenset({"sales"}))
+    with en_tienda(b):
+        assert cache.get("q") is None
+        cache.put("q", "de b", frozenset({"sales"}))
+        assert cache.invalidate("sales") == 1
+    with en_tienda(a):
+        assert cache.get("q") == "de a"
+        cache.clear()
+    assert cache.stats(a)["entradas"] == cache.stats(b)["entradas"] == 0
+
+
+def test_dashboard_no_guarda_una_consulta_fallida(conn, monkeypatch):
+    sembrar(conn, empleados=2, dias=10, desde=date(2024, 1, 1))
+    consultar = dashboard_page.safe_dataframe
+    monkeypatch.setattr(dashboard_page, "safe_dataframe", lambda *a, **k: pd.DataFrame())
+    assert dashboard_page.cargar_cubo(date(2024, 1, 1), date(2024, 1, 10), None)[0] is None
+    monkeypatch.setattr(dashboard_page, "safe_dataframe", consultar)
+    assert dashboard_page.cargar_cubo(date(2024, 1, 1), date(2024, 1, 10), None)[0] is not None
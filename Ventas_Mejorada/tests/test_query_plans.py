@@ -0,0 +1,51 @@
+import importlib
+from datetime import date, timedelta
+
+import pytest
+
+import database
+from conftest import sembrar
+
+# Módulos que registran las consultas de sus páginas
+MODULOS = ["utils", "audit_utils", "calendario", "modules.admin_page", "modules.dashboard_page",
+           "modules.ventas_page", "modules.afiliaciones_page"]
+
+
+@pytest.fixture
+def sembrada(conn):
+    ids = sembrar(conn, empleados=40, dias=400, desde=date(2023, 6, 1))
+    conn.executemany(
+        "INSERT INTO afiliaciones (employee_id, fecha, cantidad) VALUES (?, ?, 2)",
+        [(e, str(date(2023, 6, 1) + timedelta(days=d))) for e in ids for d in range(400)],
+    )
+    conn.executemany(
+        "INSERT INTO audit_log (user_id, username, action, table_name, created_at) VALUES (1, ?, ?, 'sales', ?)",
+        [(f"user{i % 20}", f"Editar ventas {i}", f"2024-{i % 12 + 1:02d}-01 10:00:00") for i in range(5000)],
+    )
+    conn.commit()
+    database.apply_schema_migrations(conn)   # PRAGMA optimize con datos
+    return conn
+
+
+def test_registro_usa_los_constructores_de_las_paginas():
+    for modulo in MODULOS:
+        importlib.import_module(modulo)
+    esperadas = {"ventas_por_empleado_meses", "ventas_por_empleado_dias", "acumulado_ventas",
+                 "auditoria", "auditoria_texto", "ausencias", "dashboard", "historial_ventas",
+                 "afiliaciones_ranking", "afiliaciones_reporte", "reporte_depto"}
+    assert esperadas <= set(database.QUERY_PLAN_CHECKS)
+
+
+def test_ninguna_consulta_recorre_una_tabla_grande(sembrada):
+    for modulo in MODULOS:
+        importlib.import_module(modulo)
+    assert database.check_query_plans() == {}
+
+
+def test_scan_por_indice_completo_se_reporta(sembrada, monkeypatch):
+    monkeypatch.setattr(database, "QUERY_PLAN_CHECKS", {
+        "todas_las_fechas": lambda: ("SELECT employee_id, date FROM sales ORDER BY employee_id, date", ()),
+    })
+    problemas = database.check_query_plans()
+    assert problemas["todas_las_fechas"]
+    assert all(paso.startswith("SCAN") for paso in problemas["todas_las_fechas"])
@@ -0,0 +1,68 @@
+"""Tiendas atendidas por la aplicación y tienda activa de cada hilo.
+
+Cada tienda tiene su propia base SQLite (con sus índices, rollups y
+triggers), su pool de conexiones, sus backups y su archivo de auditoría;
+la caché de consultas es común y separa las entradas por tienda. database.get_connection() enruta a la base de la
+tienda activa del hilo, que ventas.py fija al inicio de cada rerun según la
+sesión; los hilos de fondo recorren las tiendas con `en_tienda()`.
+
+VENTAS_TIENDAS lista las tiendas como "codigo=Nombre;codigo=Nombre". La
+primera es la tienda por defecto y conserva las rutas de siempre
+(ventas.db, backups/, audit_archive/); las demás guardan los suyos en
+VENTAS_TIENDAS_DIR/<codigo>/ con el mismo nombre base.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+TIENDAS_DIR = os.environ.get("VENTAS_TIENDAS_DIR", "tiendas")
+
+
+def _leer_tiendas(texto: str) -> dict:
+    tiendas = {}
+    for parte in texto.split(";"):
+        codigo, _, nombre = parte.partition("=")
+        codigo = codigo.strip().lower()
+        if codigo:
+            tiendas[codigo] = nombre.strip() or codigo.title()
+    return tiendas or {"restrepo": "Locatel Restrepo"}
+
+
+TIENDAS = _leer_tiendas(os.environ.get("VENTAS_TIENDAS", "restrepo=Locatel Restrepo"))
+TIENDA_DEFECTO = next(iter(TIENDAS))
+
+_local = threading.local()
+
+
+def tienda_actual() -> str:
+    return getattr(_local, "codigo", TIENDA_DEFECTO)
+
+
+def usar_tienda(codigo: str = None):
+    """Fija la tienda activa del hilo (None o desconocida = la por defecto)."""
+    _local.codigo = codigo if codigo in TIENDAS else TIENDA_DEFECTO
+
+
+@contextmanager
+def en_tienda(codigo: str):
+    """Ejecuta el bloque con `codigo` como tienda activa y restaura la anterior."""
+    previa = tienda_actual()
+    usar_tienda(codigo)
+    try:
+        yield
+    finally:
+        _local.codigo = previa
+
+
+def nombre_tienda(codigo: str = None) -> str:
+    return TIENDAS.get(codigo or tienda_actual(), codigo)
+
+
+def ruta(nombre: str, codigo: str = None) -> str:
+    """Ruta de un archivo o carpeta de datos para la tienda (por defecto, la activa)."""
+    codigo = codigo or tienda_actual()
+    if codigo == TIENDA_DEFECTO:
+        return nombre
+    carpeta = os.path.join(TIENDAS_DIR, codigo)
+    os.makedirs(carpeta, exist_ok=True)
+    return os.path.join(carpeta, os.path.basename(os.path.normpath(nombre)))
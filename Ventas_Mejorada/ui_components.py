@@ -1,11 +1,46 @@
 """
 Componentes UI modernos para Locatel AIS
 """
+import html
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+
+# ── Plantillas HTML ───────────────────────────────────────────────────
+# Cada st.markdown es un delta independiente por el websocket. Las listas
+# (ranking, métricas, línea de tiempo) se arman con una plantilla ya
+# compilada y un solo "".join, y se envían como un único elemento.
+class Plantilla:
+    """
+    HTML con campos {nombre} al estilo str.format.
+
+    La sangría y los saltos de línea se eliminan una sola vez al crearla:
+    el HTML enviado al navegador no arrastra los espacios del código.
+    """
+    __slots__ = ("_formato",)
+
+    def __init__(self, texto):
+        self._formato = "".join(linea.strip() for linea in texto.strip().splitlines()).format
+
+    def __call__(self, **campos):
+        return self._formato(**campos)
+
+    def lista(self, filas):
+        """Concatena la plantilla aplicada a cada fila (dicts)."""
+        formato = self._formato
+        return "".join([formato(**fila) for fila in filas])
+
+
+def render_html(texto):
+    """Un único elemento markdown con HTML."""
+    st.markdown(texto, unsafe_allow_html=True)
+
+
+def esc(valor):
+    return html.escape(str(valor))
+
 def render_kpi_card(title, value, icon, trend=None, trend_value=None, color="primary"):
     """
     Renderiza una tarjeta KPI moderna
@@ -179,31 +214,48 @@ def create_modern_chart(df, x, y, title, chart_type="line", color=None):
     
     return fig
 
+_METRICA = Plantilla("""
+    <div class="metric-card">
+        <div class="metric-icon">{icon}</div>
+        <div class="metric-value">{value}</div>
+        <div class="metric-label">{title}</div>
+        {trend_html}
+    </div>
+""")
+_TENDENCIA = Plantilla('<div class="kpi-trend {trend_class}">{trend_icon} {trend_value}</div>')
+
+
 def render_metric_grid(metrics):
     """
-    Renderiza una cuadrícula de métricas
+    Renderiza una cuadrícula de métricas (un solo elemento)
     
     Args:
         metrics: Lista de diccionarios con keys: title, value, icon, trend
     """
-    cols = st.columns(len(metrics))
-    
-    for idx, (col, metric) in enumerate(zip(cols, metrics)):
-        with col:
-            trend_html = ""
-            if metric.get('trend'):
-                trend_class = "trend-up" if metric['trend'] == 'up' else "trend-down"
-                trend_icon = "↑" if metric['trend'] == 'up' else "↓"
-                trend_html = f'<div class="kpi-trend {trend_class}">{trend_icon} {metric.get("trend_value", "")}</div>'
-            
-            st.markdown(f"""
-            <div class="metric-card">
-                <div class="metric-icon">{metric['icon']}</div>
-                <div class="metric-value">{metric['value']}</div>
-                <div class="metric-label">{metric['title']}</div>
-                {trend_html}
-            </div>
-            """, unsafe_allow_html=True)
+    filas = []
+    for metric in metrics:
+        trend_html = ""
+        if metric.get('trend'):
+            sube = metric['trend'] == 'up'
+            trend_html = _TENDENCIA(trend_class="trend-up" if sube else "trend-down",
+                                    trend_icon="↑" if sube else "↓",
+                                    trend_value=metric.get("trend_value", ""))
+        filas.append({"icon": metric['icon'], "value": metric['value'],
+                      "title": metric['title'], "trend_html": trend_html})
+    render_html(
+        f'<div style="display:grid;grid-template-columns:repeat({max(len(metrics), 1)},minmax(0,1fr));gap:1rem">'
+        f'{_METRICA.lista(filas)}</div>'
+    )
+
+
+_EVENTO = Plantilla("""
+    <div class="timeline-item">
+        <div style="font-size: 0.75rem; color: var(--gray-500);">{date}</div>
+        <div style="font-weight: 600; margin: 0.25rem 0;">{title}</div>
+        <div style="font-size: 0.875rem; color: var(--gray-600);">{description}</div>
+    </div>
+""")
+
 
 def render_timeline(events):
     """
@@ -212,19 +264,67 @@ def render_timeline(events):
     Args:
         events: Lista de diccionarios con keys: date, title, description
     """
-    timeline_html = '<div class="timeline">'
-    
-    for event in events:
-        timeline_html += f"""
-        <div class="timeline-item">
-            <div style="font-size: 0.75rem; color: var(--gray-500);">{event['date']}</div>
-            <div style="font-weight: 600; margin: 0.25rem 0;">{event['title']}</div>
-            <div style="font-size: 0.875rem; color: var(--gray-600);">{event.get('description', '')}</div>
-        </div>
-        """
+    filas = ({"date": e['date'], "title": e['title'], "description": e.get('description', '')} for e in events)
+    render_html(f'<div class="timeline">{_EVENTO.lista(filas)}</div>')
+
+
+_TARJETA_RANKING = Plantilla("""
+    <div class="rank-card">
+      <div class="rank-medal {rank_class}">{medal}</div>
+      <div class="rank-info">
+        <div class="rank-name">{name}</div>
+        <div class="rank-dept">{dept} · {position} · {dias} días activos</div>
+        <div class="rank-goal"><span>Meta: {goal:,}</span><span>{pct:.1f}%</span></div>
+        <div class="rank-track"><div class="rank-fill" style="width:{bar_w}%;background:{bar_color}"></div></div>
+        {proyeccion}
+      </div>
+      <div class="rank-side">
+        <div class="rank-score">{total:,}</div>
+        <div class="rank-score-label">unidades</div>
+      </div>
+    </div>
+""")
+
+
+_PROYECCION = Plantilla('<div class="rank-dept">📈 Proyección fin de mes: {pronostico:,} ({pct:.0f}%)</div>')
+
+
+def _medalla(pos):
+    return {1: "🥇", 2: "🥈", 3: "🥉"}.get(pos, f"#{pos}")
+
+
+def html_ranking(df):
+    """
+    HTML de las tarjetas del ranking, en el orden del DataFrame
     
-    timeline_html += '</div>'
-    st.markdown(timeline_html, unsafe_allow_html=True)
+    Columnas: name, department, position, goal, total, dias_activos y,
+    opcional, pronostico (proyección a fin de mes de forecast.py)
+    """
+    totales = df["total"].to_numpy()
+    metas = df["goal"].to_numpy()
+    pronosticos = df["pronostico"].to_numpy() if "pronostico" in df else [None] * len(df)
+    filas = []
+    for pos, (name, dept, position, goal, total, dias, pronostico) in enumerate(zip(
+            df["name"], df["department"], df["position"], metas, totales, df["dias_activos"],
+            pronosticos), start=1):
+        pct = round(total / goal * 100, 1) if goal else 0.0
+        proyeccion = "" if pronostico is None else _PROYECCION(
+            pronostico=int(pronostico), pct=(pronostico / goal * 100) if goal else 0.0)
+        filas.append({
+            "proyeccion": proyeccion,
+            "rank_class": f"rank-{pos if pos <= 3 else 'n'}",
+            "medal": _medalla(pos),
+            "name": esc(name), "dept": esc(dept), "position": esc(position),
+            "dias": int(dias), "goal": int(goal), "total": int(total),
+            "pct": pct, "bar_w": min(pct, 100),
+            "bar_color": "#16a34a" if pct >= 100 else "#d97706" if pct >= 70 else "#1a56db",
+        })
+    return _TARJETA_RANKING.lista(filas)
+
+
+def render_ranking_cards(df):
+    """Renderiza todas las tarjetas del ranking como un único elemento"""
+    render_html(html_ranking(df))
 
 def render_stats_table(df, title, columns_config=None):
     """
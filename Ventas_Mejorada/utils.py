@@ -1,8 +1,12 @@
 """Utilidades compartidas: acceso a BD, helpers de UI y constantes."""
+import re
+import threading
 import streamlit as st
 import pandas as pd
-from datetime import date
-from database import get_connection, log_audit
+from datetime import date, timedelta
+from database import get_connection, log_audit, registrar_consulta, AUDIT_INSERT_SQL
+from query_cache import cache as _query_cache, tablas_de
+from tiendas import tienda_actual
 
 # ── Listas de dominio ────────────────────────────────────────────────
 CARGOS = [
@@ -27,21 +31,33 @@ DEPT_COLORS = {
 }
 
 # ── Acceso BD ─────────────────────────────────────────────────────────
-@st.cache_data(ttl=60)
-def safe_dataframe(query: str, params=None) -> pd.DataFrame:
-    """Ejecuta SELECT y devuelve DataFrame (cacheado 60 s)."""
-    try:
-        conn = get_connection()
-        df = pd.read_sql(query, conn, params=list(params) if params else None)
-        conn.close()
-        return df
-    except Exception as e:
-        st.error(f"Error en base de datos: {e}")
-        return pd.DataFrame()
+def safe_dataframe(query: str, params=None, employee_id=None, desde=None, hasta=None) -> pd.DataFrame:
+    """Ejecuta SELECT y devuelve DataFrame (cacheado 60 s).
+
+    La entrada queda etiquetada con las tablas de la consulta y, si se
+    indican, con el empleado y el rango [desde, hasta] que cubre; así una
+    escritura solo invalida los resultados que realmente cambian.
+    """
+    clave = (query, tuple(params) if params else ())
+    df = _query_cache.get(clave)
+    if df is None:
+        try:
+            conn = get_connection()
+            df = pd.read_sql(query, conn, params=list(params) if params else None)
+        except Exception as e:
+            st.error(f"Error en base de datos: {e}")
+            return pd.DataFrame()
+        _query_cache.put(clave, df, tablas_de(query), employee_id, desde, hasta)
+    return df.copy()   # las páginas modifican el DataFrame recibido
+
+
+def invalidar_cache(*tablas, employee_id=None, fecha=None):
+    """Invalida los resultados cacheados que leen de `tablas`."""
+    for tabla in tablas:
+        _query_cache.invalidate(tabla, employee_id, fecha)
 
 
 def execute_query(query: str, params=None):
-    conn = None
     try:
         conn = get_connection()
         cur = conn.cursor()
@@ -50,19 +66,31 @@ def execute_query(query: str, params=None):
     except Exception as e:
         st.error(f"Error en consulta: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
 
-def execute_insert(query: str, params=None, audit_action=None) -> bool:
+_WRITE_TABLE = re.compile(r"^\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|UPDATE|DELETE\s+FROM)\s+(\w+)", re.I)
+
+
+def execute_insert(query: str, params=None, audit_action=None, employee_id=None, fecha=None) -> bool:
+    """Ejecuta una escritura e invalida solo la caché afectada.
+
+    `employee_id` y `fecha` describen las filas que cambian; sin ellos se
+    invalida todo lo que lee de la tabla escrita.
+    """
     conn = None
     try:
         conn = get_connection()
         cur = conn.cursor()
         cur.execute(query, params or [])
         conn.commit()
-        st.cache_data.clear()
+        m = _WRITE_TABLE.match(query)
+        tabla = m.group(1).lower() if m else None
+        if tabla:
+            _query_cache.invalidate(tabla, employee_id, fecha)
+        else:
+            _query_cache.clear()
+        if employee_id is not None:
+            invalidar_acumulado(employee_id, tabla)
 
         # Auditoría opcional
         if audit_action and "user" in st.session_state and st.session_state.user:
@@ -75,9 +103,132 @@ def execute_insert(query: str, params=None, audit_action=None) -> bool:
         if conn:
             conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
+
+
+# ── Acumulado del mes por empleado ────────────────────────────────────
+# Rangos semiabiertos [inicio de mes, inicio del mes siguiente): usan el
+# índice (employee_id, date) como búsqueda por rango, a diferencia de LIKE.
+_ACUMULADO_SQL = {
+    "sales": """SELECT COALESCE(SUM(autoliquidable+oferta+marca+adicional),0)
+                FROM sales WHERE employee_id=? AND date >= ? AND date < ?""",
+    "afiliaciones": """SELECT COALESCE(SUM(cantidad),0)
+                       FROM afiliaciones WHERE employee_id=? AND fecha >= ? AND fecha < ?""",
+}
+_acumulados = {}   # (tienda, tabla, employee_id, 'YYYY-MM') -> total
+_acumulados_lock = threading.Lock()
+# Por tienda, sube con cada escritura o invalidación. Un total calculado
+# fuera del lock solo se guarda si la generación no cambió entretanto: así
+# una lectura lenta no pisa con un valor viejo lo que dejó una escritura.
+_generacion = {}
+
+
+def limites_mes(fecha: date):
+    """(primer día del mes, primer día del mes siguiente) como 'YYYY-MM-DD'."""
+    inicio = fecha.replace(day=1)
+    siguiente = (inicio + timedelta(days=32)).replace(day=1)
+    return inicio.isoformat(), siguiente.isoformat()
+
+
+registrar_consulta("acumulado_ventas",
+                   lambda: (_ACUMULADO_SQL["sales"], (1, *limites_mes(date(2024, 1, 15)))))
+registrar_consulta("acumulado_afiliaciones",
+                   lambda: (_ACUMULADO_SQL["afiliaciones"], (1, *limites_mes(date(2024, 1, 15)))))
+
+
+def acumulado_mes(employee_id: int, fecha: date = None, tabla: str = "sales") -> int:
+    """Total del mes de `fecha` (por defecto hoy) para un empleado.
+
+    `tabla` es "sales" (unidades) o "afiliaciones". El resultado queda en
+    memoria hasta que cambie una fila de ese empleado.
+    """
+    fecha = fecha or date.today()
+    clave = (tienda_actual(), tabla, employee_id, fecha.strftime("%Y-%m"))
+    with _acumulados_lock:
+        if clave in _acumulados:
+            return _acumulados[clave]
+        generacion = _generacion.get(clave[0], 0)
+    res = execute_query(_ACUMULADO_SQL[tabla], (employee_id, *limites_mes(fecha)))
+    total = int(res[0][0] or 0) if res else 0
+    with _acumulados_lock:
+        if _generacion.get(clave[0], 0) == generacion:
+            _acumulados[clave] = total
+    return total
+
+
+def invalidar_acumulado(employee_id: int = None, tabla: str = None):
+    """Descarta los acumulados de la tienda activa de un empleado (todos si es
+    None), de una tabla o de todas."""
+    tienda = tienda_actual()
+    with _acumulados_lock:
+        _generacion[tienda] = _generacion.get(tienda, 0) + 1
+        for clave in [k for k in _acumulados
+                      if k[0] == tienda
+                      and (employee_id is None or k[2] == employee_id)
+                      and (tabla is None or tabla not in _ACUMULADO_SQL or k[1] == tabla)]:
+            del _acumulados[clave]
+
+
+# ── Guardado transaccional ────────────────────────────────────────────
+# Un registro diario es un upsert sobre (employee_id, fecha): no hace falta
+# leer antes para decidir entre INSERT y UPDATE.
+UPSERT_SQL = {
+    "sales": """INSERT INTO sales (employee_id, date, autoliquidable, oferta, marca, adicional)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(employee_id, date) DO UPDATE SET
+                    autoliquidable = excluded.autoliquidable, oferta = excluded.oferta,
+                    marca = excluded.marca, adicional = excluded.adicional,
+                    updated_at = CURRENT_TIMESTAMP""",
+    "afiliaciones": """INSERT INTO afiliaciones (employee_id, fecha, cantidad) VALUES (?, ?, ?)
+                       ON CONFLICT(employee_id, fecha) DO UPDATE SET cantidad = excluded.cantidad""",
+}
+
+
+def _guardar(tabla: str, employee_id: int, fecha: date, valores, audit_action=None):
+    """Upsert, auditoría y acumulado del mes con una conexión y un commit.
+
+    Devuelve el total del mes de `fecha` ya incluyendo lo guardado, o None
+    si la escritura falló (nada queda a medias).
+    """
+    conn = get_connection()
+    u = st.session_state.get("user") if audit_action else None
+    tienda = tienda_actual()
+    with _acumulados_lock:
+        generacion = _generacion.get(tienda, 0)
+    try:
+        conn.execute(UPSERT_SQL[tabla], (employee_id, str(fecha), *valores))
+        if u:
+            conn.execute(AUDIT_INSERT_SQL, (u["id"], u["username"], audit_action, tabla, employee_id, None))
+        total = int(conn.execute(_ACUMULADO_SQL[tabla], (employee_id, *limites_mes(fecha))).fetchone()[0])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Error al guardar: {e}")
+        return None
+
+    _query_cache.invalidate(tabla, employee_id, fecha)
+    if u:
+        _query_cache.invalidate("audit_log")
+    clave = (tienda, tabla, employee_id, fecha.strftime("%Y-%m"))
+    with _acumulados_lock:
+        # Si otro guardado terminó mientras tanto, no se sabe cuál total es
+        # el último: se descarta y la próxima lectura lo recalcula.
+        if _generacion.get(tienda, 0) == generacion:
+            _acumulados[clave] = total
+        else:
+            _acumulados.pop(clave, None)
+        _generacion[tienda] = _generacion.get(tienda, 0) + 1
+    return total
+
+
+def guardar_ventas(employee_id: int, fecha: date, autoliquidable: int, oferta: int,
+                   marca: int, adicional: int, audit_action=None):
+    """Crea o reemplaza las ventas del día; devuelve el acumulado del mes (None si falla)."""
+    return _guardar("sales", employee_id, fecha, (autoliquidable, oferta, marca, adicional), audit_action)
+
+
+def guardar_afiliaciones(employee_id: int, fecha: date, cantidad: int, audit_action=None):
+    """Crea o reemplaza las afiliaciones del día; devuelve el acumulado del mes (None si falla)."""
+    return _guardar("afiliaciones", employee_id, fecha, (cantidad,), audit_action)
 
 
 # ── Empleado helper ───────────────────────────────────────────────────
@@ -90,9 +241,7 @@ def get_employee_info(user_id):
                FROM employees WHERE user_id = ?""",
             (user_id,),
         )
-        emp = cur.fetchone()
-        conn.close()
-        return emp
+        return cur.fetchone()
     except Exception:
         return None
 
@@ -125,8 +274,53 @@ def periodo_a_fecha(periodo: str) -> date:
     return date(2000, 1, 1)
 
 
+# ── Rollups de ventas ─────────────────────────────────────────────────
+def rango_mensual(fecha_inicio: date, fecha_fin: date):
+    """('YYYY-MM', 'YYYY-MM') si el rango cubre meses completos, si no None.
+
+    Un fin igual o posterior a hoy cuenta como fin de mes: no hay ventas futuras.
+    """
+    if fecha_inicio.day != 1 or fecha_fin < fecha_inicio:
+        return None
+    fin_de_mes = (fecha_fin + timedelta(days=1)).day == 1
+    if not fin_de_mes and fecha_fin < date.today():
+        return None
+    return fecha_inicio.strftime("%Y-%m"), fecha_fin.strftime("%Y-%m")
+
+
+def ventas_por_empleado_sql(fecha_inicio: date, fecha_fin: date):
+    """Subconsulta con los totales por empleado del rango y sus parámetros.
+
+    Columnas: employee_id, autoliquidable, oferta, marca, adicional, total, dias.
+    Lee de sales_monthly cuando el rango son meses completos y de sales_daily
+    en caso contrario; nunca recorre la tabla `sales`.
+    """
+    meses = rango_mensual(fecha_inicio, fecha_fin)
+    if meses:
+        return (
+            """SELECT employee_id, SUM(autoliquidable) autoliquidable, SUM(oferta) oferta,
+                      SUM(marca) marca, SUM(adicional) adicional, SUM(total) total, SUM(dias) dias
+               FROM sales_monthly WHERE month BETWEEN ? AND ? GROUP BY employee_id""",
+            list(meses),
+        )
+    return (
+        """SELECT employee_id, SUM(autoliquidable) autoliquidable, SUM(oferta) oferta,
+                  SUM(marca) marca, SUM(adicional) adicional, SUM(total) total, COUNT(*) dias
+           FROM sales_daily WHERE date BETWEEN ? AND ? GROUP BY employee_id""",
+        [str(fecha_inicio), str(fecha_fin)],
+    )
+
+
+registrar_consulta("ventas_por_empleado_meses",
+                   lambda: ventas_por_empleado_sql(date(2024, 1, 1), date(2024, 12, 31)))
+registrar_consulta("ventas_por_empleado_dias",
+                   lambda: ventas_por_empleado_sql(date(2024, 1, 1), date(2024, 1, 7)))
+
+
 # ── Barra de meta con color dinámico ─────────────────────────────────
-def render_progress(actual: int, meta: int, label: str = "Progreso"):
+def render_progress(actual: int, meta: int, label: str = "Progreso", proyectado: int = None):
+    """Barra de avance hacia la meta; `proyectado` (forecast.py) se dibuja
+    como un tramo tenue a continuación, hasta el total esperado a fin de mes."""
     pct = min((actual / meta * 100) if meta > 0 else 0, 100)
     if pct >= 100:
         bar_class = "progress-bar progress-bar-success"
@@ -135,6 +329,14 @@ def render_progress(actual: int, meta: int, label: str = "Progreso"):
     else:
         bar_class = "progress-bar"
 
+    tramo = nota = ""
+    if proyectado is not None and meta > 0:
+        pct_proy = proyectado / meta * 100
+        tramo = f'<div class="progress-forecast" style="width:{max(min(pct_proy, 100) - pct, 0)}%"></div>'
+        icono = "✅" if pct_proy >= 100 else "📈"
+        nota = (f'<div style="font-size:.75rem;color:var(--text-muted);margin-top:2px">'
+                f'{icono} Proyección fin de mes: <strong>{proyectado:,}</strong> ({pct_proy:.0f}% de la meta)</div>')
+
     st.markdown(
         f"""
         <div style="margin:12px 0">
@@ -142,9 +344,9 @@ def render_progress(actual: int, meta: int, label: str = "Progreso"):
             <span style="font-size:.8rem;color:var(--text-muted)">{label}</span>
             <span style="font-size:.8rem;font-weight:600">{actual:,} / {meta:,} ({pct:.1f}%)</span>
           </div>
-          <div class="progress">
-            <div class="{bar_class}" style="width:{pct}%"></div>
-          </div>
+          <div class="progress" style="display:flex">
+            <div class="{bar_class}" style="width:{pct}%"></div>{tramo}
+          </div>{nota}
         </div>
         """,
         unsafe_allow_html=True,
@@ -6,7 +6,9 @@ from database import create_tables, migrate_database, verify_database
 from auth import authenticate, create_user
 from utils import execute_query, execute_insert, get_employee_info
 from keep_alive import init_keep_alive
+from backup_scheduler import init_backup_scheduler
 from backup_manager import render_backup_page
+from tiendas import TIENDAS, usar_tienda, tienda_actual, nombre_tienda
 
 # ── Importar páginas ──────────────────────────────────────────────────
 from modules.dashboard_page      import page_dashboard
@@ -17,7 +19,9 @@ from modules.afiliaciones_page   import (page_registrar_afiliaciones,
                                         page_mis_afiliaciones,
                                         page_admin_afiliaciones)
 from modules.admin_page          import (page_empleados, page_usuarios,
-                                        page_reportes, page_auditoria)
+                                        page_reportes, page_auditoria,
+                                        page_sistema, page_tiendas)
+from modules.importar_page       import page_importar
 
 # Calendario en español
 try:
@@ -126,6 +130,7 @@ h3 {{ font-size: 1.1rem; font-weight: 600; color: var(--text-primary); }}
 .progress-bar-success {{ background: linear-gradient(90deg, var(--success), #22c55e); }}
 .progress-bar-warning {{ background: linear-gradient(90deg, var(--warning), #f59e0b); }}
 .progress-bar-danger  {{ background: linear-gradient(90deg, var(--danger), #f87171); }}
+.progress-forecast {{ height: 100%; background: repeating-linear-gradient(45deg, var(--primary) 0 4px, transparent 4px 8px); opacity: .35; }}
 
 /* ── RANKING ── */
 .rank-card {{ background: var(--surface); border-radius: var(--r-lg); padding: 1rem 1.25rem; display: flex; align-items: center; gap: 1rem; border: 1px solid var(--border); box-shadow: var(--shadow-xs); margin-bottom: .75rem; transition: all .2s; }}
@@ -140,6 +145,10 @@ h3 {{ font-size: 1.1rem; font-weight: 600; color: var(--text-primary); }}
 .rank-dept {{ font-size: .75rem; color: var(--text-muted); margin-top: 2px; }}
 .rank-score {{ font-size: 1.4rem; font-weight: 800; color: var(--primary); letter-spacing: -0.04em; }}
 .rank-score-label {{ font-size: .65rem; color: var(--text-muted); font-weight: 500; text-transform: uppercase; }}
+.rank-goal {{ display: flex; justify-content: space-between; font-size: .72rem; color: var(--text-muted); margin: 6px 0 3px; }}
+.rank-track {{ background: var(--border); border-radius: 999px; height: 6px; overflow: hidden; }}
+.rank-fill {{ height: 100%; border-radius: 999px; }}
+.rank-side {{ text-align: right; flex-shrink: 0; }}
 
 /* ── INPUTS ── */
 .stTextInput > div > div > input,
@@ -249,6 +258,11 @@ label {{ font-size: .8rem !important; font-weight: 600 !important; color: var(--
 
 _load_css()
 
+# ── Tienda activa ─────────────────────────────────────────────────────
+# Todo el rerun (conexiones, caché, backups) trabaja sobre la tienda de la
+# sesión; antes de iniciar sesión, sobre la elegida en el login.
+usar_tienda(st.session_state.get("tienda") or st.session_state.get("tienda_login"))
+
 # ── Inicialización BD ─────────────────────────────────────────────────
 with st.spinner("🔄 Inicializando sistema…"):
     try:
@@ -291,6 +305,9 @@ def show_login():
         st.caption("Sistema de Gestión de Ventas")
         st.divider()
 
+        if len(TIENDAS) > 1:
+            st.selectbox("🏬 Tienda", list(TIENDAS), format_func=TIENDAS.get, key="tienda_login")
+
         with st.form("login_form"):
             username  = st.text_input("👤 Usuario", placeholder="tu.usuario")
             password  = st.text_input("🔑 Contraseña", type="password")
@@ -302,6 +319,7 @@ def show_login():
                 else:
                     user = authenticate(username, password)
                     if user:
+                        st.session_state.tienda = tienda_actual()
                         st.session_state.user = user
                         st.session_state.page = "Dashboard" if user["role"] == "admin" else "Registrar ventas"
                         st.rerun()
@@ -352,7 +370,7 @@ def show_menu():
             f"""
             <div style="text-align:center;padding:1rem 0 .5rem">
               <span style="font-size:2rem">🏥</span>
-              <h3 style="margin:.25rem 0 0;font-size:1rem">Locatel Restrepo</h3>
+              <h3 style="margin:.25rem 0 0;font-size:1rem">{nombre_tienda()}</h3>
             </div>
             <div style="background:var(--surface-2);border-radius:var(--r-md);padding:.75rem 1rem;margin-bottom:1rem;border:1px solid var(--border)">
               <div style="font-weight:600;font-size:.9rem">{user['username']}</div>
@@ -371,13 +389,16 @@ def show_menu():
                 ("Dashboard",          "📊"),
                 ("Ranking",            "🏆"),
                 ("Reportes",           "📈"),
+                *([("Tiendas", "🏬")] if len(TIENDAS) > 1 else []),
                 ("Auditoría",          "🔍"),
             ])
             _seccion("👥 Gestión", [
                 ("Empleados",          "🧑‍💼"),
                 ("Usuarios",           "👤"),
                 ("Admin Afiliaciones", "⚙️"),
+                ("Importar",           "📥"),
                 ("Backups",            "💾"),
+                ("Sistema",            "🖥️"),
             ])
             _seccion("📝 Mis Registros", [
                 ("Registrar ventas",       "📝"),
@@ -422,11 +443,14 @@ PAGES = {
     "Dashboard":             page_dashboard,
     "Ranking":               page_ranking,
     "Reportes":              page_reportes,
+    "Tiendas":               page_tiendas,
     "Auditoría":             page_auditoria,
     "Empleados":             page_empleados,
     "Usuarios":              page_usuarios,
     "Admin Afiliaciones":    page_admin_afiliaciones,
+    "Importar":              page_importar,
     "Backups":               render_backup_page,
+    "Sistema":               page_sistema,
     "Registrar ventas":      page_registrar_ventas,
     "Registrar afiliaciones":page_registrar_afiliaciones,
     "Mi desempeño":          page_mi_desempeno,
@@ -434,7 +458,7 @@ PAGES = {
     "Mi perfil":             page_mi_perfil,
 }
 
-ADMIN_ONLY = {"Empleados","Usuarios","Admin Afiliaciones","Backups","Reportes","Auditoría"}
+ADMIN_ONLY = {"Empleados","Usuarios","Admin Afiliaciones","Importar","Backups","Reportes","Tiendas","Auditoría","Sistema"}
 
 
 # ══════════════════════════════════════════════════════════════════════
@@ -442,6 +466,7 @@ ADMIN_ONLY = {"Empleados","Usuarios","Admin Afiliaciones","Backups","Reportes","
 # ══════════════════════════════════════════════════════════════════════
 def main():
     init_keep_alive()
+    init_backup_scheduler()
 
     if not st.session_state.user:
         show_login()